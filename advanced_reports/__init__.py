@@ -1,5 +1,7 @@
 __version__ = '0.9.24'
 
+default_app_config = 'advanced_reports.apps.AdvancedReportsConfig'
+
 
 REGISTRY = {}
 
@@ -7,6 +9,12 @@ REGISTRY = {}
 def register(advreport):
     REGISTRY[advreport.slug] = advreport
 
+    # Build the report spec right away if possible. When reports are registered while the
+    # app registry is still loading, the spec will be built on the first request instead.
+    from django.apps import apps
+    if apps.ready:
+        advreport.get_spec()
+
 
 def get_report_for_slug(slug):
     return REGISTRY.get(slug, lambda: None)()
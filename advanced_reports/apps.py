@@ -0,0 +1,21 @@
+from __future__ import unicode_literals
+
+from importlib import import_module
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class AdvancedReportsConfig(AppConfig):
+    name = 'advanced_reports'
+    verbose_name = 'Advanced Reports'
+
+    def ready(self):
+        from advanced_reports import REGISTRY
+
+        # Every process, also a worker or a management command that never loads the URLs, has to know the
+        # registered reports, so that its changes invalidate their cached data and materialized rows.
+        for module_name in getattr(settings, 'ADVANCED_REPORTS_MODULES', ()):
+            import_module(module_name)
+        for report_class in list(REGISTRY.values()):
+            report_class.get_spec()
@@ -1,8 +1,12 @@
 from decimal import Decimal
 from django.http import HttpResponse
+from django.http.response import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
 from django.utils.translation import ugettext_lazy as make_proxy
 from django.conf import settings
 
+import hashlib
 import json
 import six
 
@@ -33,6 +37,59 @@ def JSONResponse(obj):
     return HttpResponse(to_json(obj), content_type='application/json;charset=UTF-8')
 
 
+def get_content_digest(content):
+    """
+    A deterministic digest of a (rendered) content, which only changes when the content changes.
+    """
+    if isinstance(content, six.text_type):
+        content = content.encode('utf-8')
+    return hashlib.md5(content).hexdigest()
+
+
+def etag_matches(request, etag):
+    """
+    Whether the ``If-None-Match`` header of a GET or HEAD request matches ``etag``.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return False
+    etags = [e.strip() for e in header.split(',')]
+    return '*' in etags or etag in etags or 'W/' + etag in etags
+
+
+def _set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Clients may keep the response, but must revalidate it on every use.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_response(request, get_response, etag=None, last_modified=None):
+    """
+    Returns the response of ``get_response()`` with an ``ETag``, or an empty 304 response when the client
+    already has it (only for GET and HEAD requests).
+
+    When a cheap ``etag`` is given (e.g. computed from the change generations of models), ``get_response``
+    is not even called for a matching request. Otherwise the ETag is a digest of the content.
+    ``last_modified`` is a timestamp in seconds.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return get_response()
+    if etag is not None and etag_matches(request, etag):
+        return _set_validators(HttpResponseNotModified(), etag, last_modified)
+
+    response = get_response()
+    if response.status_code != 200 or response.streaming:
+        return response
+    if etag is None:
+        etag = '"%s"' % get_content_digest(response.content)
+        if etag_matches(request, etag):
+            return _set_validators(HttpResponseNotModified(), etag, last_modified)
+    return _set_validators(response, etag, last_modified)
+
+
 class ViewRequestParameters(object):
     def __init__(self, request):
         self.GET = request.GET
@@ -6,6 +6,7 @@ from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
+from django.db.models import Count
 from django.db.models.signals import post_save, post_delete
 from django.http import Http404, HttpResponse
 from django.http.response import HttpResponseForbidden
@@ -13,18 +14,17 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.views.decorators.cache import never_cache
 
-from .api_utils import JSONResponse, ViewRequestParameters
+from advanced_reports.counts import ItemCount, approximate_count, capped_count
+from advanced_reports.utils import iter_queryset_chunks
+
+from .api_utils import JSONResponse, ViewRequestParameters, conditional_response, get_content_digest
 from .models import SearchIndex
+from .search import get_search_backend
 from .decorators import staff_member_required
 
-import random
 import six
 
 
-def random_token():
-    return '<!-- random: %d -->' % random.randint(0, 10000000000)
-
-
 def check_permission(request, permission):
     """
     Checks whether the current request has access to the given permission.
@@ -105,7 +105,7 @@ class BackOfficeTab(object):
         return {
             'slug': self.slug,
             'title': self.title,
-            'template': render_to_string(template, context, request=request) + random_token(),
+            'template': render_to_string(template, context, request=request),
             'shadow': self.shadow
         }
 
@@ -194,6 +194,13 @@ class BackOfficeModel(object):
     #: will never display.
     permission = None
 
+    #: The relations to follow with ``select_related`` when instances are loaded
+    #: for search results, e.g. because ``get_title`` or ``serialize`` uses them.
+    search_select_related = ()
+
+    #: The relations to prefetch when instances are loaded for search results.
+    search_prefetch_related = ()
+
     def __init__(self):
         self.children = {}
         self.child_to_accessor = {}
@@ -201,6 +208,17 @@ class BackOfficeModel(object):
         self.parent_to_accessor = {}
         self.search_index_dependencies = {}
 
+    def get_search_queryset(self):
+        """
+        The queryset from which the instances of search results are loaded.
+        """
+        queryset = self.model.objects.all()
+        if self.search_select_related:
+            queryset = queryset.select_related(*self.search_select_related)
+        if self.search_prefetch_related:
+            queryset = queryset.prefetch_related(*self.search_prefetch_related)
+        return queryset
+
     def get_title(self, instance):
         """
         A textual representation of a model instance to be used as a title.
@@ -253,7 +271,7 @@ class BackOfficeModel(object):
             serialized['tabs'] = dict((t.slug, t.get_serialized(request, instance)) \
                                  for t in self.tabs \
                                  if check_permission(request, t.permission) and self.allow_tab(t, request))
-            serialized['header_template'] = self.render_template(request, instance) + random_token()
+            serialized['header_template'] = self.render_template(request, instance)
 
         if children:
             serialized['children'] = self.get_children(request, instance)
@@ -336,23 +354,22 @@ class BackOfficeModel(object):
         return [parent for parent in parents if parent]
 
     def reindex(self, instance, backoffice_instance):
-        index_text = self.search_index(instance)
-        index, created = SearchIndex.objects.get_or_create(backoffice_instance=backoffice_instance,
-                                                           model_slug=self.slug,
-                                                           model_id=instance.pk,
-                                                           defaults={'to_index': index_text})
-        if not created:
-            index.to_index = index_text
-            index.save()
+        self.reindex_many([instance], backoffice_instance)
+
+    def reindex_many(self, instances, backoffice_instance):
+        """
+        Updates the search index of many instances at once. Only the entries
+        whose text changed are written.
+        """
+        texts = dict((instance.pk, self.search_index(instance)) for instance in instances)
+        return SearchIndex.objects.reindex_many(backoffice_instance, self.slug, texts)
 
     def delete_index(self, instance, backoffice_instance):
-        try:
-            index = SearchIndex.objects.get(backoffice_instance=backoffice_instance,
-                                            model_slug=self.slug,
-                                            model_id=instance.pk)
-            index.delete()
-        except ObjectDoesNotExist:
-            pass
+        self.delete_index_many([instance], backoffice_instance)
+
+    def delete_index_many(self, instances, backoffice_instance):
+        SearchIndex.objects.delete_index_many(backoffice_instance, self.slug,
+                                              [instance.pk for instance in instances])
 
     def search_index(self, instance):
         return six.text_type(instance)
@@ -561,50 +578,109 @@ class SearchMixin(object):
     This mixin implements support for searching through BackOfficeModels.
     """
 
-    def serialize_search_result(self, request, index):
+    #: The ``SearchBackend`` instance that finds the matching ``SearchIndex`` entries. By default this is the
+    #: backend of the ``BACKOFFICE_SEARCH_BACKEND`` setting, see ``advanced_reports.backoffice.search``.
+    search_backend = None
+
+    #: Order the search results by relevance, when the search backend supports ranking.
+    rank_search_results = True
+
+    #: Optional. When a search matches more than this number of indices, the
+    #: number of hits of every model is capped or estimated above this number,
+    #: see ``search_count_method``. By default all hits are counted.
+    search_count_limit = None
+
+    #: ``'capped'`` to show the counts above ``search_count_limit`` as e.g.
+    #: "1000+", or ``'estimate'`` to use the estimate of the query planner
+    #: (PostgreSQL only, other databases will use a capped count).
+    search_count_method = 'capped'
+
+    def get_search_backend(self):
+        return self.search_backend or get_search_backend()
+
+    def serialize_search_result(self, request, index, instance=None):
         """
         Transforms a ``SearchIndex`` instance to a serialized ``BackOfficeModel``
-        including metadata.
+        including metadata. ``serialize_search_results`` passes the already
+        loaded ``instance`` of the index; without it, it is looked up.
         """
         bo_model = self.get_model(slug=index.model_slug)
-        if bo_model is None or not check_permission(request, bo_model.permission):
-            return None
-        try:
-            instance = bo_model.model.objects.get(pk=index.model_id)
-        except ObjectDoesNotExist:
+        if bo_model is None or index.model_slug not in self.get_permitted_model_slugs(request):
             return None
+        if instance is None:
+            try:
+                instance = bo_model.model.objects.get(pk=index.model_id)
+            except ObjectDoesNotExist:
+                return None
         serialized = bo_model.get_serialized(request, instance)
         return serialized
 
+    def get_permitted_model_slugs(self, request):
+        """
+        The slugs of the registered ``BackOfficeModel`` implementations the
+        request has permission for. They are only checked once per request.
+        """
+        permitted = request.__dict__.setdefault('_backoffice_permitted_model_slugs', {})
+        if self.name not in permitted:
+            permitted[self.name] = [slug for slug, bo_model in self.slug_to_bo_model.items()
+                                    if check_permission(request, bo_model.permission)]
+        return permitted[self.name]
+
     def count_by_model(self, request, indices):
         """
-        Given an iterable of ``SearchIndex`` instances, return a report of
+        Given a queryset of ``SearchIndex`` instances, return a report of
         counts by ``model_slug``, and their serialized ``BackOfficeModel``
-        metadata.
+        metadata. The counts are computed by the database, for the models
+        the request has permission for.
+
+        When there are more than ``search_count_limit`` indices, the count
+        of every model is capped or estimated (see ``search_count_method``)
+        and marked as approximate.
 
-        :param indices: an iterable of ``SearchIndex`` instances
-        :returns: ``[{'meta': {'slug': 'user', ...}, 'count': 15}, ...]``
+        :param indices: a queryset of ``SearchIndex`` instances
+        :returns: ``[{'meta': {'slug': 'user', ...}, 'count': 15, 'approximate': False}, ...]``
         """
-        model_counts = defaultdict(lambda: 0)
-        for index in indices:
-            model_counts[index.model_slug] += 1
-        model_counts = [[self.get_model(mc[0]), mc[1]] for mc in model_counts.items()]
-        model_counts = [mc for mc in model_counts if mc[0] is not None]
-        model_counts.sort(key=lambda x: x[0].priority)
-        model_counts = [{'meta': mc[0].serialize_meta(request),
-                         'count': mc[1]
-                        } for mc in model_counts if check_permission(request, mc[0].permission)]
-        return model_counts
+        slugs = self.get_permitted_model_slugs(request)
+        indices = indices.filter(model_slug__in=slugs).order_by()
+
+        limit = self.search_count_limit
+        if limit is not None and capped_count(indices, limit).approximate:
+            counts = dict((slug, approximate_count(indices.filter(model_slug=slug), self.search_count_method, limit))
+                          for slug in slugs)
+        else:
+            counts = dict((row['model_slug'], ItemCount(row['count']))
+                          for row in indices.values('model_slug').annotate(count=Count('id')))
+
+        model_counts = [(self.get_model(slug), count) for slug, count in counts.items() if count]
+        model_counts.sort(key=lambda mc: mc[0].priority)
+        return [{'meta': bo_model.serialize_meta(request),
+                 'count': count,
+                 'approximate': count.approximate}
+                for bo_model, count in model_counts]
 
     def serialize_search_results(self, request, indices):
         """
         Transforms ``SearchIndex`` instances to a list of serialized
         ``BackOfficeModel`` including metadata.
         """
-        serialized = (self.serialize_search_result(request, i) \
-                      for i in indices \
-                      if i.model_slug in self.slug_to_bo_model)
-        return [s for s in serialized if s]
+        indices = [i for i in indices if i.model_slug in self.slug_to_bo_model]
+
+        # Load the instances with one query per model.
+        ids_by_slug = defaultdict(list)
+        for index in indices:
+            ids_by_slug[index.model_slug].append(index.model_id)
+        permitted_slugs = self.get_permitted_model_slugs(request)
+        instances = {}
+        for slug, ids in ids_by_slug.items():
+            if slug in permitted_slugs:
+                for pk, instance in self.get_model(slug=slug).get_search_queryset().in_bulk(ids).items():
+                    instances[slug, pk] = instance
+
+        # Serialize them in the order of the indices, leaving out the ones that no longer exist.
+        results = (self.serialize_search_result(request, i, instances[i.model_slug, i.model_id])
+                   for i in indices
+                   if (i.model_slug, i.model_id) in instances)
+        return [result for result in results if result is not None]
 
     def search(self, request, query, filter_on_model_slug=None, page=1, page_size=20, include_counts=True):
         """
@@ -622,7 +698,13 @@ class SearchMixin(object):
         if query == '':
             return ()
 
-        all_indices = SearchIndex.objects.filter(to_index__icontains=query, backoffice_instance=self.name)
+        # Only the indices of permitted models are paginated and counted, so pages are never short.
+        indices = SearchIndex.objects.filter(backoffice_instance=self.name,
+                                             model_slug__in=self.get_permitted_model_slugs(request))
+        backend = self.get_search_backend()
+        all_indices = backend.search(indices, query, rank=self.rank_search_results and backend.supports_ranking)
+        if not all_indices.ordered:
+            all_indices = all_indices.order_by('id')
 
         model_counts = self.count_by_model(request, all_indices) if include_counts else []
 
@@ -638,10 +720,11 @@ class SearchMixin(object):
         }
 
     def reindex_all_models(self):
-        SearchIndex.objects.all().delete()
+        SearchIndex.objects.filter(backoffice_instance=self.name).delete()
         for bo_model in self.slug_to_bo_model.values():
-            for obj in bo_model.model.objects.all():
-                bo_model.reindex(obj, self.name)
+            queryset = bo_model.model.objects.order_by('pk')
+            for chunk in iter_queryset_chunks(queryset, SearchIndex.objects.chunk_size):
+                bo_model.reindex_many(chunk, self.name)
 
     def api_get_search(self, request):
         """
@@ -706,7 +789,9 @@ class BackOfficeView(object):
 
         context = {
             'slug': self.slug,
-            'content': content + random_token(),
+            'content': content,
+            # Lets the frontend skip rendering a view again when its content did not change.
+            'digest': get_content_digest(content),
         }
         if extra_context:
             context.update(extra_context)
@@ -1015,13 +1100,16 @@ class BackOfficeBase(ViewMixin, SearchMixin, ModelMixin):
         if fn is None:
             raise Http404
 
-        response = fn(request)
+        def get_response():
+            response = fn(request)
+
+            if isinstance(response, HttpResponse):
+                return response
 
-        if isinstance(response, HttpResponse):
-            return response
+            msgs = [m.__dict__ for m in messages.get_messages(request)]
+            return JSONResponse({'messages': msgs, 'response_data': response})
 
-        msgs = [m.__dict__ for m in messages.get_messages(request)]
-        return JSONResponse({'messages': msgs, 'response_data': response})
+        return conditional_response(request, get_response)
 
     def handle(self, request):
         raise Http404
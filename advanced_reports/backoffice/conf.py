@@ -2,3 +2,8 @@ from django.conf import settings
 
 
 DB_IS_POSTGRES = 'postgresql' in settings.DATABASES['default'].get('ENGINE', '')
+
+#: The Python path of the ``SearchBackend`` that searches the ``SearchIndex``, see
+#: ``advanced_reports.backoffice.search``.
+SEARCH_BACKEND = getattr(settings, 'BACKOFFICE_SEARCH_BACKEND',
+                         'advanced_reports.backoffice.search.ContainsSearchBackend')
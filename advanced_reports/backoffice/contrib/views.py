@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
 from django.contrib import messages
+from django.db import transaction
+from django.db.models.query import QuerySet
 from django.http.request import QueryDict
 from django.http.response import HttpResponseBase
 from django.shortcuts import redirect
@@ -9,11 +11,20 @@ from django.utils.translation import ugettext as _
 from advanced_reports.backoffice.base import BackOfficeView
 from advanced_reports import get_report_for_slug
 from advanced_reports.defaults import ActionException
+from advanced_reports.jobs import create_job
+from advanced_reports.models import ActionJob
+from advanced_reports.utils import iter_chunks
 from advanced_reports.views import api_list, api_action, api_form
 
 import six
 
 
+def _render_form(action, form):
+    if action.form_template:
+        return render_to_string(action.form_template, {'form': form})
+    return six.text_type(form)
+
+
 class AdvancedReportView(BackOfficeView):
     """
     A BackOffice view that renders an Advanced Report.
@@ -78,10 +89,23 @@ class AdvancedReportView(BackOfficeView):
             post = QueryDict(six.binary_type(data, encoding='utf-8'), encoding='utf-8')
             request.POST = post
 
+        if global_select and advreport.background_actions:
+            response = self._verify_job_action(request, advreport, method)
+            if response is not None:
+                return response
+            job = create_job(request, advreport, method)
+            messages.info(request, _('The action will be executed in the background.'))
+            return {'job': job.to_dict()}
+
         if global_select:
+            # Actions need the live queryset of the items, not the materialized rows.
+            advreport.materialized = False
             items, context = advreport.get_object_list(request)
+            queryset_callable = advreport.get_queryset_action_callable(advreport.find_action(method))
+            if queryset_callable is not None and isinstance(items.queryset, QuerySet):
+                return self.queryset_action(request, advreport, method, items.queryset)
         else:
-            items = [advreport.get_item_for_id(pk) for pk in items]
+            items = advreport.get_items_for_ids(items)
         if hasattr(advreport, '%s_multiple' % method):
             try:
                 action = advreport.find_action(method)
@@ -92,11 +116,7 @@ class AdvancedReportView(BackOfficeView):
                             return {'link_action': {'method': method, 'data': request.POST}}
                         response = getattr(advreport, '%s_multiple' % method)(items, form)
                     else:
-                        if action.form_template:
-                            response_form = render_to_string(action.form_template, {'form': form})
-                        else:
-                            response_form = six.text_type(form)
-                        return {'response_form': response_form}
+                        return {'response_form': _render_form(action, form)}
                 else:
                     response = getattr(advreport, '%s_multiple' % method)(items)
                 if response:
@@ -107,22 +127,27 @@ class AdvancedReportView(BackOfficeView):
             return {'succeeded': {}}
         else:
             succeeded, failed = {}, {}
-            for item in items:
-                try:
-                    action = advreport.find_object_action(item, method)
-                    if action:
-                        if action.is_allowed(request):
-                            result = getattr(advreport, method)(item)
-                            if isinstance(result, HttpResponseBase) and result.status_code == 200:
-                                messages.warning(request, _('This action does not support batch operations.'))
+            # One transaction per chunk of items, and a savepoint per item so that a failing item
+            # does not roll back the others.
+            for chunk in iter_chunks(items, advreport.multiple_action_chunk_size):
+                with transaction.atomic():
+                    for item in chunk:
+                        try:
+                            action = advreport.find_object_action(item, method)
+                            if action:
+                                if action.is_allowed(request):
+                                    with transaction.atomic():
+                                        result = getattr(advreport, method)(item)
+                                    if isinstance(result, HttpResponseBase) and result.status_code == 200:
+                                        messages.warning(request, _('This action does not support batch operations.'))
+                                    else:
+                                        succeeded[advreport.get_item_id(item)] = action.get_success_message()
+                                else:
+                                    failed[advreport.get_item_id(item)] = _('You are not allowed to execute this action.')
                             else:
-                                succeeded[advreport.get_item_id(item)] = action.get_success_message()
-                        else:
-                            failed[advreport.get_item_id(item)] = _('You are not allowed to execute this action.')
-                    else:
-                        failed[advreport.get_item_id(item)] = _('This action is not applicable to this item.')
-                except ActionException as e:
-                    failed[advreport.get_item_id(item)] = e.msg
+                                failed[advreport.get_item_id(item)] = _('This action is not applicable to this item.')
+                        except ActionException as e:
+                            failed[advreport.get_item_id(item)] = e.msg
             if succeeded and not failed:
                 messages.success(request, _('Successfully executed action on all selected items.'))
             elif succeeded and failed:
@@ -131,6 +156,93 @@ class AdvancedReportView(BackOfficeView):
                 messages.error(request, _('No action on the selected items was successful.'))
             return {'succeeded': succeeded, 'failed': failed}
 
+    def multiple_action_job(self, request):
+        """
+        Queues a multiple action as a background job. Takes the same parameters as ``multiple_action``.
+        """
+        report_slug = request.view_params.get('slug')
+        method = request.action_params.get('report_method')
+        global_select = request.action_params.get('global')
+        advreport = get_report_for_slug(report_slug)
+        advreport.set_request(request)
+
+        data = request.action_params.get('data')
+        if data:
+            request.POST = QueryDict(six.binary_type(data, encoding='utf-8'), encoding='utf-8')
+
+        response = self._verify_job_action(request, advreport, method)
+        if response is not None:
+            return response
+
+        item_ids = None if global_select else request.action_params.get('items').split(',')
+        job = create_job(request, advreport, method, item_ids=item_ids)
+        return {'job': job.to_dict()}
+
+    def _verify_job_action(self, request, advreport, method):
+        """
+        Checks an action before it is queued as a job, so that a job only fails in the worker because of its items.
+        Returns the response to an action that can't be queued, or None.
+        """
+        action = advreport.find_action(method)
+        if action is None or not action.is_allowed(request):
+            messages.error(request, _('You are not allowed to execute this action.'))
+            return {}
+        if action.form:
+            form = action.instantiate_form(advreport, 'actionform', data=request.POST)
+            if not form.is_valid():
+                return {'response_form': _render_form(action, form)}
+        return None
+
+    def job_status(self, request):
+        """
+        Returns the progress of a background job, see ``ActionJob.to_dict``.
+        """
+        jobs = ActionJob.objects.filter(report_slug=request.view_params.get('slug'))
+        if not request.user.is_superuser:
+            jobs = jobs.filter(user=request.user)
+        try:
+            job = jobs.get(pk=request.action_params.get('job'))
+        except (ActionJob.DoesNotExist, ValueError):
+            return {}
+        return {'job': job.to_dict()}
+
+    def queryset_action(self, request, advreport, method, queryset):
+        """
+        Executes ``FOO_queryset`` once on the queryset of all the filtered items of a report.
+        """
+        action = advreport.find_action(method)
+        queryset_callable = advreport.get_queryset_action_callable(action)
+        if queryset_callable is None or not action.is_allowed(request):
+            messages.error(request, _('You are not allowed to execute this action.'))
+            return {'succeeded': {}}
+
+        args = [advreport.filter_action_queryset(queryset.order_by(), action)]
+        if action.form:
+            form = action.instantiate_form(advreport, 'actionform', data=request.POST)
+            if not form.is_valid():
+                return {'response_form': _render_form(action, form)}
+            if action.is_regular_view and request.is_ajax():
+                return {'link_action': {'method': method, 'data': request.POST}}
+            args.append(form)
+
+        try:
+            with transaction.atomic():
+                response = queryset_callable(*args)
+        except ActionException as e:
+            messages.error(request, e.msg)
+            return {'succeeded': {}}
+        finally:
+            # The changes of a queryset don't send signals.
+            advreport.invalidate_cache()
+
+        if response is not None and not isinstance(response, six.integer_types):
+            return response
+        if response is None:
+            messages.success(request, _('Successfully executed action on all selected items.'))
+        else:
+            messages.success(request, _('Successfully executed action on %(count)d items.') % {'count': response})
+        return {'succeeded': {}}
+
     def multiple_action_view(self, request):
         report_slug = request.view_params.get('slug')
         method = request.view_params.get('report_method')
@@ -142,7 +254,7 @@ class AdvancedReportView(BackOfficeView):
         if global_select == 'true':
             items = advreport.get_object_list(request)[0]
         else:
-            items = [advreport.get_item_for_id(pk) for pk in items]
+            items = advreport.get_items_for_ids(items)
 
         items = [item for item in items if advreport.find_object_action(item, method)]
         if items:
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def install_search_backends(apps, schema_editor):
+    from advanced_reports.backoffice.search import BUILTIN_BACKENDS
+
+    connection = schema_editor.connection
+    for backend_class in BUILTIN_BACKENDS:
+        if backend_class.vendor == connection.vendor:
+            backend_class().install(connection)
+
+
+def uninstall_search_backends(apps, schema_editor):
+    from advanced_reports.backoffice.search import BUILTIN_BACKENDS
+
+    connection = schema_editor.connection
+    for backend_class in BUILTIN_BACKENDS:
+        if backend_class.vendor == connection.vendor:
+            backend_class().uninstall(connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_backends, uninstall_search_backends),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0002_search_backends'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='searchindex',
+            index_together=set([('backoffice_instance', 'model_slug')]),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    SearchIndex = apps.get_model('backoffice', 'SearchIndex')
+    duplicates = SearchIndex.objects.values('backoffice_instance', 'model_slug', 'model_id') \
+        .annotate(count=Count('id'), keep=Min('id')) \
+        .filter(count__gt=1)
+    for duplicate in duplicates:
+        SearchIndex.objects.filter(backoffice_instance=duplicate['backoffice_instance'],
+                                   model_slug=duplicate['model_slug'],
+                                   model_id=duplicate['model_id']).exclude(id=duplicate['keep']).delete()
+
+
+def reinstall_sqlite_search(apps, schema_editor):
+    # SQLite remakes the table to alter it, which drops the triggers of the FTS5 search backend.
+    from advanced_reports.backoffice.search import SQLiteFTS5SearchBackend
+
+    connection = schema_editor.connection
+    if connection.vendor == SQLiteFTS5SearchBackend.vendor:
+        backend = SQLiteFTS5SearchBackend()
+        backend.uninstall(connection)
+        backend.install(connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backoffice', '0003_searchindex_index_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, reinstall_sqlite_search),
+        migrations.AddField(
+            model_name='searchindex',
+            name='digest',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchindex',
+            unique_together=set([('backoffice_instance', 'model_slug', 'model_id')]),
+        ),
+        migrations.RunPython(reinstall_sqlite_search, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,73 @@
+import hashlib
+
 import six
-from django.db import models
+from django.db import IntegrityError, models, transaction
+
+from advanced_reports.caching import models_changed
+from advanced_reports.utils import iter_chunks
+
+
+def get_digest(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+class SearchIndexManager(models.Manager):
+    #: The number of model ids that are looked up with one query.
+    chunk_size = 500
+
+    def reindex_many(self, backoffice_instance, model_slug, texts):
+        """
+        Creates or updates the index entries of many objects of a model at once.
+        Entries whose text did not change (according to their digest) are not
+        written.
+
+        :param texts: a dict mapping model ids to the text to index.
+        :return: the number of entries that were created or updated.
+        """
+        count = 0
+        for model_ids in iter_chunks(list(texts), self.chunk_size):
+            digests = dict((model_id, get_digest(texts[model_id])) for model_id in model_ids)
+            existing = self.filter(backoffice_instance=backoffice_instance,
+                                   model_slug=model_slug,
+                                   model_id__in=model_ids).values_list('model_id', 'pk', 'digest')
+            existing = dict((model_id, (pk, digest)) for model_id, pk, digest in existing)
+
+            changed = [(pk, model_id) for model_id, (pk, digest) in existing.items() if digest != digests[model_id]]
+            new_indices = [self.model(backoffice_instance=backoffice_instance,
+                                      model_slug=model_slug,
+                                      model_id=model_id,
+                                      to_index=texts[model_id],
+                                      digest=digests[model_id])
+                           for model_id in model_ids if model_id not in existing]
+            if not changed and not new_indices:
+                continue
+
+            with transaction.atomic():
+                for pk, model_id in changed:
+                    self.filter(pk=pk).update(to_index=texts[model_id], digest=digests[model_id])
+                try:
+                    with transaction.atomic():
+                        self.bulk_create(new_indices)
+                except IntegrityError:
+                    # Someone else created some of them in the meantime.
+                    for index in new_indices:
+                        self.update_or_create(backoffice_instance=backoffice_instance,
+                                              model_slug=model_slug,
+                                              model_id=index.model_id,
+                                              defaults={'to_index': index.to_index, 'digest': index.digest})
+            count += len(changed) + len(new_indices)
+        if count:
+            models_changed([self.model])
+        return count
+
+    def delete_index_many(self, backoffice_instance, model_slug, model_ids):
+        """
+        Deletes the index entries of many objects of a model at once.
+        """
+        for chunk in iter_chunks(list(model_ids), self.chunk_size):
+            self.filter(backoffice_instance=backoffice_instance,
+                        model_slug=model_slug,
+                        model_id__in=chunk).delete()
 
 
 @six.python_2_unicode_compatible
@@ -8,10 +76,16 @@ class SearchIndex(models.Model):
     model_slug = models.CharField(max_length=32)
     model_id = models.PositiveIntegerField()
     to_index = models.TextField(blank=True)
+    #: The MD5 digest of ``to_index``, so that unchanged texts are not written again.
+    digest = models.CharField(max_length=32, blank=True)
+
+    objects = SearchIndexManager()
 
     class Meta:
         verbose_name = u'search index entry'
         verbose_name_plural = u'search index entries'
+        unique_together = (('backoffice_instance', 'model_slug', 'model_id'),)
+        index_together = (('backoffice_instance', 'model_slug'),)
 
     def __str__(self):
         return u'%s/%s/%d' % (self.backoffice_instance, self.model_slug, self.model_id)
@@ -1,4 +1,189 @@
+from __future__ import unicode_literals
+
+import re
+
+from django.db import DatabaseError, connections
+from django.utils.module_loading import import_string
+
+from advanced_reports.backoffice import conf
+from advanced_reports.backoffice.models import SearchIndex
+
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_query_words(query):
+    """
+    The words of a search query, without any characters that have a meaning in a full-text query.
+    """
+    return _WORD_RE.findall(query)
+
+
 def convert_to_raw_tsquery(query):
-    words = query.split()
+    words = get_query_words(query)
     prefixed_words = (u'%s:*' % word for word in words)
     return u' & '.join(prefixed_words)
+
+
+def convert_to_fts5_query(query):
+    words = get_query_words(query)
+    prefixed_words = (u'"%s"*' % word for word in words)
+    return u' AND '.join(prefixed_words)
+
+
+def _column(connection, column):
+    qn = connection.ops.quote_name
+    return '%s.%s' % (qn(SearchIndex._meta.db_table), qn(column))
+
+
+class SearchBackend(object):
+    """
+    Finds the ``SearchIndex`` entries that match a search query. The backend of a backoffice is chosen with the
+    ``BACKOFFICE_SEARCH_BACKEND`` setting, which is the Python path of a ``SearchBackend`` subclass.
+    """
+
+    #: The database vendor (``connection.vendor``) this backend works on, or None when it works on any database.
+    vendor = None
+
+    #: Whether this backend can order the matching entries by relevance.
+    supports_ranking = False
+
+    def search(self, queryset, query, rank=False):
+        """
+        Filters a ``SearchIndex`` queryset on the entries matching ``query``. When ``rank`` is True and the
+        backend ``supports_ranking``, the entries are ordered by relevance.
+        """
+        raise NotImplementedError
+
+    def install(self, connection):
+        """
+        Creates the database structures this backend needs, like a full-text index. This is done by the
+        migrations of the backoffice for every backend of the vendor of the database.
+        """
+        pass
+
+    def uninstall(self, connection):
+        pass
+
+
+class ContainsSearchBackend(SearchBackend):
+    """
+    Finds the entries containing the query, case insensitively. This works on any database, but scans
+    the whole index.
+    """
+
+    def search(self, queryset, query, rank=False):
+        return queryset.filter(to_index__icontains=query)
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    Finds the entries containing words starting with every word of the query, using the ``tsvector`` of the
+    entries in a GIN index.
+    """
+    vendor = 'postgresql'
+    supports_ranking = True
+
+    #: The text search configuration. The GIN index is created for this configuration, so a migration
+    #: is needed when it is changed.
+    config = 'simple'
+
+    index_name = 'backoffice_searchindex_to_index_fts'
+
+    def get_document(self, connection):
+        return "to_tsvector('%s', %s)" % (self.config, _column(connection, 'to_index'))
+
+    def search(self, queryset, query, rank=False):
+        tsquery = convert_to_raw_tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        document = self.get_document(connections[queryset.db])
+        condition = "to_tsquery('%s', %%s)" % self.config
+        queryset = queryset.extra(where=['%s @@ %s' % (document, condition)], params=[tsquery])
+        if rank:
+            queryset = queryset.extra(select={'search_rank': 'ts_rank(%s, %s)' % (document, condition)},
+                                      select_params=[tsquery],
+                                      order_by=['-search_rank', 'id'])
+        return queryset
+
+    def install(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE INDEX %s ON %s USING gin (%s)' % (
+                self.index_name, connection.ops.quote_name(SearchIndex._meta.db_table),
+                "to_tsvector('%s', to_index)" % self.config))
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS %s' % self.index_name)
+
+
+class SQLiteFTS5SearchBackend(SearchBackend):
+    """
+    Finds the entries containing words starting with every word of the query, using an FTS5 virtual table
+    that is kept up to date by triggers on the index. Requires SQLite with the FTS5 extension.
+    """
+    vendor = 'sqlite'
+    supports_ranking = True
+
+    table = 'backoffice_searchindex_fts'
+
+    def search(self, queryset, query, rank=False):
+        fts_query = convert_to_fts5_query(query)
+        if not fts_query:
+            return queryset.none()
+        connection = connections[queryset.db]
+        if rank:
+            # The FTS table is joined once, so the rank of every entry comes with the match.
+            # The FTS5 rank is the negated bm25 score: lower is more relevant.
+            return queryset.extra(select={'search_rank': '%s.rank' % self.table},
+                                  tables=[self.table],
+                                  where=['%s.rowid = %s' % (self.table, _column(connection, 'id')),
+                                         '%s MATCH %%s' % self.table],
+                                  params=[fts_query],
+                                  order_by=['search_rank', 'id'])
+        matches = 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (self.table, self.table)
+        return queryset.extra(where=['%s IN (%s)' % (_column(connection, 'id'), matches)], params=[fts_query])
+
+    def install(self, connection):
+        table = SearchIndex._meta.db_table
+        statements = [
+            "CREATE VIRTUAL TABLE {fts} USING fts5(to_index, content='{table}', content_rowid='id')",
+            "CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+            "INSERT INTO {fts}(rowid, to_index) VALUES (new.id, new.to_index); END",
+            "CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+            "INSERT INTO {fts}({fts}, rowid, to_index) VALUES ('delete', old.id, old.to_index); END",
+            "CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} BEGIN "
+            "INSERT INTO {fts}({fts}, rowid, to_index) VALUES ('delete', old.id, old.to_index); "
+            "INSERT INTO {fts}(rowid, to_index) VALUES (new.id, new.to_index); END",
+            "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(statements[0].format(fts=self.table, table=table))
+            except DatabaseError:
+                # This SQLite has no FTS5, this backend can't be used.
+                return
+            for statement in statements[1:]:
+                cursor.execute(statement.format(fts=self.table, table=table))
+
+    def uninstall(self, connection):
+        with connection.cursor() as cursor:
+            for trigger in ('insert', 'delete', 'update'):
+                cursor.execute('DROP TRIGGER IF EXISTS %s_%s' % (self.table, trigger))
+            cursor.execute('DROP TABLE IF EXISTS %s' % self.table)
+
+
+#: The backends whose database structures are created by the migrations.
+BUILTIN_BACKENDS = (ContainsSearchBackend, PostgresSearchBackend, SQLiteFTS5SearchBackend)
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Returns an instance of the ``SearchBackend`` of the ``BACKOFFICE_SEARCH_BACKEND`` setting.
+    """
+    global _backend
+    if _backend is None:
+        _backend = import_string(conf.SEARCH_BACKEND)()
+    return _backend
@@ -0,0 +1,124 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.translation import get_language
+
+import six
+
+
+#: The cache aliases holding the change generation of every model that cached reports depend on.
+_watched_models = {}
+
+
+def get_generation_key(model):
+    model = model._meta.concrete_model
+    return 'advreport-generation:%s.%s' % (model._meta.app_label, model._meta.model_name)
+
+
+def _new_generation():
+    return int(time.time() * 1000000)
+
+
+def get_generation_timestamp(generation):
+    """
+    The time (in seconds since the epoch) at which a generation started.
+    """
+    return generation / 1000000.0
+
+
+def get_generations(models, cache_alias='default'):
+    """
+    Returns the change generations of the given models. A generation changes whenever an instance of
+    the model is saved or deleted, as long as the model is watched (see ``watch_models``).
+    """
+    cache = caches[cache_alias]
+    keys = [get_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Start a new generation, unique enough to never match one that was evicted from the cache.
+            cache.add(key, _new_generation(), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model, cache_alias='default'):
+    # A new generation is the time of the change, so it can also be used for Last-Modified headers.
+    cache = caches[cache_alias]
+    key = get_generation_key(model)
+    generation = _new_generation()
+    previous = cache.get(key)
+    if previous is not None and previous >= generation:
+        generation = previous + 1
+    cache.set(key, generation, None)
+
+
+def watch_models(models, cache_alias='default'):
+    """
+    Bumps the generation of the given models in the cache ``cache_alias`` whenever one of their instances
+    is saved or deleted, or one of their many-to-many relations changes.
+
+    This only works in the processes that watch the models, so the models of the registered reports are
+    watched when the app is ready, see ``AdvancedReportsConfig``.
+    """
+    for model in models:
+        _watched_models.setdefault(model._meta.concrete_model, set()).add(cache_alias)
+
+
+def models_changed(models):
+    """
+    Bumps the generations of the given models, for changes that don't send signals, like ``QuerySet.update()``
+    or ``bulk_create()``. Models that are not watched are ignored.
+    """
+    for model in models:
+        _model_changed(model)
+
+
+def _model_changed(sender, **kwargs):
+    for cache_alias in _watched_models.get(sender._meta.concrete_model, ()):
+        bump_generation(sender, cache_alias)
+
+
+def _m2m_changed(sender, instance, action, model, **kwargs):
+    if action.startswith('post_'):
+        models_changed([sender, type(instance), model])
+
+
+post_save.connect(_model_changed, dispatch_uid='advreport-model-saved')
+post_delete.connect(_model_changed, dispatch_uid='advreport-model-deleted')
+m2m_changed.connect(_m2m_changed, dispatch_uid='advreport-m2m-changed')
+
+
+def get_request_parameters(request):
+    """
+    Returns all the GET parameters of the request, in a normalized order.
+    """
+    return tuple(sorted((k, tuple(sorted(request.GET.getlist(k)))) for k in request.GET.keys()))
+
+
+def get_response_cache_key(slug, request, fingerprint, generations, extra=()):
+    """
+    The cache key for a response of a report, given its GET parameters, the permission ``fingerprint``
+    of the user, the generations of the models the report depends on and the active language.
+    """
+    data = json.dumps([get_request_parameters(request), fingerprint, generations, get_language(), list(extra)],
+                      default=six.text_type)
+    return 'advreport-response:%s:%s' % (slug, hashlib.md5(data.encode('utf-8')).hexdigest())
+
+
+def cached_response(key, compute, timeout, cache_alias='default'):
+    """
+    Returns the response data from the cache, or computes it using ``compute`` and caches it
+    for ``timeout`` seconds.
+    """
+    cache = caches[cache_alias]
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout)
+    return data
@@ -0,0 +1,121 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import time
+
+from django.core.cache import caches
+from django.db import connections
+
+import six
+
+
+#: GET parameters that do not influence the number of items of a report.
+NON_FILTER_PARAMETERS = ('page', 'cursor', 'row_limit', 'order')
+
+
+class ItemCount(int):
+    """
+    The number of items of a report. When ``approximate`` is True, this number is either a
+    lower bound (a capped count) or an estimate of the query planner.
+    """
+
+    def __new__(cls, value, approximate=False):
+        count = super(ItemCount, cls).__new__(cls, value)
+        count.approximate = approximate
+        return count
+
+    def __str__(self):
+        if self.approximate:
+            return '%d+' % self
+        return '%d' % self
+
+    __unicode__ = __str__
+
+
+def get_filter_parameters(request):
+    """
+    Returns the GET parameters of the request that filter a report, in a normalized order.
+    """
+    if request is None:
+        return ()
+    return tuple(sorted((k, tuple(sorted(request.GET.getlist(k))))
+                        for k in request.GET.keys()
+                        if k not in NON_FILTER_PARAMETERS))
+
+
+def get_count_cache_key(slug, request, kind='list', fingerprint=None):
+    """
+    The cache key for a count of a report, given its filter parameters and the ``fingerprint`` of the user
+    whose queryset was counted. ``kind`` distinguishes between counts of differently filtered querysets
+    for the same parameters.
+    """
+    params = json.dumps([get_filter_parameters(request), fingerprint], default=six.text_type)
+    return 'advreport-count:%s:%s:%s' % (slug, kind, hashlib.md5(params.encode('utf-8')).hexdigest())
+
+
+def capped_count(queryset, limit):
+    """
+    Counts at most ``limit`` items. The database stops scanning when ``limit + 1`` rows were found.
+    """
+    count = queryset[:limit + 1].count()
+    if count > limit:
+        return ItemCount(limit, approximate=True)
+    return ItemCount(count)
+
+
+def estimated_count(queryset):
+    """
+    Returns the number of rows the PostgreSQL query planner expects ``queryset`` to return,
+    or None when the database can not estimate it.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) %s' % sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, six.string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def approximate_count(queryset, method, limit):
+    """
+    Counts ``queryset`` exactly when it has at most ``limit`` items. Larger querysets are capped at
+    ``limit`` when ``method`` is ``'capped'``, or estimated by the query planner when it is ``'estimate'``.
+    """
+    count = capped_count(queryset, limit)
+    if not count.approximate or method != 'estimate':
+        return count
+    estimate = estimated_count(queryset)
+    if estimate is None or estimate <= limit:
+        return count
+    return ItemCount(estimate, approximate=True)
+
+
+def cached_count(key, compute, timeout, stale_timeout=0, cache_alias='default'):
+    """
+    Returns a count from the cache, or computes it using ``compute`` and caches it for ``timeout`` seconds.
+
+    When ``stale_timeout`` is given, an expired count is still served during that many seconds while a
+    single request recomputes it (stale-while-revalidate).
+    """
+    cache = caches[cache_alias]
+    cached = cache.get(key)
+    now = time.time()
+
+    if cached is not None:
+        value, approximate, computed_at = cached
+        age = now - computed_at
+        if age < timeout:
+            return ItemCount(value, approximate)
+        # Someone else is already revalidating this count, so serve the stale one.
+        if age < timeout + stale_timeout and not cache.add('%s:lock' % key, True, 30):
+            return ItemCount(value, approximate)
+
+    count = compute()
+    cache.set(key, (int(count), getattr(count, 'approximate', False), now), timeout + stale_timeout)
+    cache.delete('%s:lock' % key)
+    return ItemCount(count, getattr(count, 'approximate', False))
@@ -11,11 +11,13 @@ from django.contrib import admin, messages
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, FieldDoesNotExist
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.db.models import Q
 from django.db.models.query import QuerySet
 from django.http.response import Http404
 from django.template.defaultfilters import capfirst
 from django.template.loader import render_to_string
+from django.utils.functional import cached_property
 from django.utils.http import urlencode
 from django.utils.safestring import mark_safe
 from django.utils.html import strip_tags, escape
@@ -25,6 +27,17 @@ from django.forms.models import fields_for_model
 import six
 
 from advanced_reports.backoffice.base import AutoSlug
+from advanced_reports.caching import (get_generation_timestamp, get_generations, get_response_cache_key,
+                                      models_changed, watch_models)
+from advanced_reports.counts import ItemCount, approximate_count, cached_count, get_count_cache_key
+from advanced_reports.export import export_response, get_available_formats
+from advanced_reports.facets import get_facet_buckets, get_value_counts
+from advanced_reports.rows import RowFactory
+from advanced_reports.snapshots import SNAPSHOT_PARAMETERS, get_snapshot_fingerprint, open_snapshot
+from advanced_reports.spec import (ColumnSpec, ReportSpec, get_only_fields, get_order_field, get_select_related,
+                                   get_value_getter, get_value_lookups, lookup_model_field)
+from advanced_reports.texts import format_text
+from advanced_reports.utils import iter_chunks, iter_queryset_chunks
 
 
 class ActionType(object):
@@ -134,6 +147,13 @@ class Action(object):
     #: action. If not, it will just loop through your items and execute your action on each item one after another.
     multiple_display: bool = True
 
+    #: Whether the report implements ``def FOO_queryset(self, queryset, form=None):`` for this action. It is
+    #: called once with the queryset of all the (filtered) items of the report when all items are selected,
+    #: instead of ``FOO_multiple`` or ``FOO``. The queryset is not evaluated, so it can be changed in one
+    #: statement with ``update()`` or ``delete()``. It may return a HttpResponse object, the number of changed
+    #: items or None. See also ``AdvancedReport.filter_action_queryset``.
+    queryset: bool = False
+
     #: If the form of the action has a file upload, set this to True. Then the enctype="multipart/form-data"
     #: will be added to the ``<form>`` tag.
     has_file_upload: bool = False
@@ -196,14 +216,10 @@ class Action(object):
                 )
 
         if instance:
-            context = {'item': instance}
-            context.update(instance.__dict__)
-            if new_action.confirm:
-                new_action.confirm = new_action.confirm % Resolver(context)
-            if new_action.success:
-                new_action.success = new_action.success % Resolver(context)
-            if new_action.verbose_name:
-                new_action.verbose_name = new_action.verbose_name % Resolver(context)
+            version = advreport.get_item_version(instance)
+            new_action.confirm = format_text(new_action.confirm, instance, version)
+            new_action.success = format_text(new_action.success, instance, version)
+            new_action.verbose_name = format_text(new_action.verbose_name, instance, version)
 
         return new_action
 
@@ -242,6 +258,16 @@ class Action(object):
                                     request=request)
         return six.text_type(form)
 
+    def has_shared_form(self, advreport):
+        """
+        Whether the form of this action is the same for every item, so it can be rendered once per page
+        with ``SHARED_FORM_PREFIX`` as its prefix.
+        """
+        return self.form_is_simple and not self.form_template and \
+            not hasattr(advreport, 'get_{}_form'.format(self.method))
+
+    def render_shared_form(self, advreport, request):
+        return self.render_form(request, None, self.instantiate_form(advreport, SHARED_FORM_PREFIX))
 
     @property
     def form_is_simple(self):
@@ -304,6 +330,67 @@ class Action(object):
         return decorator
 
 
+#: The prefix of forms that are rendered once and shared by all items. The frontend replaces it with
+#: the id of the item, like Django does for the ``empty_form`` of a formset.
+SHARED_FORM_PREFIX = '__prefix__'
+
+
+class BoundAction(object):
+    """
+    An action of one item, as returned by ``AdvancedReport.get_object_actions``. The form and the texts
+    resolved with the item are only computed when they are used, so listing actions stays cheap.
+    All other attributes are those of the ``action``.
+    """
+
+    def __init__(self, action, advreport, item):
+        self.action = action
+        self.advreport = advreport
+        self.item = item
+
+    def __getattr__(self, name):
+        return getattr(self.action, name)
+
+    @cached_property
+    def instance(self):
+        return self.action.form_instance(self.item) if self.action.form_instance else self.item
+
+    @cached_property
+    def form(self):
+        if self.action.form_via_ajax and not self.action.prefetch_ajax_form:
+            # The form is fetched with an Ajax call when it is needed.
+            return self.action.form
+        prefix = self.advreport.get_item_id(self.item)
+        return self.action.instantiate_form(self.advreport, prefix, instance=self.instance)
+
+    @cached_property
+    def response_form_template(self):
+        if self.form is None or not self.action.form_template:
+            return None
+        return mark_safe(render_to_string(self.action.form_template, {'form': self.form, 'item': self.instance}))
+
+    @cached_property
+    def version(self):
+        return self.advreport.get_item_version(self.item)
+
+    def _resolve(self, text):
+        return format_text(text, self.item, self.version)
+
+    @cached_property
+    def confirm(self):
+        return self._resolve(self.action.confirm)
+
+    @cached_property
+    def success(self):
+        return self._resolve(self.action.success)
+
+    @cached_property
+    def verbose_name(self):
+        return self._resolve(self.action.verbose_name)
+
+    get_success_message = Action.get_success_message
+    render_form = Action.render_form
+
+
 class ActionException(BaseException):
     def __init__(self, msg=None, form=None):
         if form is not None:
@@ -356,6 +443,21 @@ class AdvancedReport(object):
     #: Optional. A mapping of filter fields to their list of values.
     filter_values = {}
 
+    #: Optional. When True, the JSON API includes the distinct values and their number of items of the
+    #: ``filter_fields`` and ``value_selection_filter_fields`` as ``facets``, and the number of items for
+    #: each tab of the ``tabbed_filter_fields`` as ``tab_counts``. These are computed by the database.
+    facets = False
+
+    #: Optional. A mapping of field names to Django ORM expressions (``F``, ``Concat``, ``Case``/``When``,
+    #: ``Subquery``, aggregates, ...). The queryset of the report is annotated with these expressions,
+    #: so these fields can be used in ``fields``, and searching, sorting, ``filter_fields`` and ``date_range``
+    #: on them happen in the database. Example::
+    #:
+    #:     computed_fields = {
+    #:         'full_name': Concat('first_name', Value(' '), 'last_name'),
+    #:     }
+    computed_fields = {}
+
     #: Deprecated. A tuple of available actions for your report. Please use the actions as a decorator instead.
     item_actions = ()
 
@@ -461,57 +563,164 @@ class AdvancedReport(object):
     #: Shows an optional row limit selection box
     show_row_limit_selection = False
 
-    def __init__(self, *args, **kwargs):
-        self.model_admin = None
-
-        # Expand some shortcuts
-        if not self.models and self.model:
-            self.models = (self.model,)
-
-        # Add defaults from the model meta
-        if self.models:
-            model = self.models[0]
-            if not self.verbose_name:
-                self.verbose_name = model._meta.verbose_name
-            if not self.verbose_name_plural:
-                self.verbose_name_plural = model._meta.verbose_name_plural
-            if not self.title:
-                self.title = capfirst(self.verbose_name_plural)
+    #: Use keyset (seek) pagination instead of page numbers. Pages are then requested with the opaque
+    #: ``cursor`` GET parameter instead of ``page``, so deep pages are as fast as the first one.
+    #: Only works for reports backed by a queryset.
+    cursor_pagination = False
+
+    #: Optional. The number of seconds the number of items of a report is cached, per combination of
+    #: filter parameters. By default the number of items is not cached.
+    count_cache_timeout = None
+
+    #: Optional. The number of seconds an expired cached number of items may still be shown while one
+    #: request recomputes it.
+    count_cache_stale_timeout = 0
+
+    #: The name of the Django cache used for caching the number of items.
+    count_cache_alias = 'default'
+
+    #: Optional. The number of seconds the data of the report API (``api_list``, also used by the backoffice) is
+    #: cached, per combination of GET parameters, user and permission fingerprint (see ``get_cache_fingerprint``).
+    #: Cached data is invalidated when an instance of ``models``, of a model related through ``fields`` or of
+    #: a model of ``prefetch`` is saved or deleted. This works in every process that registered the report
+    #: before it changes the models, so list the modules registering reports in the ``ADVANCED_REPORTS_MODULES``
+    #: setting when they are not imported by every process. See also ``invalidate_cache``.
+    #: The decorator of the report is still applied to every request. By default nothing is cached.
+    response_cache_timeout = None
+
+    #: The name of the Django cache used for caching the data of the report API.
+    response_cache_alias = 'default'
+
+    #: Set to True to share the cached data of the report API between the users with the same
+    #: ``get_cache_fingerprint``. Only do this when ``queryset()`` and the columns don't depend on the user.
+    response_cache_shared = False
+
+    #: Optional. The number of seconds between two snapshots of this report, taken by the
+    #: ``advreport_snapshots`` management command. A snapshot holds all the items of the report without
+    #: filters, as they are rendered for a request without a user, so it is meant for reports that look the
+    #: same for everyone. When a snapshot exists, unfiltered pages and exports are served from it to the
+    #: requests with the same ``get_cache_fingerprint`` as that anonymous request; other users get live data.
+    snapshot_schedule = None
+
+    #: The Django storage for snapshots. By default ``default_storage`` (``MEDIA_ROOT``) is used. A storage
+    #: without local paths has to implement ``modified_time``, so that a snapshot is only downloaded once.
+    snapshot_storage = None
+
+    #: The number of rows that are compressed together in a snapshot.
+    snapshot_rows_per_block = 100
+
+    #: Keep the rendered columns, the search text and the sort keys of every item in a table (see
+    #: ``advanced_reports.models.ReportRow``), which is updated whenever an instance of the model of the report
+    #: or of one of the ``materialized_dependencies`` is saved or deleted. Listing, searching, sorting and counting
+    #: are then served from that table, as long as the request has no other parameters than ``page``, ``row_limit``,
+    #: ``q``, ``exact`` and ``order``. The columns are rendered without a user, and only the first six
+    #: ``sortable_fields`` can be sorted on. Not used together with ``facets``, ``cursor_pagination`` or
+    #: ``value_selection_filter_fields``, nor for requests whose ``queryset()`` differs from the one without
+    #: a user (see ``uses_materialized_rows``). Fill the table with the ``advreport_materialize`` management
+    #: command, and run it again after changing the columns of the report. Like the cached data of
+    #: ``response_cache_timeout``, the rows are only updated by processes that registered the report, so list the
+    #: modules registering materialized reports in the ``ADVANCED_REPORTS_MODULES`` setting when they are not
+    #: imported by every process.
+    #: Changes without signals, like the ``update()`` of a ``FOO_queryset`` action, are only seen after rebuilding.
+    #: Multiple actions on all the filtered items always use the live query.
+    materialized = False
+
+    #: A dict mapping the other models the columns depend on to a function that returns the item (or a list of
+    #: items) whose row must be updated when an instance of that model is saved or deleted, like the
+    #: ``search_index_dependencies`` of the backoffice. Example::
+    #:
+    #:     materialized_dependencies = {TodoItem: lambda todo_item: todo_item.todo_list}
+    materialized_dependencies = {}
+
+    #: Optional. Set to ``'capped'`` to stop counting items after ``approximate_count_limit`` items (which
+    #: will be displayed as e.g. "10000+"), or to ``'estimate'`` to use the estimate of the query planner
+    #: above that limit (PostgreSQL only, other databases will use a capped count). An approximate count is
+    #: only displayed, the pages beyond it are served as long as they have items.
+    approximate_count = None
+
+    #: The number of items above which ``approximate_count`` kicks in.
+    approximate_count_limit = 10000
+
+    #: Fetch the items of a read-only report as compact rows (see ``advanced_reports.rows.Row``) holding a
+    #: ``values_list`` of the lookups of ``get_row_fields``, instead of as model instances. The values are looked
+    #: up like attributes, so ``get_FOO_html`` methods keep working as long as they only use those lookups.
+    #: Columns that are relations show the primary key of the related object.
+    #: Actions still get model instances from ``get_item_for_id``.
+    lightweight_rows = False
+
+    #: Optional. A list of ``advanced_reports.prefetch`` specs (``ReverseRelation``, ``GenericReverseRelation``,
+    #: ``RelatedAggregate``) that attach related data to the items. They run once per page, chunk or
+    #: batch of items of an action, before ``enrich_list``. Example::
+    #:
+    #:     prefetch = (
+    #:         ReverseRelation('todo_items', TodoItem, 'todo_list'),
+    #:         RelatedAggregate('open_item_count', TodoItem, 'todo_list', Count('pk'), filter={'done': None}),
+    #:     )
+    prefetch = ()
 
-            # Add defaults from the model admin
-            model_admin = admin.site._registry.get(model)
+    #: The number of selected items that are fetched with one query by ``get_items_for_ids``. Actions that are
+    #: executed item by item on a selection commit one transaction per this many items.
+    multiple_action_chunk_size = 500
 
-            if model_admin:
-                self.model_admin = model_admin
+    #: Execute actions on all the (filtered) items of the report as a background job in the backoffice, instead of
+    #: during the request. The jobs are run by the ``advreport_worker`` management command.
+    background_actions = False
 
-                if self.fields is None and model_admin.list_display:
-                    self.fields = model_admin.list_display
+    #: Follow the forward foreign keys used by ``fields`` (like ``todo_list__owner__email``) with
+    #: ``select_related``, so that related columns don't cost a query per item.
+    auto_select_related = False
 
-                if self.search_fields is None and model_admin.search_fields:
-                    self.search_fields = model_admin.search_fields
+    #: Load only the model fields used by ``fields`` with ``QuerySet.only()``. Only enable this when the
+    #: ``get_FOO_html`` methods and the actions of the report use no other model fields, since loading
+    #: a deferred field costs a query per item.
+    only_fields = False
 
-                if self.sortable_fields is None and model_admin.list_display:
-                    self.sortable_fields = model_admin.list_display
+    #: The formats in which the current list of the report can be exported, see ``export``.
+    #: ``'xlsx'`` requires the optional ``xlsxwriter`` package.
+    export_formats = ('csv', 'jsonl', 'xlsx')
 
-        # Some sane defaults
-        if not self.fields:
-            self.fields = ()
-        if not self.search_fields:
-            self.search_fields = ()
-        if not self.sortable_fields:
-            self.sortable_fields = ()
+    #: The number of items that are fetched and enriched at once while exporting.
+    export_chunk_size = 1000
 
-        # Expand item_actions with the decorated versions
-        item_actions = list(self.item_actions)
-        for method_name in dir(self):
-            if not hasattr(AdvancedReport, method_name):
-                method = getattr(self, method_name)
+    #: The delimiter of CSV exports.
+    csv_delimiter = ';'
 
-                if callable(method) and hasattr(method, 'action'):
-                    item_actions.append(method.action)
+    def __init__(self, *args, **kwargs):
+        spec = self.get_spec()
+        self.model_admin = spec.model_admin
+
+        # Everything that can be inferred from the class is looked up only once, in the spec.
+        # Attributes that were already assigned to this instance (e.g. by a subclass) are left alone.
+        for attr in ('models', 'verbose_name', 'verbose_name_plural', 'title',
+                     'fields', 'search_fields', 'sortable_fields', 'item_actions'):
+            if attr not in self.__dict__:
+                setattr(self, attr, getattr(spec, attr))
+
+    @classmethod
+    def get_spec(cls):
+        """
+        Returns the ``ReportSpec`` of this report class. The spec is built the first time it is needed
+        and is shared by all instances of this class afterwards.
+        """
+        spec = cls.__dict__.get('_spec')
+        if spec is None:
+            spec = ReportSpec(cls)
+            cls._spec = spec
+            if cls.response_cache_timeout:
+                watch_models(spec.dependent_models, cls.response_cache_alias)
+            if cls.materialized and spec.models:
+                from advanced_reports.materialized import watch_report
+                watch_report(cls, spec.models[0], cls.materialized_dependencies)
+        return spec
 
-        item_actions.sort(key=lambda a: a.creation_counter)
-        self.item_actions = item_actions
+    @property
+    def _uses_spec_fields(self):
+        """
+        True when the field configuration of this instance is still the one of its spec,
+        so that the precomputed lookups of the spec can be used.
+        """
+        spec = self.get_spec()
+        return self.models is spec.models and self.sortable_fields is spec.sortable_fields
 
     def queryset(self):
         """
@@ -559,6 +768,17 @@ class AdvancedReport(object):
         """
         return True
 
+    def filter_action_queryset(self, queryset, action):
+        """
+        Implement this to restrict the queryset passed to the ``FOO_queryset`` method of an action with
+        ``queryset=True`` to the items the action applies to. This is the queryset counterpart of
+        ``verify_action_group``: as long as only ``verify_action_group`` is implemented, actions with a
+        ``group`` are executed item per item instead.
+
+        For example, if the action is in the "paid" group, we could return ``queryset.filter(paid=True)``.
+        """
+        return queryset
+
     def set_request(self, request):
         """
         Set the request for this report.
@@ -578,6 +798,14 @@ class AdvancedReport(object):
         """
         return six.text_type(item.pk)
 
+    def get_item_version(self, item):
+        """
+        Optional. Returns a value that changes whenever an item changes, like a modification timestamp.
+        When available, the ``confirm``, ``success`` and ``verbose_name`` texts of the actions are
+        cached per item and version. By default, nothing is cached.
+        """
+        return None
+
     def get_item_for_id(self, item_id):
         """
         Advanced Reports also expects each item to be found by its unique ID. By default it does
@@ -590,6 +818,27 @@ class AdvancedReport(object):
         except ObjectDoesNotExist:
             return None
 
+    def get_items_for_ids(self, item_ids):
+        """
+        Returns the items for a list of IDs, in the same order. IDs of items that don't exist are left out.
+
+        By default the items are looked up with one query per ``multiple_action_chunk_size`` IDs. When
+        ``get_item_for_id`` or ``get_item_id`` is implemented, ``get_item_for_id`` is called for every ID instead.
+        """
+        report_class = type(self)
+        queryset = self._queryset(request=None)
+        if report_class.get_item_for_id is not AdvancedReport.get_item_for_id \
+                or report_class.get_item_id is not AdvancedReport.get_item_id \
+                or not isinstance(queryset, QuerySet):
+            return [item for item in (self.get_item_for_id(item_id) for item_id in item_ids) if item is not None]
+
+        item_ids = [six.text_type(item_id) for item_id in item_ids]
+        items = {}
+        for chunk in iter_chunks(set(item_ids), self.multiple_action_chunk_size):
+            for item in queryset.filter(pk__in=chunk):
+                items[self.get_item_id(item)] = item
+        return [items[item_id] for item_id in item_ids if item_id in items]
+
     def get_decorator(self):
         """
         To be used in tandem with decorate_views. Set it to True when you want to implement this function.
@@ -698,12 +947,137 @@ class AdvancedReport(object):
         """
         pass
 
+    def export(self, request, format='csv'):
+        """
+        Returns a streaming response with the current filtered and sorted list of this report in the given
+        format. Instead of HTML, the exported columns contain raw values. Implement
+        ``get_FOO_export_value(self, item)`` to change the exported value of column FOO.
+        """
+        if format not in get_available_formats(self):
+            raise Http404
+        snapshot = self.get_snapshot(request)
+        if snapshot is not None:
+            return export_response(self, None, format, rows=snapshot.iter_export_rows())
+        object_list = self.get_object_list(request)[0]
+        return export_response(self, object_list, format)
+
+    def get_snapshot(self, request):
+        """
+        Returns the ``Snapshot`` that can serve ``request``, or None. Snapshots are only used when
+        ``snapshot_schedule`` is set, the request has no other parameters than ``page`` and ``row_limit`` and
+        its ``get_cache_fingerprint`` is the one the snapshot was rendered for. Add ``fresh`` (or any filter)
+        to the parameters to get live data.
+        """
+        if not self.snapshot_schedule or request is None:
+            return None
+        if any(k not in SNAPSHOT_PARAMETERS for k in request.GET.keys()):
+            return None
+        snapshot = open_snapshot(self)
+        if snapshot is None or snapshot.fingerprint != get_snapshot_fingerprint(self, request):
+            return None
+        return snapshot
+
+    def enrich_items(self, items):
+        """
+        Runs the ``prefetch`` specs and ``enrich_list`` on a list of items. This is called once for
+        every page, chunk or batch of items.
+        """
+        if self.prefetch:
+            items = items if isinstance(items, (list, tuple)) else list(items)
+            if items:
+                for prefetch in self.prefetch:
+                    prefetch.apply(self, items)
+        self.enrich_list(items)
+
     def get_item_count(self):
         """
         Implement this if you don't use Django model instances.
         Returns the number of items in the report.
         """
-        return self._queryset(request=None).count()
+        if self.uses_materialized_rows():
+            from advanced_reports.models import ReportRow
+            return self.count_queryset(ReportRow.objects.filter(report_slug=self.slug), request=self.request,
+                                       kind='total')
+        return self.count_queryset(self._queryset(request=None), request=self.request, kind='total')
+
+    def count_queryset(self, queryset, request=None, kind='list'):
+        """
+        Counts the items of a (filtered) queryset of this report, taking ``count_cache_timeout`` and
+        ``approximate_count`` into account. Returns an ``ItemCount``.
+
+        Counts are only cached when the request, whose parameters filtered the queryset, is given. They are
+        cached per user, as the queryset of a report may depend on the user.
+        """
+        if self.approximate_count:
+            compute = lambda: approximate_count(queryset, self.approximate_count, self.approximate_count_limit)
+        else:
+            compute = lambda: ItemCount(queryset.count())
+
+        if not self.count_cache_timeout or request is None:
+            return compute()
+        user = getattr(request, 'user', None)
+        fingerprint = [getattr(user, 'pk', None), self.get_cache_fingerprint(request)]
+        return cached_count(get_count_cache_key(self.slug, request, kind, fingerprint), compute,
+                            self.count_cache_timeout, self.count_cache_stale_timeout, self.count_cache_alias)
+
+    def get_cache_fingerprint(self, request):
+        """
+        Returns what distinguishes the cached API data of this report for different users. By default these
+        are the actions the user is allowed to execute. The data is also cached per user, unless
+        ``response_cache_shared`` is set.
+        """
+        return [sorted(a.method for a in self.item_actions if a.is_allowed(request)),
+                sorted(a.method for a in self.item_actions if a.is_report_action and self.report_action_allowed(a))]
+
+    def get_response_generations(self):
+        """
+        The change generations of the models this report depends on, or None when they are not tracked
+        because ``response_cache_timeout`` is not set. They are fetched once per report instance.
+        """
+        if not self.response_cache_timeout:
+            return None
+        generations = self.__dict__.get('_response_generations')
+        if generations is None:
+            generations = self._response_generations = get_generations(self.get_spec().dependent_models,
+                                                                       self.response_cache_alias)
+        return generations
+
+    def invalidate_cache(self):
+        """
+        Invalidates the cached data of the reports depending on the models of this report. Saving and deleting
+        instances does this automatically, but changes without signals, like an ``update()`` in a ``FOO_queryset``
+        method, need to call this.
+        """
+        models_changed(self.get_spec().dependent_models)
+
+    def get_response_cache_key(self, request, *extra):
+        """
+        The cache key for the API data of this report for ``request``. Returns None when the data is not cached.
+        """
+        generations = self.get_response_generations()
+        if generations is None:
+            return None
+        fingerprint = self.get_cache_fingerprint(request)
+        if not self.response_cache_shared:
+            fingerprint = [getattr(getattr(request, 'user', None), 'pk', None), fingerprint]
+        return get_response_cache_key(self.slug, request, fingerprint, generations, extra)
+
+    def get_response_etag(self, request, *extra):
+        """
+        An ETag for the API data of this report for ``request``, computed without fetching any items.
+        Returns None when the generations of the models are not tracked.
+        """
+        key = self.get_response_cache_key(request, *extra)
+        return key and '"%s"' % key.rsplit(':', 1)[1]
+
+    def get_last_modified(self):
+        """
+        The timestamp of the last change of the models of this report, or None when it is unknown.
+        """
+        generations = self.get_response_generations()
+        if not generations:
+            return None
+        return get_generation_timestamp(max(generations))
 
     def get_template(self):
         """
@@ -768,6 +1142,8 @@ class AdvancedReport(object):
                         self.fields[filter_field] = report._create_choicefield(report.filter_values[filter_field], True)
                     elif filter_field in all_model_fields:
                         self.fields[filter_field] = report._create_choicefield(all_model_fields[filter_field].choices, True)
+                    elif filter_field in report.computed_fields:
+                        self.fields[filter_field] = forms.CharField(required=False)
                     else:
                         raise ValueError("We can't get choices for %s filter" % filter_field)
         return DynamicForm
@@ -874,9 +1250,7 @@ class AdvancedReport(object):
 
             uses_model = False
 
-            field = self.get_model_field(self.date_range.split('__')[0])
-
-            if field is None:
+            if not self.is_query_field(self.date_range.split('__')[0]):
                 fake_fields.append(self.date_range)
             else:
                 uses_model = True
@@ -901,8 +1275,7 @@ class AdvancedReport(object):
                 part_query = Q()
                 for search_field in self.search_fields:
 
-                    field = self.get_model_field(search_field.split('__')[0])
-                    if field is None:
+                    if not self.is_query_field(search_field.split('__')[0]):
                         fake_fields.append(search_field)
                     else:
                         uses_model = True
@@ -916,7 +1289,7 @@ class AdvancedReport(object):
 
         fake_found = []
         if len(fake_fields) > 0:
-            self.enrich_list(queryset)
+            self.enrich_items(queryset)
             for fake_field in fake_fields:
                 for o in queryset:
                     test_string = strip_tags(self.get_item_html(fake_field, o)).lower().replace('&nbsp;', ' ')
@@ -939,8 +1312,55 @@ class AdvancedReport(object):
         else:
             return EnrichedQueryset(fake_found, self, request=request)
 
+    def optimize_queryset(self, qs):
+        """
+        Applies ``select_related`` (see ``auto_select_related``) and ``only`` (see ``only_fields``) to the
+        queryset of this report.
+        """
+        if not isinstance(qs, QuerySet) or not self.models or qs.model is not self.models[0]:
+            return qs
+        if getattr(qs, '_fields', None):
+            # A values() queryset
+            return qs
+
+        spec = self.get_spec()
+        uses_spec = self.models is spec.models and self.fields is spec.fields
+        lookups = [f for f in self.fields if f not in self.computed_fields]
+
+        if self.auto_select_related and qs.query.select_related is not True:
+            select_related = spec.select_related if uses_spec else get_select_related(qs.model, lookups)
+            if select_related:
+                qs = qs.select_related(*select_related)
+
+        if self.only_fields and not qs.query.deferred_loading[0]:
+            only_fields = spec.only_fields if uses_spec else get_only_fields(qs.model, lookups)
+            if only_fields:
+                qs = qs.only(*only_fields)
+
+        return qs
+
+    def get_row_fields(self):
+        """
+        The lookups that are fetched for every item when ``lightweight_rows`` is enabled: the fields of the report
+        that are model fields or computed fields. Override this to fetch extra values for ``get_FOO_html`` methods.
+        """
+        spec = self.get_spec()
+        if self.models is spec.models and self.fields is spec.fields and self.computed_fields is type(self).computed_fields:
+            return spec.row_fields
+        return get_value_lookups(self.models[0], self.fields) + tuple(f for f in self.fields if f in self.computed_fields)
+
+    def get_row_factory(self, queryset):
+        """
+        Returns the ``RowFactory`` used to fetch the items of ``queryset`` when ``lightweight_rows`` is enabled.
+        The lookups of the ordering of the queryset are fetched as well, for keyset pagination.
+        """
+        ordering = tuple(key.lstrip('-') for key in queryset.query.order_by if isinstance(key, six.string_types))
+        return RowFactory(queryset.model, self.get_row_fields() + ordering)
+
     def _queryset(self, request):
-        qs = self.queryset()
+        qs = self.optimize_queryset(self.queryset())
+        if self.computed_fields and isinstance(qs, QuerySet):
+            qs = qs.annotate(**self.computed_fields)
         if self.request:
             def convert_value(k, v):
                 if k[-4:] == '__in':
@@ -953,7 +1373,12 @@ class AdvancedReport(object):
                     return v
 
             if self.models:
-                fieldnames = [f.name for f in self.models[0]._meta.get_fields()]
+                if self.models is self.get_spec().models:
+                    fieldnames = self.get_spec().model_field_names
+                else:
+                    fieldnames = [f.name for f in self.models[0]._meta.get_fields()]
+                if self.computed_fields:
+                    fieldnames = set(fieldnames).union(self.computed_fields)
                 lookup = dict(
                     (k, convert_value(k, v))
                     for k, v in self.request.GET.items()
@@ -980,7 +1405,7 @@ class AdvancedReport(object):
             field_name = field_name[1:] if field_name[0] == '-' else field_name
         else:
             field_name = 'pk'
-        if self.get_model_field(field_name) is None:
+        if not self.is_query_field(field_name):
             return self._queryset(request)
         return self._queryset(request).order_by(*by_field.split(','))
 
@@ -1029,14 +1454,10 @@ class AdvancedReport(object):
                         = {'verbose_name': self.get_field_metadata(value_selection_filter_field)['verbose_name'],
                            'values': []}
 
-                    available_values = set()
-                    for obj in tmp_object_list:
-                        value = getattr(obj, value_selection_filter_field)
-                        verbose_value = self.get_item_html(value_selection_filter_field, obj)
-                        available_values.add((value, verbose_value))
+                    available_values = self.get_facet_values(value_selection_filter_field, tmp_object_list)
 
                     values_to_show = []
-                    for available_value, verbose_available_value in available_values:
+                    for available_value, verbose_available_value, value_count in available_values:
                         value_key = 'value_selection_filter_field_{}_{}'.format(value_selection_filter_field,
                                                                                 available_value)
 
@@ -1052,7 +1473,8 @@ class AdvancedReport(object):
                         context_value[value_selection_filter_field]['values'] \
                             .append({'verbose_name': verbose_available_value,
                                      'url_to_toggle': urlencode(url_parameters_for_the_toggle_link),
-                                     'active': show_value})
+                                     'active': show_value,
+                                     'count': value_count})
 
                     queryset = queryset.filter(**{'{}__in'.format(value_selection_filter_field): values_to_show})
 
@@ -1064,12 +1486,18 @@ class AdvancedReport(object):
         order_by = request.GET.get('order', default_order_by)
         context = {}
         if order_by:
-            order_field = order_by.split('__')[0].split(',')[0].strip('-')
+            order_field = get_order_field(order_by)
             ascending = order_by[:1] != '-'
             context.update({'order_field': order_field,
                             'ascending': ascending,
                             'order_by': order_by.strip('-'),
                             'ordered_by': self.get_ordered_by(order_by)})
+
+        object_list = self.get_materialized_object_list(request) if ids is None else None
+        if object_list is not None:
+            return self.post_process_object_list(object_list), context
+
+        if order_by:
             queryset = self.get_sorted_queryset(order_by, request=request)
         else:
             queryset = self._queryset(request)
@@ -1082,10 +1510,108 @@ class AdvancedReport(object):
         context.update(new_context)
 
         object_list = self.get_filtered_items(queryset, request.GET, request=request)
+        if ids is not None:
+            # The cached counts are only keyed by the request parameters, not by the ids.
+            object_list.cache_count = False
         object_list = self.post_process_object_list(object_list)
 
         return object_list, context
 
+    def uses_materialized_rows(self):
+        """
+        True when this report is ``materialized`` and its ``queryset()`` doesn't depend on the request, so that
+        all the rows apply to it. The rows are rendered without a user.
+        """
+        if not self.materialized:
+            return False
+        uses_rows = self.__dict__.get('_uses_materialized_rows')
+        if uses_rows is None:
+            from advanced_reports.materialized import queryset_depends_on_request
+            uses_rows = self._uses_materialized_rows = not queryset_depends_on_request(self)
+        return uses_rows
+
+    def get_materialized_object_list(self, request):
+        """
+        Returns a ``MaterializedQueryset`` serving ``request`` from the materialized rows of this report, or None
+        when the report is not ``materialized`` or the request needs the live query.
+        """
+        if request is None or self.facets or self.cursor_pagination or self.value_selection_filter_fields \
+                or not self.uses_materialized_rows():
+            return None
+        from advanced_reports.materialized import get_materialized_rows
+        rows = get_materialized_rows(self, request)
+        if rows is None:
+            return None
+        return MaterializedQueryset(rows, self, request=request)
+
+    def get_facet_values(self, field_name, object_list):
+        """
+        Returns the distinct values of ``field_name`` in ``object_list`` as ``(value, verbose_value, count)``
+        tuples. For querysets, this is computed by the database with one grouped query.
+
+        When the report has a ``get_FOO_html`` or ``get_FOO_decorator`` for the field, the verbose values are
+        rendered by it for one item of each value, fetched with one extra query.
+        """
+        queryset = getattr(object_list, 'queryset', object_list)
+        if isinstance(queryset, QuerySet):
+            column = ColumnSpec(field_name)
+            if not hasattr(self, column.html_hook) and not hasattr(self, column.decorator_hook):
+                return [(value, self.get_facet_value_html(field_name, value), count)
+                        for value, count in get_facet_buckets(queryset, field_name)]
+            buckets = get_facet_buckets(queryset, field_name, with_pk=True)
+            items = queryset.in_bulk([pk for value, count, pk in buckets])
+            return [(value, self.get_item_html(field_name, items[pk]) if pk in items
+                     else self.get_facet_value_html(field_name, value), count)
+                    for value, count, pk in buckets]
+
+        counts = OrderedDict()
+        for obj in object_list:
+            key = (getattr(obj, field_name), self.get_item_html(field_name, obj))
+            counts[key] = counts.get(key, 0) + 1
+        return [(value, verbose_value, count) for (value, verbose_value), count in counts.items()]
+
+    def get_facet_value_html(self, field_name, value):
+        """
+        Returns the HTML for a value of a facet. By default this is the display value of the choices
+        of the model field, if any, or else ``get_html_for_value``. Implement this when you want to
+        display facet values in another way. It is not used for fields having a ``get_FOO_html``.
+        """
+        model_field = self.get_model_field(field_name)
+        choices = dict(getattr(model_field, 'flatchoices', None) or ())
+        if value in choices:
+            return escape(six.text_type(choices[value]))
+        return mark_safe(self.get_html_for_value(value))
+
+    def get_facets(self, object_list):
+        """
+        Returns the facet buckets of the ``filter_fields`` and ``value_selection_filter_fields``, computed
+        by the database::
+
+            {'field': [{'value': 'A', 'verbose_name': 'Value A', 'count': 15}, ...], ...}
+        """
+        if not isinstance(getattr(object_list, 'queryset', None), QuerySet):
+            return {}
+
+        facets = {}
+        for field_name in list(self.filter_fields) + list(self.value_selection_filter_fields):
+            if field_name in facets or not self.is_query_field(field_name):
+                continue
+            facets[field_name] = [{'value': value, 'verbose_name': verbose_value, 'count': count}
+                                  for value, verbose_value, count in self.get_facet_values(field_name, object_list)]
+        return facets
+
+    def get_tabbed_filter_counts(self, object_list):
+        """
+        Returns the number of items for each tab of the ``tabbed_filter_fields``, using one query per field::
+
+            {'card': {'2FF': 10, '4FF': 3}}
+        """
+        if not isinstance(getattr(object_list, 'queryset', None), QuerySet):
+            return {}
+        return dict((field_name, get_value_counts(object_list.queryset, field_name,
+                                                  list(self.tabbed_filter_fields[field_name]['types'])))
+                    for field_name in self.tabbed_filter_fields)
+
     def get_ordered_by(self, by_field):
         if by_field == '':
             return ''
@@ -1096,6 +1622,19 @@ class AdvancedReport(object):
     def get_action_callable(self, method):
         return getattr(self, method, lambda i, f=None: False)
 
+    def get_queryset_action_callable(self, action):
+        """
+        Returns the ``FOO_queryset`` method of an action with ``queryset=True``, or None. It is also None for an
+        action with a ``group`` when the groups are verified per item but not by ``filter_action_queryset``.
+        """
+        if action is None or not action.queryset:
+            return None
+        report_class = type(self)
+        if action.group and report_class.verify_action_group is not AdvancedReport.verify_action_group \
+                and report_class.filter_action_queryset is AdvancedReport.filter_action_queryset:
+            return None
+        return getattr(self, '%s_queryset' % action.method, None)
+
     def handle_multiple_actions(self, method, selected_object_ids, request=None):
         # Lookup the action
         action = self.find_action(method)
@@ -1103,8 +1642,8 @@ class AdvancedReport(object):
             raise Http404
 
         # Construct enriched list of objects
-        objects = [o for o in (self.get_item_for_id(item_id) for item_id in selected_object_ids) if o]
-        self.enrich_list(objects)
+        objects = self.get_items_for_ids(selected_object_ids)
+        self.enrich_items(objects)
         objects = [object for object in objects if self.verify_action_group(object, action.group)]
         for o in objects:
             self.enrich_object(o, list=False, request=request)
@@ -1134,16 +1673,37 @@ class AdvancedReport(object):
                 return None, 0
             return multiple_callable(objects, *extra_args), len(objects)
 
+        # One transaction per chunk of items, and a savepoint per item so that a failing item
+        # does not roll back the others.
         count = 0
-        self.enrich_list(objects)
-        for object in objects:
-            self.enrich_object(object, list=False, request=request)
-            if self.find_object_action(object, method) is not None:
-                self.get_action_callable(method)(object, *extra_args)
-                count += 1
-
+        failed = []
+        for chunk in iter_chunks(objects, self.multiple_action_chunk_size):
+            with transaction.atomic():
+                for object in chunk:
+                    if self.find_object_action(object, method) is None:
+                        continue
+                    try:
+                        with transaction.atomic():
+                            self.get_action_callable(method)(object, *extra_args)
+                        count += 1
+                    except ActionException as e:
+                        failed.append((object, e.msg))
+
+        if failed:
+            self.report_failed_items(failed, count, request)
         return None, count
 
+    def report_failed_items(self, failed, count, request=None):
+        """
+        Reports the items on which a multiple action raised an ``ActionException``, as a list of
+        ``(item, message)`` tuples. ``count`` items succeeded. When none did, the first failure is raised
+        again, otherwise every failure is added to the messages of the request.
+        """
+        if not count or request is None:
+            raise ActionException(failed[0][1])
+        for item, msg in failed:
+            messages.error(request, '%s: %s' % (six.text_type(item), msg))
+
     @property
     def column_headers(self):
         return [self.get_field_metadata(field_name) for field_name in self.fields]
@@ -1157,61 +1717,81 @@ class AdvancedReport(object):
         return _('You can search by %(fields)s') % {'fields': field_names}
 
     def get_column_values(self, item):
-        for field_name in self.fields:
-            yield {'html': self.get_item_html(field_name, item),
-                   'class': getattr(self, 'get_%s_class' % field_name, lambda i: '')(item),
-                   'style': getattr(self, 'get_%s_style' % field_name, lambda: None)()}
+        # Items of a materialized report come with the columns of their row.
+        values = getattr(item, 'advreport_materialized_values', None)
+        if values is not None:
+            return values
+        return self.get_row_renderer().render(item)
+
+    def get_row_renderer(self):
+        """
+        Returns the ``RowRenderer`` for the current fields of this report. It is compiled once
+        per report instance, so the hooks of each column are only looked up once per request.
+        """
+        renderer = self.__dict__.get('_row_renderer')
+        if renderer is None or renderer.fields is not self.fields:
+            spec = self.get_spec()
+            if self.fields is spec.fields:
+                columns = spec.columns
+            else:
+                columns = tuple(ColumnSpec(field_name) for field_name in self.fields)
+            renderer = self._row_renderer = RowRenderer(self, columns)
+        return renderer
 
     def get_model_field(self, field_name):
-        if self.models is None:
-            return None
+        if self.models is self.get_spec().models:
+            return self.get_spec().get_model_field(field_name)
+        return lookup_model_field(self.models, field_name)
 
-        for model in self.models:
-            try:
-                return model._meta.get_field(field_name)
-            except FieldDoesNotExist:
-                pass
-        return None
+    def is_query_field(self, field_name):
+        """
+        Whether the database can search, sort and filter on the given field, i.e. when it is a model field
+        or one of the ``computed_fields``. Other fields are "fake fields" which can only be searched in Python.
+        """
+        return field_name in self.computed_fields or self.get_model_field(field_name) is not None
 
     def get_field_metadata_dict(self):
         all_fields = list(self.fields) + list(self.filter_fields)
         return dict((field, self.get_field_metadata(field)) for field in all_fields)
 
     def get_field_metadata(self, field_name):
+        if self._uses_spec_fields:
+            static = self.get_spec().get_static_field_metadata(field_name)
+        else:
+            static = self._get_static_field_metadata(field_name)
+
         verbose_name = getattr(self, 'get_%s_verbose_name' % field_name, lambda: None)()
         if verbose_name is None:
-            model_field = self.get_model_field(field_name)
-            if model_field is not None:
-                verbose_name = model_field.verbose_name
+            verbose_name = static['model_verbose_name']
 
         if verbose_name is None:
             verbose_name = capfirst(field_name.replace('_', ' '))
 
+        return {'name': static['name'],
+                'full_name': static['full_name'],
+                'verbose_name': capfirst(verbose_name),
+                'sortable': static['sortable'],
+                'order_by': static['order_by'],
+                'style': getattr(self, 'get_%s_style' % field_name, lambda: None)()}
+
+    def _get_static_field_metadata(self, field_name):
+        model_field = self.get_model_field(field_name)
+
         sortable = False
         order_by = ''
         for sf in self.sortable_fields:
-            fn = sf.split('__')[0].split(',')[0].strip('-')
-            if fn == field_name.split('__')[0]:
+            if get_order_field(sf) == field_name.split('__')[0]:
                 sortable = True
                 order_by = sf.strip('-')
 
         return {'name': field_name.split('__')[0],
                 'full_name': field_name,
-                'verbose_name': capfirst(verbose_name),
+                'model_verbose_name': getattr(model_field, 'verbose_name', None),
                 'sortable': sortable,
-                'order_by': order_by,
-                'style': getattr(self, 'get_%s_style' % field_name, lambda: None)()}
+                'order_by': order_by}
 
     def lookup_item_value(self, field_name, item):
-        if '__' in field_name:
-            field_name, remainder = field_name.split('__', 1)
-            obj = getattr(item, field_name, None)
-            return self.lookup_item_value(remainder, obj)
-        else:
-            html = getattr(item, 'get_%s_display' % field_name, lambda: None)()
-            if html is None:
-                html = getattr(item, field_name, None)
-        return html
+        return get_value_getter(field_name)(item)
 
     def get_html_for_value(self, value):
         """
@@ -1220,15 +1800,12 @@ class AdvancedReport(object):
         return escape(six.text_type(value))
 
     def get_item_html(self, field_name, item):
-        html = getattr(self, 'get_%s_html' % field_name, lambda i: None)(item)
-        if html is None:
-            html = self.get_html_for_value(self.lookup_item_value(field_name, item))
-
-        decorator = getattr(self, 'get_%s_decorator' % field_name, lambda i: None)(item)
-        if decorator is not None:
-            html = decorator(html)
-
-        return mark_safe(html)
+        html_renderers = self.__dict__.setdefault('_html_renderers', {})
+        try:
+            render_html = html_renderers[field_name]
+        except KeyError:
+            render_html = html_renderers[field_name] = RowRenderer.compile_field_html(self, ColumnSpec(field_name))
+        return render_html(item)
 
     def objects(self, request=None):
         return EnrichedQueryset(self._queryset(request), self)
@@ -1246,7 +1823,7 @@ class AdvancedReport(object):
             return
 
         if list:
-            self.enrich_list([o])
+            self.enrich_items([o])
 
         self.assign_attr(o, 'advreport_request', request)
         self.assign_attr(o, 'advreport_column_values', [v for v in self.get_column_values(o)])
@@ -1329,25 +1906,18 @@ class AdvancedReport(object):
         for a in self.item_actions:
             if self.verify_action_group(object, a.group) and \
                     (not request or a.is_allowed(request)):
-                instance = a.form_instance(object) if a.form_instance else object
-                if not a.form_via_ajax or a.prefetch_ajax_form:
-                    new_action = a.copy_with_instanced_form(self, prefix=self.get_item_id(object), instance=instance)
-                else:
-                    # Put off fetching the instanced Form until the actual Ajax
-                    # call for performance.
-                    new_action = a
-                if not new_action.hidden and new_action.individual_display:
-                    actions.append(new_action)
+                if not a.hidden and a.individual_display:
+                    # The form is only instantiated when it is used.
+                    actions.append(BoundAction(a, self, object))
 
         return actions
 
     def find_object_action(self, object, method, request=None):
         found_action = None
-        for a in self.item_actions:
+        for a in self._find_actions(method):
             if object is None or self.verify_action_group(object, a.group):
-                if a.method == method:
-                    found_action = a
-                    break
+                found_action = a
+                break
 
         if request is not None:
             if found_action is None:
@@ -1357,10 +1927,14 @@ class AdvancedReport(object):
 
         return found_action
 
+    def _find_actions(self, method):
+        if self.item_actions is self.get_spec().item_actions:
+            return self.get_spec().action_table.get(method, ())
+        return [a for a in self.item_actions if a.method == method]
+
     def find_action(self, method):
-        for a in self.item_actions:
-            if a.method == method:
-                return a
+        for a in self._find_actions(method):
+            return a
         return None
 
     @property
@@ -1388,40 +1962,166 @@ class AdvancedReport(object):
         return lambda h: '<a href="%(l)s">%(h)s</a>' % {'l': reverse(urlname, kwargs=kwargs), 'h': h}
 
 
+class RowRenderer(object):
+    """
+    Renders the column values of items for one report instance. All the ``get_FOO_html``,
+    ``get_FOO_decorator``, ``get_FOO_class`` and ``get_FOO_style`` hooks are looked up once,
+    when the renderer is compiled, instead of once for every cell.
+    """
+
+    def __init__(self, report, columns):
+        self.fields = report.fields
+        self.cells = tuple((self.compile_html(report, column),
+                            getattr(report, column.class_hook, None),
+                            getattr(report, column.style_hook, lambda: None)())
+                           for column in columns)
+
+    @staticmethod
+    def compile_html(report, column):
+        """
+        Returns a function that renders the HTML of ``column`` for a given item.
+        """
+        if type(report).get_item_html is not AdvancedReport.get_item_html:
+            return lambda item: report.get_item_html(column.field_name, item)
+        return RowRenderer.compile_field_html(report, column)
+
+    @staticmethod
+    def compile_field_html(report, column):
+        """
+        Like ``compile_html``, but ignores overrides of ``AdvancedReport.get_item_html``.
+        """
+        report_class = type(report)
+        field_name = column.field_name
+
+        if report_class.lookup_item_value is AdvancedReport.lookup_item_value:
+            get_value = column.value_getter
+        else:
+            get_value = lambda item: report.lookup_item_value(field_name, item)
+
+        get_html = getattr(report, column.html_hook, None)
+        get_decorator = getattr(report, column.decorator_hook, None)
+        get_html_for_value = report.get_html_for_value
+
+        def render_html(item):
+            html = get_html(item) if get_html is not None else None
+            if html is None:
+                html = get_html_for_value(get_value(item))
+
+            if get_decorator is not None:
+                decorator = get_decorator(item)
+                if decorator is not None:
+                    html = decorator(html)
+
+            return mark_safe(html)
+        return render_html
+
+    def render(self, item):
+        return [{'html': render_html(item),
+                 'class': get_class(item) if get_class is not None else '',
+                 'style': style}
+                for render_html, get_class, style in self.cells]
+
+
 class EnrichedQueryset(object):
     def __init__(self, queryset, advreport, request=None):
         self.queryset = queryset
-        if isinstance(self.queryset, QuerySet):
+        if isinstance(self.queryset, QuerySet) and list(self.queryset.query.order_by[-1:]) != ['pk']:
             self.queryset.query.add_ordering('pk')
         self.advreport = advreport
         self.request = request
+        self._count = None
+
+        #: Whether the count may be cached using the filter parameters of the request.
+        self.cache_count = True
 
     def __getitem__(self, k):
         if isinstance(k, slice):
-            return self._enrich_list(list(self.queryset[k.start:k.stop]))
+            return self._enrich_list(self._fetch(self.queryset[k.start:k.stop]))
+        elif self._row_factory is not None:
+            return self._enrich(self._fetch(self.queryset[k:k + 1])[0])
         else:
             return self._enrich(self.queryset[k])
 
     def __iter__(self):
+        if self._row_factory is not None:
+            return self._row_factory.iterate(self.queryset)
         return self.queryset.__iter__()
 
+    @property
+    def _row_factory(self):
+        """
+        The ``RowFactory`` of the queryset when the report uses ``lightweight_rows``, None otherwise.
+        """
+        if not self.advreport.lightweight_rows or not isinstance(self.queryset, QuerySet):
+            return None
+        factory = self.__dict__.get('_cached_row_factory')
+        if factory is None or self.__dict__.get('_row_factory_queryset') is not self.queryset:
+            factory = self.__dict__['_cached_row_factory'] = self.advreport.get_row_factory(self.queryset)
+            self.__dict__['_row_factory_queryset'] = self.queryset
+        return factory
+
+    def _fetch(self, queryset):
+        """
+        Evaluates (a slice of) the queryset into a list of items, which are rows when the report uses
+        ``lightweight_rows``.
+        """
+        row_factory = self._row_factory
+        if row_factory is not None:
+            return row_factory.fetch(queryset)
+        return list(queryset)
+
     def __len__(self):
-        if isinstance(self.queryset, QuerySet):
-            return self.queryset.count()
-        return len(self.queryset)
+        return self.count()
+
+    def count(self):
+        """
+        The number of items. It is only counted once, so that the paginator and the response
+        can share it.
+        """
+        if self._count is None:
+            if isinstance(self.queryset, QuerySet):
+                request = self.request if self.cache_count else None
+                self._count = self.advreport.count_queryset(self.queryset, request=request)
+            else:
+                self._count = len(self.queryset)
+        return self._count
+
+    #: The default number of items that are fetched and enriched at once by ``iterator`` and ``chunks``.
+    chunk_size = 1000
+
+    def chunks(self, chunk_size=None):
+        """
+        Yields the items in lists of at most ``chunk_size`` items, after running ``enrich_list`` on each list.
+        Only one chunk is kept in memory at a time, see ``iter_queryset_chunks``.
 
-    def iterator(self):
-        if isinstance(self.queryset, QuerySet):
-            it = self.queryset.iterator()
+        The items are not enriched with ``enrich_object``, so consumers that don't need the rendered
+        columns and actions (like exports) can skip that.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        row_factory = self._row_factory
+        if row_factory is not None:
+            chunks = iter_queryset_chunks(self.queryset, chunk_size, fetch=row_factory.fetch, iterate=row_factory.iterate)
+        elif isinstance(self.queryset, QuerySet):
+            chunks = iter_queryset_chunks(self.queryset, chunk_size)
         else:
-            it = self.queryset
-        for i in it:
-            self._enrich(i)
-            yield i
+            chunks = iter_chunks(self.queryset, chunk_size)
+
+        for chunk in chunks:
+            self.advreport.enrich_items(chunk)
+            yield chunk
+
+    def iterator(self, chunk_size=None):
+        """
+        Yields all the enriched items. ``enrich_list`` runs once per chunk of ``chunk_size`` items.
+        """
+        for chunk in self.chunks(chunk_size):
+            for o in chunk:
+                self.advreport.enrich_object(o, list=False, request=self.request)
+                yield o
 
     def _enrich_list(self, l):
         # We run enrich_list on all items in one pass.
-        self.advreport.enrich_list(l)
+        self.advreport.enrich_items(l)
 
         for o in l:
             # We pass list=False to prevent running enrich_list from enrich_object.
@@ -1430,10 +2130,38 @@ class EnrichedQueryset(object):
         return l
 
     def _enrich(self, o):
-        self.advreport.enrich_object(o, self.request)
+        self.advreport.enrich_object(o, request=self.request)
         return o
 
 
+class MaterializedQueryset(EnrichedQueryset):
+    """
+    The items of a ``materialized`` report, searched, sorted and counted with a queryset of its ``ReportRow``\ s.
+    Only the items of a page or a chunk are fetched, by their ids, and their columns are taken from their rows.
+    """
+    _row_factory = None
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self._enrich_list(self._fetch(self.queryset[k.start:k.stop]))
+        return self._enrich(self._fetch(self.queryset[k:k + 1])[0])
+
+    def __iter__(self):
+        for rows in iter_queryset_chunks(self.queryset, self.chunk_size):
+            for item in self._fetch(rows):
+                yield item
+
+    def _fetch(self, queryset):
+        from advanced_reports.materialized import get_items_for_rows
+        return get_items_for_rows(self.advreport, list(queryset))
+
+    def chunks(self, chunk_size=None):
+        for rows in iter_queryset_chunks(self.queryset, chunk_size or self.chunk_size):
+            chunk = self._fetch(rows)
+            self.advreport.enrich_items(chunk)
+            yield chunk
+
+
 class Resolver(object):
     def __init__(self, context):
         self.context = context
@@ -0,0 +1,167 @@
+from __future__ import unicode_literals
+
+import csv
+import decimal
+import tempfile
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.html import strip_tags
+
+import six
+
+from advanced_reports.spec import get_value_getter
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def get_available_formats(advreport):
+    """
+    The export formats of ``advreport`` that can be used with the installed packages.
+    XLSX needs the optional ``xlsxwriter`` package.
+    """
+    return [f for f in advreport.export_formats if f in CONTENT_TYPES and (f != 'xlsx' or xlsxwriter is not None)]
+
+
+def compile_export_getter(advreport, field_name):
+    """
+    Compiles a function returning the raw value of a column for an item. ``get_FOO_export_value`` is
+    used when the report implements it. Columns that only exist as ``get_FOO_html`` are exported
+    as the text of their HTML.
+    """
+    from advanced_reports.defaults import AdvancedReport
+
+    hook = getattr(advreport, 'get_%s_export_value' % field_name, None)
+    if hook is not None:
+        return hook
+
+    if type(advreport).lookup_item_value is AdvancedReport.lookup_item_value:
+        get_value = get_value_getter(field_name)
+    else:
+        get_value = lambda item: advreport.lookup_item_value(field_name, item)
+
+    get_html = getattr(advreport, 'get_%s_html' % field_name, None)
+    if get_html is None or advreport.is_query_field(field_name.split('__')[0]):
+        return get_value
+
+    def get_text(item):
+        html = get_html(item)
+        if html is None:
+            return get_value(item)
+        return strip_tags(six.text_type(html))
+    return get_text
+
+
+def iter_rows(advreport, object_list):
+    """
+    Yields the raw column values of every item of an ``EnrichedQueryset``, as lists.
+    """
+    getters = [compile_export_getter(advreport, field_name) for field_name in advreport.fields]
+    for chunk in object_list.chunks(advreport.export_chunk_size):
+        for item in chunk:
+            yield [getter(item) for getter in getters]
+
+
+def get_headers(advreport):
+    return [six.text_type(header['verbose_name']) for header in advreport.column_headers]
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    return six.text_type(value)
+
+
+class _Echo(object):
+    """
+    A file-like object that returns what is written to it, so that ``csv.writer`` can produce lines one by one.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(advreport, rows):
+    writer = csv.writer(_Echo(), delimiter=str(advreport.csv_delimiter), lineterminator=str('\n'))
+    yield writer.writerow(get_headers(advreport))
+    for row in rows:
+        yield writer.writerow([to_text(value) for value in row])
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, Model):
+            return o.pk
+        try:
+            return super(ExportJSONEncoder, self).default(o)
+        except TypeError:
+            return six.text_type(o)
+
+
+def iter_jsonl(advreport, rows):
+    encoder = ExportJSONEncoder(separators=(',', ':'))
+    names = advreport.fields
+    for row in rows:
+        yield encoder.encode(OrderedDict(zip(names, row))) + '\n'
+
+
+def _xlsx_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, six.integer_types + (float,)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return six.text_type(value)
+
+
+def write_xlsx(advreport, rows, fileobj):
+    """
+    Writes an XLSX workbook to ``fileobj``. The rows are flushed to disk while writing (``constant_memory``),
+    but the workbook can only be sent once it is complete.
+    """
+    workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True, 'strings_to_numbers': False})
+    worksheet = workbook.add_worksheet()
+    worksheet.write_row(0, 0, get_headers(advreport))
+    for i, row in enumerate(rows, 1):
+        worksheet.write_row(i, 0, [_xlsx_value(value) for value in row])
+    workbook.close()
+
+
+def export_response(advreport, object_list, format, rows=None):
+    """
+    Returns a response with the items of ``object_list`` in the given ``format``: ``'csv'``, ``'jsonl'`` or
+    ``'xlsx'``. CSV and JSON Lines are streamed, XLSX is written to a temporary file first.
+    Instead of an ``object_list``, the ``rows`` of column values can be given (e.g. from a snapshot).
+    """
+    if rows is None:
+        rows = iter_rows(advreport, object_list)
+    if format == 'csv':
+        response = StreamingHttpResponse(iter_csv(advreport, rows))
+    elif format == 'jsonl':
+        response = StreamingHttpResponse(iter_jsonl(advreport, rows))
+    elif format == 'xlsx':
+        if xlsxwriter is None:
+            raise ValueError('Exporting to XLSX requires the xlsxwriter package.')
+        fileobj = tempfile.TemporaryFile()
+        write_xlsx(advreport, rows, fileobj)
+        fileobj.seek(0)
+        response = FileResponse(fileobj)
+    else:
+        raise ValueError('Unknown export format %r.' % format)
+
+    response['Content-Type'] = CONTENT_TYPES[format]
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (advreport.slug, format)
+    return response
@@ -0,0 +1,32 @@
+from __future__ import unicode_literals
+
+from django.db.models import Case, Count, IntegerField, Min, Sum, When
+
+
+def get_facet_buckets(queryset, field_name, with_pk=False):
+    """
+    Returns the distinct values of ``field_name`` in ``queryset`` together with the number of
+    items having that value, as a list of ``(value, count)`` tuples ordered by value.
+    This is done with one grouped query.
+
+    When ``with_pk`` is True, the tuples are ``(value, count, pk)``, with the primary key of one of
+    the items having that value.
+    """
+    rows = queryset.order_by(field_name).values_list(field_name).annotate(facet_count=Count('pk'))
+    if with_pk:
+        return [tuple(row) for row in rows.annotate(facet_pk=Min('pk'))]
+    return [(value, count) for value, count in rows]
+
+
+def get_value_counts(queryset, field_name, values):
+    """
+    Counts the items of ``queryset`` having each of the given ``values`` for ``field_name``, using one
+    query with a conditional aggregate per value. Returns a dict mapping the values to their counts.
+    """
+    if not values:
+        return {}
+    aggregates = dict(('facet_%d' % i, Sum(Case(When(then=1, **{field_name: value}),
+                                                 default=0, output_field=IntegerField())))
+                      for i, value in enumerate(values))
+    counts = queryset.order_by().aggregate(**aggregates)
+    return dict((value, counts['facet_%d' % i] or 0) for i, value in enumerate(values))
@@ -0,0 +1,342 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import constants
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.db.models.query import QuerySet
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+import six
+
+from advanced_reports import get_report_for_slug
+from advanced_reports.defaults import ActionException
+from advanced_reports.models import ActionJob, ActionJobChunk
+
+
+#: The number of seconds after which a running job without a heartbeat is considered crashed,
+#: so that another worker resumes it. This should be a few times ``HEARTBEAT_INTERVAL``.
+STALE_TIMEOUT = 300
+
+#: The number of seconds between two heartbeats of a running job. The heartbeat is written by a timer,
+#: independently of the chunks, so a long chunk doesn't make the job look crashed.
+HEARTBEAT_INTERVAL = 60
+
+#: The error of a job that crashed. The traceback is only logged by the worker, not shown to the user.
+CRASHED_ERROR = 'An unexpected error occurred while executing the action.'
+
+
+def create_job(request, advreport, method, item_ids=None):
+    """
+    Creates an ``ActionJob`` that executes the action ``method`` of ``advreport`` in the background, on the items
+    with the given ``item_ids`` or, when ``item_ids`` is None, on all the items filtered by the GET parameters
+    of ``request``. The data of the action form is taken from ``request.POST``.
+    """
+    user = request.user if request.user.is_authenticated() else None
+    return ActionJob.objects.create(
+        report_slug=advreport.slug,
+        method=method,
+        user=user,
+        filter_params=request.GET.urlencode() if item_ids is None else '',
+        item_ids=json.dumps([six.text_type(i) for i in item_ids]) if item_ids is not None else '',
+        form_data=request.POST.urlencode(),
+    )
+
+
+class JobMessages(object):
+    """
+    A message storage for the request of a job, which keeps the messages added by its actions.
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def add(self, level, message, extra_tags=''):
+        self.messages.append({'level': constants.DEFAULT_TAGS.get(level, ''), 'message': six.text_type(message)})
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+
+class JobFailed(Exception):
+    pass
+
+
+class Heartbeat(threading.Thread):
+    """
+    Refreshes the heartbeat of a running job every ``interval`` seconds until it is stopped.
+    """
+
+    def __init__(self, job, interval):
+        super(Heartbeat, self).__init__()
+        self.daemon = True
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                ActionJob.objects.filter(pk=self.job.pk, status=ActionJob.RUNNING).update(heartbeat=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class JobRunner(object):
+    """
+    Executes an ``ActionJob`` chunk by chunk. Every chunk is processed in one transaction, together with
+    the bookkeeping of its results, so that a job can be resumed after the last committed chunk.
+    """
+
+    def __init__(self, job, chunk_size=None, heartbeat_interval=HEARTBEAT_INTERVAL):
+        self.job = job
+        self.heartbeat_interval = heartbeat_interval
+        self.advreport = get_report_for_slug(job.report_slug)
+        self.chunk_size = chunk_size or getattr(self.advreport, 'multiple_action_chunk_size', 500)
+        self.messages = JobMessages()
+        self.request = self.get_request()
+
+    def get_request(self):
+        """
+        Rebuilds the request of the user that started the job.
+        """
+        request = HttpRequest()
+        request.method = 'POST'
+        request.GET = QueryDict(self.job.filter_params)
+        request.POST = QueryDict(self.job.form_data)
+        request.user = self.job.user or AnonymousUser()
+        request._messages = self.messages
+        return request
+
+    def run(self):
+        heartbeat = Heartbeat(self.job, self.heartbeat_interval)
+        heartbeat.start()
+        try:
+            self.process()
+        except JobFailed as e:
+            self.finish(ActionJob.FAILED, six.text_type(e))
+        except Exception:
+            # The worker logs the traceback.
+            self.finish(ActionJob.FAILED, CRASHED_ERROR)
+            raise
+        else:
+            self.finish(ActionJob.DONE)
+        finally:
+            heartbeat.stop()
+            if self.advreport is not None:
+                # Not every change of an action sends signals, like the ones of a FOO_queryset.
+                self.advreport.invalidate_cache()
+
+    def finish(self, status, error=''):
+        ActionJob.objects.filter(pk=self.job.pk).update(status=status, error=error, finished=timezone.now())
+
+    def process(self):
+        advreport = self.advreport
+        if advreport is None:
+            raise JobFailed('The report "%s" does not exist.' % self.job.report_slug)
+        advreport.set_request(self.request)
+
+        method = self.job.method
+        action = advreport.find_action(method)
+        if action is None:
+            raise JobFailed('The action "%s" does not exist.' % method)
+        if not action.is_allowed(self.request):
+            raise JobFailed('You are not allowed to execute this action.')
+
+        self.extra_args = []
+        if action.form:
+            form = action.instantiate_form(advreport, 'actionform', data=self.request.POST)
+            if not form.is_valid():
+                raise JobFailed('The submitted form was not valid: %s' % form.errors.as_text())
+            self.extra_args.append(form)
+
+        if self.job.is_global:
+            # Actions need the live queryset of the items, not the materialized rows.
+            advreport.materialized = False
+            object_list = advreport.get_object_list(self.request)[0]
+            queryset = object_list.queryset
+            queryset_callable = advreport.get_queryset_action_callable(action)
+            if isinstance(queryset, QuerySet) and queryset_callable is not None:
+                self.process_queryset(queryset_callable, advreport.filter_action_queryset(queryset.order_by(), action))
+                return
+            chunks = self.iter_filtered_chunks(queryset)
+        else:
+            chunks = self.iter_selected_chunks()
+
+        if not self.job.position:
+            if not self.job.is_global:
+                total = len(self.job.get_item_ids())
+            elif isinstance(queryset, QuerySet):
+                total = queryset.count()
+            else:
+                total = len(queryset)
+            ActionJob.objects.filter(pk=self.job.pk).update(total=total)
+
+        number = self.job.chunks.count()
+        for items, position in chunks:
+            self.process_chunk(number, items, position)
+            number += 1
+
+    def iter_selected_chunks(self):
+        """
+        Yields the selected items in chunks, starting after the last processed chunk.
+        """
+        item_ids = self.job.get_item_ids()
+        start = self.job.get_position() or 0
+        for i in range(start, len(item_ids), self.chunk_size):
+            yield self.advreport.get_items_for_ids(item_ids[i:i + self.chunk_size]), i + self.chunk_size
+
+    def iter_filtered_chunks(self, queryset):
+        """
+        Yields the filtered items in chunks ordered by primary key, starting after the last processed chunk.
+        Items that no longer match the filters when their chunk is fetched are skipped.
+        """
+        position = self.job.get_position()
+        if not isinstance(queryset, QuerySet):
+            items = list(queryset)
+            start = position or 0
+            for i in range(start, len(items), self.chunk_size):
+                yield items[i:i + self.chunk_size], i + self.chunk_size
+            return
+
+        queryset = queryset.order_by('pk')
+        while True:
+            chunk_queryset = queryset if position is None else queryset.filter(pk__gt=position)
+            items = list(chunk_queryset[:self.chunk_size])
+            if not items:
+                return
+            position = items[-1].pk
+            yield items, position
+
+    def process_chunk(self, number, items, position):
+        advreport = self.advreport
+        method = self.job.method
+        multiple_callable = getattr(advreport, '%s_multiple' % method, None)
+        succeeded, failed = [], {}
+        self.messages.messages = []
+
+        with transaction.atomic():
+            advreport.enrich_items(items)
+            if multiple_callable is not None:
+                multiple_callable(items, *self.extra_args)
+                succeeded = [advreport.get_item_id(item) for item in items]
+            else:
+                for item in items:
+                    advreport.enrich_object(item, list=False, request=self.request)
+                    item_id = advreport.get_item_id(item)
+                    if advreport.find_object_action(item, method) is None:
+                        failed[item_id] = 'This action is not applicable to this item.'
+                        continue
+                    try:
+                        with transaction.atomic():
+                            advreport.get_action_callable(method)(item, *self.extra_args)
+                    except ActionException as e:
+                        failed[item_id] = six.text_type(e.msg)
+                    else:
+                        succeeded.append(item_id)
+            self.save_chunk(number, len(items), position, succeeded, failed)
+
+    def process_queryset(self, queryset_callable, queryset):
+        """
+        Executes ``FOO_queryset`` once, as the only chunk of the job.
+        """
+        if self.job.chunks.exists():
+            return
+        with transaction.atomic():
+            count = queryset_callable(queryset, *self.extra_args)
+            count = count if isinstance(count, six.integer_types) else 0
+            ActionJob.objects.filter(pk=self.job.pk).update(total=count)
+            self.save_chunk(0, count, None, [], {}, succeeded_count=count)
+
+    def save_chunk(self, number, count, position, succeeded, failed, succeeded_count=None):
+        ActionJobChunk.objects.create(job=self.job, number=number,
+                                      succeeded_ids=json.dumps(succeeded),
+                                      failed_ids=json.dumps(failed),
+                                      messages=json.dumps(self.messages.messages))
+        ActionJob.objects.filter(pk=self.job.pk).update(
+            position=json.dumps(position, cls=DjangoJSONEncoder),
+            processed=F('processed') + count,
+            succeeded=F('succeeded') + (len(succeeded) if succeeded_count is None else succeeded_count),
+            failed=F('failed') + len(failed),
+            heartbeat=timezone.now())
+
+
+def claim_job(stale_timeout=STALE_TIMEOUT):
+    """
+    Marks the oldest pending job, or a running job without a recent heartbeat, as running and returns it.
+    Returns None when there is no job to run. Concurrent workers never claim the same job.
+    """
+    now = timezone.now()
+    claimable = Q(status=ActionJob.PENDING) | Q(status=ActionJob.RUNNING,
+                                                heartbeat__lt=now - datetime.timedelta(seconds=stale_timeout))
+    for job in ActionJob.objects.filter(claimable).order_by('pk')[:10]:
+        if ActionJob.objects.filter(claimable, pk=job.pk).update(status=ActionJob.RUNNING, heartbeat=now,
+                                                                 started=job.started or now):
+            return ActionJob.objects.get(pk=job.pk)
+    return None
+
+
+def run_next_job(stale_timeout=STALE_TIMEOUT):
+    """
+    Claims and runs one job. Returns the job, or None when there was nothing to do.
+    """
+    try:
+        job = claim_job(stale_timeout)
+        if job is not None:
+            JobRunner(job).run()
+        return job
+    finally:
+        # Every thread of the worker has its own database connection.
+        connection.close()
+
+
+def _work(stop, once, poll_interval, stale_timeout, log):
+    """
+    Runs jobs one after another until ``stop`` is set, or until no jobs are left when ``once`` is True.
+    """
+    while not stop.is_set():
+        try:
+            job = run_next_job(stale_timeout)
+        except Exception:
+            log(traceback.format_exc())
+            continue
+        if job is not None:
+            log('Finished job #%d' % job.pk)
+        elif once:
+            return
+        else:
+            stop.wait(poll_interval)
+
+
+def run_worker(threads=1, once=False, poll_interval=5, stale_timeout=STALE_TIMEOUT, log=None):
+    """
+    Runs jobs in ``threads`` threads, each claiming a new job as soon as its previous one is finished.
+    When ``once`` is True, it stops when no jobs are left. ``log`` is called with a line of text for every
+    finished or crashed job.
+    """
+    log = log or (lambda line: None)
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(_work, stop, once, poll_interval, stale_timeout, log) for _ in range(threads)]
+        try:
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Don't claim new jobs, but let the threads finish the jobs they are running.
+            stop.set()
+            raise
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from advanced_reports.materialized import rebuild_materialized_reports
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the materialized rows of the reports with materialized = True.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*',
+                            help='Only rebuild the rows of the reports with these slugs.')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='The number of items that are rendered at once.')
+
+    def handle(self, *args, **options):
+        rebuild_materialized_reports(slugs=options['slugs'],
+                                     chunk_size=options['chunk_size'],
+                                     log=lambda line: self.stdout.write(u'%s\n' % line))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from advanced_reports.snapshots import run_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Takes the snapshots of the reports with a snapshot_schedule when they are due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*',
+                            help='Only take snapshots of the reports with these slugs.')
+        parser.add_argument('--force', action='store_true', default=False,
+                            help='Take the snapshots right away, even when they are not due yet.')
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Stop after taking the due snapshots once.')
+        parser.add_argument('--poll-interval', type=float, default=60,
+                            help='The number of seconds to wait between looking for due snapshots.')
+
+    def handle(self, *args, **options):
+        run_snapshots(slugs=options['slugs'],
+                      force=options['force'],
+                      once=options['once'],
+                      poll_interval=options['poll_interval'],
+                      log=lambda line: self.stdout.write(u'%s\n' % line))
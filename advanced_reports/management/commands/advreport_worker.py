@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from advanced_reports.jobs import STALE_TIMEOUT, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs the multiple actions that were queued as background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=1,
+                            help='The number of jobs that are run at the same time.')
+        parser.add_argument('--once', action='store_true', default=False,
+                            help='Stop when there are no more jobs to run.')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='The number of seconds to wait between looking for new jobs.')
+        parser.add_argument('--stale-timeout', type=int, default=STALE_TIMEOUT,
+                            help='The number of seconds after which a running job of a crashed worker is resumed.')
+
+    def handle(self, *args, **options):
+        run_worker(threads=options['threads'],
+                   once=options['once'],
+                   poll_interval=options['poll_interval'],
+                   stale_timeout=options['stale_timeout'],
+                   log=lambda line: self.stdout.write(u'%s\n' % line))
@@ -0,0 +1,317 @@
+from __future__ import unicode_literals
+
+import datetime
+import json
+import time
+from decimal import Decimal
+from functools import reduce
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Model, Q
+from django.db.models.signals import post_delete, post_save
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.utils import timezone
+from django.utils.html import strip_tags
+from django.utils.safestring import mark_safe
+
+import six
+
+from advanced_reports.models import SORT_KEY_COUNT, ReportRow
+from advanced_reports.snapshots import get_snapshot_request
+from advanced_reports.utils import _get_ordering_value, iter_chunks
+
+
+#: The GET parameters that can be served from the materialized rows of a report. Anything else, like a filter
+#: or a date range, is served by the live query.
+MATERIALIZED_PARAMETERS = ('page', 'row_limit', 'q', 'exact', 'order', 'fresh')
+
+#: The materialized reports whose rows depend on a model: ``{model: [(report_class, get_items), ...]}``.
+#: ``get_items`` is None for the model of the report itself.
+_dependants = {}
+
+
+def _encode_number(value):
+    value = Decimal(value)
+    if not value.is_finite():
+        return ''
+    digits = format(abs(value), '031.10f')
+    if value < 0:
+        # Negative numbers sort before zero, the larger their magnitude the earlier.
+        return '0' + ''.join(c if c == '.' else '%d' % (9 - int(c)) for c in digits)
+    return '1' + digits
+
+
+def encode_sort_key(value):
+    """
+    Encodes ``value`` as a string that sorts like the value among the values of the same type. Numbers are
+    written with a fixed number of digits, dates and times in ISO format and texts in lower case.
+    None sorts first.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, Model):
+        value = value.pk
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, six.integer_types + (float, Decimal)):
+        return _encode_number(value)
+    if isinstance(value, datetime.datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value, timezone.utc)
+        return value.isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return six.text_type(value).lower()[:255]
+
+
+def _get_value(advreport, lookup, item):
+    """
+    The value of ``lookup`` for an item: the raw value of query fields, the rendered text of other fields.
+    """
+    if lookup == 'pk' or advreport.is_query_field(lookup.split('__')[0]):
+        return _get_ordering_value(item, lookup)
+    return strip_tags(advreport.get_item_html(lookup, item)).replace('&nbsp;', ' ')
+
+
+def get_sort_lookups(sortable_field):
+    """
+    The lookups of an entry of ``sortable_fields`` like ``'-created'`` or ``'name,pk'``, or None when
+    it can't be sorted on as a single key because it mixes directions.
+    """
+    lookups = sortable_field.strip('-').split(',')
+    if any(lookup.startswith('-') for lookup in lookups):
+        return None
+    return lookups
+
+
+def get_sort_key_column(advreport, order_by):
+    """
+    The column of ``ReportRow`` holding the sort keys of the ``order`` parameter ``order_by``, or None when
+    the rows can't be sorted that way. Only the first ``SORT_KEY_COUNT`` sortable fields have sort keys.
+    """
+    name = order_by.strip('-')
+    for index, sortable_field in enumerate(advreport.sortable_fields[:SORT_KEY_COUNT]):
+        if sortable_field.strip('-') == name:
+            if get_sort_lookups(sortable_field) is None:
+                return None
+            return '%ssort_key_%d' % ('-' if order_by.startswith('-') else '', index)
+    return None
+
+
+def get_sort_key(advreport, item, sortable_field):
+    lookups = get_sort_lookups(sortable_field)
+    if lookups is None:
+        return ''
+    # The separator sorts before any printable character, so the keys sort like tuples.
+    return '\x1f'.join(encode_sort_key(_get_value(advreport, lookup, item)) for lookup in lookups)[:255]
+
+
+def get_search_text(advreport, item):
+    """
+    The texts of the ``search_fields`` of an item in lower case, each on its own line, with a newline at both ends
+    so that exact matches can be searched for as ``'\\n%s\\n'``.
+    """
+    values = (_get_value(advreport, search_field.lstrip('^=@'), item) for search_field in advreport.search_fields)
+    texts = ('' if value is None else six.text_type(value) for value in values)
+    return '\n%s\n' % '\n'.join(' '.join(text.split()).lower() for text in texts)
+
+
+def get_row_data(advreport, item):
+    """
+    The fields of the ``ReportRow`` of an enriched item.
+    """
+    data = {
+        'values': json.dumps(list(advreport.get_column_values(item)), cls=DjangoJSONEncoder),
+        'search_text': get_search_text(advreport, item),
+    }
+    sortable_fields = list(advreport.sortable_fields[:SORT_KEY_COUNT])
+    sortable_fields += [''] * (SORT_KEY_COUNT - len(sortable_fields))
+    for index, sortable_field in enumerate(sortable_fields):
+        data['sort_key_%d' % index] = get_sort_key(advreport, item, sortable_field) if sortable_field else ''
+    return data
+
+
+def refresh_rows(advreport, item_ids):
+    """
+    Renders the rows of the given items again. The rows of items that no longer exist are deleted.
+    """
+    item_ids = [six.text_type(item_id) for item_id in item_ids]
+    if not item_ids:
+        return
+    advreport.set_request(get_snapshot_request())
+    items = advreport.get_items_for_ids(item_ids)
+    advreport.enrich_items(items)
+    rows = dict((advreport.get_item_id(item), get_row_data(advreport, item)) for item in items)
+
+    with transaction.atomic():
+        rows_queryset = ReportRow.objects.filter(report_slug=advreport.slug)
+        existing = dict(rows_queryset.filter(item_id__in=item_ids).values_list('item_id', 'pk'))
+        rows_queryset.filter(pk__in=[pk for item_id, pk in existing.items() if item_id not in rows]).delete()
+        now = timezone.now()
+        new_rows = []
+        for item_id, data in rows.items():
+            if item_id in existing:
+                ReportRow.objects.filter(pk=existing[item_id]).update(updated=now, **data)
+            else:
+                new_rows.append(ReportRow(report_slug=advreport.slug, item_id=item_id, **data))
+        ReportRow.objects.bulk_create(new_rows)
+
+
+def delete_rows(advreport, item_ids):
+    ReportRow.objects.filter(report_slug=advreport.slug,
+                             item_id__in=[six.text_type(item_id) for item_id in item_ids]).delete()
+
+
+def rebuild_rows(advreport, chunk_size=None):
+    """
+    Replaces all the rows of ``advreport`` in one transaction, rendering its items in chunks of ``chunk_size``.
+    Returns the number of rows.
+    """
+    advreport.set_request(get_snapshot_request())
+    count = 0
+    with transaction.atomic():
+        ReportRow.objects.filter(report_slug=advreport.slug).delete()
+        for chunk in advreport.objects().chunks(chunk_size):
+            ReportRow.objects.bulk_create([ReportRow(report_slug=advreport.slug,
+                                                     item_id=advreport.get_item_id(item),
+                                                     **get_row_data(advreport, item))
+                                           for item in chunk])
+            count += len(chunk)
+    return count
+
+
+def rebuild_materialized_reports(slugs=None, chunk_size=None, log=None):
+    """
+    Rebuilds the rows of every registered report with ``materialized = True``. ``slugs`` limits the reports.
+    """
+    from advanced_reports import REGISTRY, get_report_for_slug
+
+    log = log or (lambda line: None)
+    for slug in sorted(REGISTRY.keys()):
+        if slugs and slug not in slugs:
+            continue
+        advreport = get_report_for_slug(slug)
+        if not advreport.materialized:
+            continue
+        started = time.time()
+        count = rebuild_rows(advreport, chunk_size)
+        log('Rebuilt the rows of %s: %d items in %.1f seconds' % (slug, count, time.time() - started))
+
+
+def _get_query(queryset):
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return sql, tuple(params)
+
+
+def queryset_depends_on_request(advreport):
+    """
+    True when the ``queryset()`` of ``advreport`` for its request differs from the one its rows are rendered for,
+    e.g. because it only has the items of the user. Such requests can't be served from the rows.
+    """
+    report = type(advreport)()
+    report.set_request(get_snapshot_request())
+    try:
+        rendered_query = _get_query(report.queryset())
+    except (TypeError, ValueError):
+        # The queryset needs a user.
+        return True
+    return rendered_query != _get_query(advreport.queryset())
+
+
+def get_materialized_rows(advreport, request):
+    """
+    Returns the searched and sorted queryset of the ``ReportRow``s of ``advreport`` for ``request``, or None when
+    the request has other parameters than ``MATERIALIZED_PARAMETERS`` or an ordering without sort keys.
+    """
+    params = request.GET
+    if any(params.get(k) and k not in MATERIALIZED_PARAMETERS for k in params.keys()):
+        return None
+
+    rows = ReportRow.objects.filter(report_slug=advreport.slug)
+
+    # Rows with the same sort key are ordered by their primary key, so that pages don't overlap.
+    order_by = params.get('order', ''.join(advreport.sortable_fields[:1]))
+    if order_by:
+        column = get_sort_key_column(advreport, order_by)
+        if column is None:
+            return None
+        rows = rows.order_by(column, 'pk')
+    else:
+        rows = rows.order_by('pk')
+
+    q = params.get('q', '').lower()
+    if q and advreport.search_fields:
+        exact = 'exact' in params
+        for part in q.split():
+            if ',' in part:
+                rows = rows.filter(reduce(lambda a, b: a | b, (Q(search_text__contains='\n%s\n' % value)
+                                                               for value in part.split(',') if value)))
+            elif exact:
+                rows = rows.filter(search_text__contains='\n%s\n' % part)
+            else:
+                rows = rows.filter(search_text__contains=part)
+    return rows
+
+
+def get_items_for_rows(advreport, rows):
+    """
+    Fetches the items of a list of rows, in the same order. Their columns are taken from the rows, see
+    ``AdvancedReport.get_column_values``. Items that no longer exist are left out.
+    """
+    values = dict((row.item_id, row.get_values()) for row in rows)
+    items = advreport.get_items_for_ids([row.item_id for row in rows])
+    for item in items:
+        advreport.assign_attr(item, 'advreport_materialized_values',
+                              [dict(value, html=mark_safe(value['html']))
+                               for value in values[advreport.get_item_id(item)]])
+    return items
+
+
+def watch_report(report_class, model, dependencies):
+    """
+    Keeps the rows of ``report_class`` up to date when an instance of ``model`` or of one of the models of
+    ``dependencies`` (see ``AdvancedReport.materialized_dependencies``) is saved or deleted.
+    """
+    watched = [(model, None)] + list(dependencies.items())
+    for watched_model, get_items in watched:
+        dependants = _dependants.setdefault(watched_model._meta.concrete_model, [])
+        if (report_class, get_items) not in dependants:
+            dependants.append((report_class, get_items))
+
+
+def _get_dependant_items(get_items, instance):
+    items = get_items(instance)
+    if items is None:
+        return []
+    if isinstance(items, (Model, dict)):
+        return [items]
+    return list(items)
+
+
+def _instance_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for report_class, get_items in _dependants.get(sender._meta.concrete_model, ()):
+        advreport = report_class()
+        items = [instance] if get_items is None else _get_dependant_items(get_items, instance)
+        for chunk in iter_chunks(items, advreport.multiple_action_chunk_size):
+            refresh_rows(advreport, [advreport.get_item_id(item) for item in chunk])
+
+
+def _instance_deleted(sender, instance, **kwargs):
+    for report_class, get_items in _dependants.get(sender._meta.concrete_model, ()):
+        advreport = report_class()
+        if get_items is None:
+            delete_rows(advreport, [advreport.get_item_id(instance)])
+        else:
+            items = _get_dependant_items(get_items, instance)
+            for chunk in iter_chunks(items, advreport.multiple_action_chunk_size):
+                refresh_rows(advreport, [advreport.get_item_id(item) for item in chunk])
+
+
+post_save.connect(_instance_saved, dispatch_uid='advreport-materialized-saved')
+post_delete.connect(_instance_deleted, dispatch_uid='advreport-materialized-deleted')
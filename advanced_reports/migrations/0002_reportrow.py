@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advanced_reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportRow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_slug', models.CharField(max_length=64)),
+                ('item_id', models.CharField(max_length=64)),
+                ('values', models.TextField()),
+                ('search_text', models.TextField(blank=True)),
+                ('sort_key_0', models.CharField(blank=True, max_length=255)),
+                ('sort_key_1', models.CharField(blank=True, max_length=255)),
+                ('sort_key_2', models.CharField(blank=True, max_length=255)),
+                ('sort_key_3', models.CharField(blank=True, max_length=255)),
+                ('sort_key_4', models.CharField(blank=True, max_length=255)),
+                ('sort_key_5', models.CharField(blank=True, max_length=255)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='reportrow',
+            unique_together=set([('report_slug', 'item_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='reportrow',
+            index_together=set([('report_slug', 'sort_key_0'), ('report_slug', 'sort_key_1'),
+                                ('report_slug', 'sort_key_2'), ('report_slug', 'sort_key_3'),
+                                ('report_slug', 'sort_key_4'), ('report_slug', 'sort_key_5')]),
+        ),
+    ]
@@ -1 +1,147 @@
-# Empty models.py required for this Django app to be recognized as a Django app.
+from __future__ import unicode_literals
+
+import json
+
+import six
+from django.conf import settings
+from django.db import models
+
+
+@six.python_2_unicode_compatible
+class ActionJob(models.Model):
+    """
+    A multiple action that is executed in the background by the ``advreport_worker`` management command.
+    See ``advanced_reports.jobs``.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    report_slug = models.CharField(max_length=64)
+    method = models.CharField(max_length=128)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, blank=True, null=True, on_delete=models.SET_NULL)
+
+    #: The urlencoded GET parameters filtering the report, when all items were selected.
+    filter_params = models.TextField(blank=True)
+    #: A JSON list of the selected item ids, when not all items were selected.
+    item_ids = models.TextField(blank=True)
+    #: The urlencoded data of the action form.
+    form_data = models.TextField(blank=True)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    #: JSON. The index in ``item_ids``, or the primary key of the last processed item of the filtered items.
+    position = models.TextField(blank=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    #: Updated after every chunk. Running jobs without a recent heartbeat are resumed by another worker.
+    heartbeat = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'action job'
+        verbose_name_plural = 'action jobs'
+
+    def __str__(self):
+        return '%s.%s #%s (%s)' % (self.report_slug, self.method, self.pk, self.status)
+
+    @property
+    def is_global(self):
+        return not self.item_ids
+
+    def get_item_ids(self):
+        return json.loads(self.item_ids) if self.item_ids else []
+
+    def get_position(self):
+        return json.loads(self.position) if self.position else None
+
+    def to_dict(self):
+        """
+        The progress of this job, as returned by the polling API.
+        """
+        chunks = list(self.chunks.all())
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'error': self.error,
+            'messages': [message for chunk in chunks for message in chunk.get_messages()],
+            'failed_items': dict(item for chunk in chunks for item in chunk.get_failed().items()),
+        }
+
+
+class ActionJobChunk(models.Model):
+    """
+    The results of one chunk of items of an ``ActionJob``. A chunk is saved in the same transaction as
+    the changes of its action, so a job can be resumed after the last saved chunk.
+    """
+    job = models.ForeignKey(ActionJob, related_name='chunks', on_delete=models.CASCADE)
+    number = models.PositiveIntegerField()
+    #: A JSON list of the ids of the items on which the action succeeded.
+    succeeded_ids = models.TextField(blank=True)
+    #: A JSON dict with the error message of every item on which the action failed.
+    failed_ids = models.TextField(blank=True)
+    #: A JSON list of the messages the action added.
+    messages = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('job', 'number')
+        unique_together = (('job', 'number'),)
+
+    def get_succeeded(self):
+        return json.loads(self.succeeded_ids) if self.succeeded_ids else []
+
+    def get_failed(self):
+        return json.loads(self.failed_ids) if self.failed_ids else {}
+
+    def get_messages(self):
+        return json.loads(self.messages) if self.messages else []
+
+
+#: The number of sort key columns of a ``ReportRow``, see ``AdvancedReport.materialized``.
+SORT_KEY_COUNT = 6
+
+
+class ReportRow(models.Model):
+    """
+    The materialized row of an item of a report with ``materialized = True``: its rendered columns, its search text
+    and its sort keys, so that listing, searching, sorting and counting the report only reads this table.
+    See ``advanced_reports.materialized``.
+    """
+    report_slug = models.CharField(max_length=64)
+    item_id = models.CharField(max_length=64)
+    #: A JSON list of the rendered columns, as returned by ``AdvancedReport.get_column_values``.
+    values = models.TextField()
+    #: The lowercased texts of the search fields, each one on its own line, with a newline at both ends.
+    search_text = models.TextField(blank=True)
+    #: The sort keys of the ``sortable_fields``, encoded so that they sort like their values.
+    sort_key_0 = models.CharField(max_length=255, blank=True)
+    sort_key_1 = models.CharField(max_length=255, blank=True)
+    sort_key_2 = models.CharField(max_length=255, blank=True)
+    sort_key_3 = models.CharField(max_length=255, blank=True)
+    sort_key_4 = models.CharField(max_length=255, blank=True)
+    sort_key_5 = models.CharField(max_length=255, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('report_slug', 'item_id'),)
+        index_together = tuple(('report_slug', 'sort_key_%d' % i) for i in range(SORT_KEY_COUNT))
+
+    def get_values(self):
+        return json.loads(self.values) if self.values else []
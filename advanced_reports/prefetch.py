@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+
+from django.db.models import Count
+
+
+class Prefetch(object):
+    """
+    Base class of the items of ``AdvancedReport.prefetch``. A prefetch attaches extra data to every
+    item of a page, chunk or action batch, using a constant number of queries per batch.
+    """
+
+    def __init__(self, attr_name):
+        self.attr_name = attr_name
+
+    def apply(self, advreport, items):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.attr_name)
+
+
+class ReverseRelation(Prefetch):
+    """
+    Attaches the instances of ``model`` whose ``field_name`` points to an item, as a list,
+    or as a single instance (or None) when ``many`` is False. See ``AdvancedReport.enrich_backward_relation``.
+
+    Example: ``ReverseRelation('todo_items', TodoItem, 'todo_list')``
+    """
+
+    def __init__(self, attr_name, model, field_name, select_related=None, many=True):
+        super(ReverseRelation, self).__init__(attr_name)
+        self.model = model
+        self.field_name = field_name
+        self.select_related = select_related
+        self.many = many
+
+    def apply(self, advreport, items):
+        advreport.enrich_backward_relation(items, self.model, self.field_name, self.attr_name,
+                                           select_related=self.select_related, many=self.many)
+
+
+class GenericReverseRelation(Prefetch):
+    """
+    Attaches the instance of ``model`` whose generic foreign key points to an item.
+    ``fallback`` is called with the item when there is no such instance. See ``AdvancedReport.enrich_generic_relation``.
+    """
+
+    def __init__(self, attr_name, model, fallback=None):
+        super(GenericReverseRelation, self).__init__(attr_name)
+        self.model = model
+        self.fallback = fallback or (lambda item: None)
+
+    def apply(self, advreport, items):
+        # The items may be ``Row``s instead of model instances, so the content type is the one of the report.
+        our_model = advreport.get_spec().models[0]
+        advreport.enrich_generic_relation(items, our_model, self.model, self.attr_name, self.fallback)
+
+
+class RelatedAggregate(Prefetch):
+    """
+    Attaches an aggregate (like ``Count('pk')`` or ``Sum('amount')``) of the instances of ``model`` whose
+    ``field_name`` points to an item. All the aggregates of a batch are computed with one grouped query.
+    Items without related instances get ``default``, which is 0 for counts.
+
+    Example: ``RelatedAggregate('open_items', TodoItem, 'todo_list', Count('pk'), filter={'done': None})``
+    """
+
+    def __init__(self, attr_name, model, field_name, aggregate, filter=None, default=None):
+        super(RelatedAggregate, self).__init__(attr_name)
+        self.model = model
+        self.field_name = field_name
+        self.aggregate = aggregate
+        self.filter = filter or {}
+        if default is None and isinstance(aggregate, Count):
+            default = 0
+        self.default = default
+
+    def apply(self, advreport, items):
+        pks = [item.pk for item in items]
+        rows = (self.model.objects
+                .filter(**self.filter)
+                .filter(**{'%s__in' % self.field_name: pks})
+                .order_by()
+                .values_list(self.field_name)
+                .annotate(prefetch_value=self.aggregate))
+        values = dict(rows)
+        for item in items:
+            advreport.assign_attr(item, self.attr_name, values.get(item.pk, self.default))
@@ -0,0 +1,144 @@
+from __future__ import unicode_literals
+
+from advanced_reports.spec import walk_lookup
+
+
+#: The attributes ``AdvancedReport.enrich_object`` assigns to every item.
+ENRICHED_ATTRIBUTES = ('advreport_request', 'advreport_column_values', 'advreport_actions',
+                       'advreport_object_id', 'advreport_class', 'advreport_extra_information')
+
+
+class Row(object):
+    """
+    A compact, read-only item of a report, holding one tuple of a ``values_list`` query.
+
+    The values can be read like the attributes of a model instance: ``row.name``,
+    ``row.todo_list.owner.email`` and ``row.get_status_display()`` all work for the fetched lookups.
+    Other attributes can be assigned as usual (e.g. by ``enrich_list``), they are kept in a dict
+    that is only created when needed.
+    """
+    __slots__ = ('_values', '_extra') + ENRICHED_ATTRIBUTES
+
+    #: The position of every lookup in the values tuple.
+    _index = {}
+    #: The lookups of the relations that are followed, like ``todo_list`` and ``todo_list__owner``, with the
+    #: positions of the values behind them.
+    _relations = {}
+    #: The choices of the lookups of fields with choices.
+    _choices = {}
+
+    def __init__(self, values):
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, '_extra', None)
+
+    def _lookup(self, name, prefix=''):
+        key = prefix + name
+        if key in self._index:
+            return self._values[self._index[key]]
+        if key in self._relations:
+            # Like a null foreign key of a model instance, a relation without any value is None.
+            if all(self._values[i] is None for i in self._relations[key]):
+                return None
+            return RelatedRow(self, key + '__')
+        if name.startswith('get_') and name.endswith('_display'):
+            field = prefix + name[4:-8]
+            if field in self._choices:
+                value = self._values[self._index[field]]
+                return lambda: self._choices[field].get(value, value)
+        if not prefix and self._extra is not None and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(name)
+
+    def __getattr__(self, name):
+        return self._lookup(name)
+
+    def __setattr__(self, name, value):
+        if name in ENRICHED_ATTRIBUTES:
+            object.__setattr__(self, name, value)
+        else:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+            self._extra[name] = value
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.pk == other.pk
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), self.pk))
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.pk)
+
+
+class RelatedRow(object):
+    """
+    The values of a ``Row`` behind a relation, so that ``row.todo_list.name`` can be looked up.
+    """
+    __slots__ = ('_row', '_prefix')
+
+    def __init__(self, row, prefix):
+        self._row = row
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        return self._row._lookup(name, self._prefix)
+
+
+_row_classes = {}
+
+
+def get_row_class(model, lookups):
+    """
+    Returns a (cached) ``Row`` subclass for the given ``model`` and the ``lookups`` in the values tuples.
+    """
+    key = (model, lookups)
+    try:
+        return _row_classes[key]
+    except KeyError:
+        pass
+
+    index = dict((lookup, i) for i, lookup in enumerate(lookups))
+    if 'pk' in index:
+        index.setdefault(model._meta.pk.name, index['pk'])
+
+    relations = {}
+    choices = {}
+    for position, lookup in enumerate(lookups):
+        parts = lookup.split('__')
+        for i in range(1, len(parts)):
+            relations.setdefault('__'.join(parts[:i]), []).append(position)
+        found, resolved = walk_lookup(model, lookup)
+        if resolved and found[-1].choices:
+            choices[lookup] = dict(found[-1].flatchoices)
+
+    row_class = _row_classes[key] = type(str('%sRow' % model.__name__), (Row,), {
+        '__slots__': (),
+        '_index': index,
+        '_relations': dict((relation, tuple(positions)) for relation, positions in relations.items()),
+        '_choices': choices,
+    })
+    return row_class
+
+
+class RowFactory(object):
+    """
+    Fetches the items of querysets of ``model`` as ``Row`` instances holding only the given ``lookups``
+    (and the primary key).
+    """
+
+    def __init__(self, model, lookups):
+        lookups = ('pk',) + tuple(l for l in lookups if l != 'pk')
+        self.lookups = tuple(sorted(set(lookups), key=lookups.index))
+        self.row_class = get_row_class(model, self.lookups)
+
+    def iterate(self, queryset):
+        row_class = self.row_class
+        for values in queryset.values_list(*self.lookups).iterator():
+            yield row_class(values)
+
+    def fetch(self, queryset):
+        row_class = self.row_class
+        return [row_class(values) for values in queryset.values_list(*self.lookups)]
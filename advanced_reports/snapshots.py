@@ -0,0 +1,317 @@
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import HttpRequest
+
+import six
+
+from advanced_reports.export import ExportJSONEncoder, compile_export_getter
+
+
+#: Marks the start and the end of a snapshot file.
+MAGIC = b'ADVSNAP1'
+
+#: The index offset, the meta offset and the number of blocks, followed by ``MAGIC``.
+_FOOTER = struct.Struct(str('<QQQ'))
+
+#: The GET parameters that can be served from a snapshot. Anything else, like a filter, a search,
+#: an ordering or ``fresh``, is served by the live query.
+SNAPSHOT_PARAMETERS = ('page', 'row_limit')
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SnapshotWriter(object):
+    """
+    Writes the rows of a snapshot to ``fileobj``. Rows are compressed in blocks of ``rows_per_block`` rows,
+    and the offsets of the blocks are written as an index, so a page can be read without decompressing
+    the whole snapshot.
+    """
+
+    def __init__(self, fileobj, rows_per_block=100):
+        self.fileobj = fileobj
+        self.rows_per_block = rows_per_block
+        self.encoder = ExportJSONEncoder(separators=(',', ':'))
+        self.offsets = [len(MAGIC)]
+        self.block = []
+        self.count = 0
+        fileobj.write(MAGIC)
+
+    def add(self, row):
+        self.block.append(row)
+        self.count += 1
+        if len(self.block) >= self.rows_per_block:
+            self._write_block()
+
+    def _write_block(self):
+        data = zlib.compress(self.encoder.encode(self.block).encode('utf-8'))
+        self.fileobj.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.block = []
+
+    def close(self, meta):
+        if self.block:
+            self._write_block()
+        meta = dict(meta, count=self.count, rows_per_block=self.rows_per_block)
+        index_offset = self.offsets[-1]
+        index = struct.pack(str('<%dQ') % len(self.offsets), *self.offsets)
+        self.fileobj.write(index)
+        self.fileobj.write(zlib.compress(self.encoder.encode(meta).encode('utf-8')))
+        self.fileobj.write(_FOOTER.pack(index_offset, index_offset + len(index), len(self.offsets) - 1))
+        self.fileobj.write(MAGIC)
+
+
+class Snapshot(object):
+    """
+    A snapshot of a report, read from ``data`` (a memory map or bytes). See ``SnapshotWriter`` for the format.
+
+    Every row is a dict with the ``item`` values of the report API and the ``export`` values of the columns.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        footer_start = len(data) - _FOOTER.size - len(MAGIC)
+        if footer_start < len(MAGIC) or data[:len(MAGIC)] != MAGIC or data[-len(MAGIC):] != MAGIC:
+            raise SnapshotError('Not a snapshot.')
+        index_offset, meta_offset, block_count = _FOOTER.unpack(data[footer_start:footer_start + _FOOTER.size])
+        self.offsets = struct.unpack(str('<%dQ') % (block_count + 1), data[index_offset:meta_offset])
+        self.meta = json.loads(zlib.decompress(data[meta_offset:footer_start]).decode('utf-8'))
+        self.rows_per_block = self.meta['rows_per_block']
+
+    def __len__(self):
+        return self.meta['count']
+
+    @property
+    def created(self):
+        """
+        The time (in seconds since the epoch) the snapshot was taken.
+        """
+        return self.meta['created']
+
+    @property
+    def fingerprint(self):
+        """
+        The fingerprint of the request the snapshot was rendered for, see ``get_snapshot_fingerprint``.
+        """
+        return self.meta.get('fingerprint')
+
+    def get_block(self, number):
+        data = self.data[self.offsets[number]:self.offsets[number + 1]]
+        return json.loads(zlib.decompress(data).decode('utf-8'))
+
+    def get_rows(self, start, stop):
+        """
+        Returns the rows from ``start`` up to ``stop``, only decompressing the blocks holding them.
+        """
+        stop = min(stop, len(self))
+        rows = []
+        if start >= stop:
+            return rows
+        first_block = start // self.rows_per_block
+        for number in range(first_block, (stop - 1) // self.rows_per_block + 1):
+            rows.extend(self.get_block(number))
+        offset = first_block * self.rows_per_block
+        return rows[start - offset:stop - offset]
+
+    def __iter__(self):
+        for number in range(len(self.offsets) - 1):
+            for row in self.get_block(number):
+                yield row
+
+    def iter_export_rows(self):
+        for row in self:
+            yield row['export']
+
+
+def get_snapshot_storage(advreport):
+    return advreport.snapshot_storage or default_storage
+
+
+def get_snapshot_name(advreport):
+    return 'advanced_reports/snapshots/%s.snapshot' % advreport.slug
+
+
+def _get_path(storage, name):
+    try:
+        return storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+_open_snapshots = {}
+
+
+def open_snapshot(advreport):
+    """
+    Returns the current ``Snapshot`` of ``advreport``, or None when there is no (valid) snapshot.
+    Snapshots in local storage are memory mapped and kept open until they are replaced. Snapshots in
+    other storages are downloaded once per modification, so the storage has to support ``modified_time``.
+    """
+    storage = get_snapshot_storage(advreport)
+    name = get_snapshot_name(advreport)
+    path = _get_path(storage, name)
+
+    if path is None:
+        try:
+            if not storage.exists(name):
+                return None
+            key = (storage.modified_time(name), storage.size(name))
+        except (NotImplementedError, OSError):
+            return None
+        cached = _open_snapshots.get((id(storage), name))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with storage.open(name, 'rb') as f:
+                snapshot = Snapshot(f.read())
+        except (OSError, SnapshotError):
+            return None
+        _open_snapshots[id(storage), name] = (key, snapshot)
+        return snapshot
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (stat.st_mtime, stat.st_size, stat.st_ino)
+    cached = _open_snapshots.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        with open(path, 'rb') as f:
+            snapshot = Snapshot(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError, SnapshotError):
+        # Also when the file can't be read, e.g. because it was written by another user.
+        return None
+    _open_snapshots[path] = (key, snapshot)
+    return snapshot
+
+
+def save_snapshot(storage, name, fileobj):
+    """
+    Stores a snapshot. In local storage the previous snapshot is replaced atomically.
+    """
+    path = _get_path(storage, name)
+    if path is None:
+        if storage.exists(name):
+            storage.delete(name)
+        storage.save(name, File(fileobj))
+        return
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        for data in iter(lambda: fileobj.read(64 * 1024), b''):
+            f.write(data)
+    # The temporary file is only readable by its owner, while the web server may run as another user.
+    os.chmod(f.name, getattr(storage, 'file_permissions_mode', None) or 0o644)
+    os.replace(f.name, path)
+
+
+def get_snapshot_request():
+    """
+    The request a snapshot is rendered for: without any parameters and without a user.
+    """
+    request = HttpRequest()
+    request.method = 'GET'
+    request.user = AnonymousUser()
+    return request
+
+
+def get_snapshot_fingerprint(advreport, request):
+    """
+    A digest of the ``get_cache_fingerprint`` of ``advreport`` for ``request``. A snapshot is only served to
+    requests with the same fingerprint as the request it was rendered for, so users that are allowed other
+    actions, or that see other items, get live data.
+    """
+    fingerprint = json.dumps(advreport.get_cache_fingerprint(request), default=six.text_type, sort_keys=True)
+    return hashlib.md5(fingerprint.encode('utf-8')).hexdigest()
+
+
+def take_snapshot(advreport):
+    """
+    Renders all the items of ``advreport`` (without any filters) into a new snapshot. Returns the number of items.
+    """
+    from advanced_reports.views import _api_list_data, _item_values
+
+    request = get_snapshot_request()
+    advreport.set_request(request)
+
+    # Everything of the report API except for the items.
+    report = _api_list_data(request, advreport)
+    action_dicts = dict(report['actions'])
+
+    object_list = advreport.get_object_list(request)[0]
+    getters = [compile_export_getter(advreport, field_name) for field_name in advreport.fields]
+
+    with tempfile.TemporaryFile() as fileobj:
+        writer = SnapshotWriter(fileobj, advreport.snapshot_rows_per_block)
+        for item in object_list.iterator():
+            writer.add({'item': _item_values(request, item, advreport, action_dicts),
+                        'export': [getter(item) for getter in getters]})
+
+        report.update({
+            'items': [],
+            'actions': action_dicts,
+            'item_count': writer.count,
+            'item_count_approximate': False,
+            'cursor_pagination': False,
+            'next_cursor': None,
+            'previous_cursor': None,
+        })
+        writer.close({'created': time.time(), 'fingerprint': get_snapshot_fingerprint(advreport, request),
+                      'report': report})
+        fileobj.seek(0)
+        save_snapshot(get_snapshot_storage(advreport), get_snapshot_name(advreport), fileobj)
+    return writer.count
+
+
+def snapshot_is_due(advreport):
+    snapshot = open_snapshot(advreport)
+    return snapshot is None or time.time() - snapshot.created >= advreport.snapshot_schedule
+
+
+def take_due_snapshots(slugs=None, force=False, log=None):
+    """
+    Takes a snapshot of every registered report with a ``snapshot_schedule`` whose snapshot is due,
+    or of all of them when ``force`` is True. ``slugs`` limits the reports.
+    """
+    from advanced_reports import REGISTRY, get_report_for_slug
+
+    log = log or (lambda line: None)
+    for slug in sorted(REGISTRY.keys()):
+        if slugs and slug not in slugs:
+            continue
+        advreport = get_report_for_slug(slug)
+        if not advreport.snapshot_schedule or not (force or snapshot_is_due(advreport)):
+            continue
+        started = time.time()
+        count = take_snapshot(advreport)
+        log('Took a snapshot of %s: %d items in %.1f seconds' % (slug, count, time.time() - started))
+
+
+def run_snapshots(slugs=None, force=False, once=False, poll_interval=60, log=None):
+    """
+    Takes the due snapshots every ``poll_interval`` seconds. When ``once`` is True, it stops after one round.
+    """
+    while True:
+        take_due_snapshots(slugs, force, log)
+        if once:
+            return
+        force = False
+        time.sleep(poll_interval)
@@ -0,0 +1,335 @@
+from __future__ import unicode_literals
+
+from django.contrib import admin
+from django.core.exceptions import FieldDoesNotExist
+from django.template.defaultfilters import capfirst
+
+
+def lookup_model_field(models, field_name):
+    """
+    Returns the first Django model field called ``field_name`` of the given ``models``, or None.
+    """
+    if models is None:
+        return None
+
+    for model in models:
+        try:
+            return model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            pass
+    return None
+
+
+def get_order_field(by_field):
+    """
+    Returns the name of the column that is ordered on by an ``order`` parameter like ``-owner__name,pk``.
+    """
+    return by_field.split('__')[0].split(',')[0].strip('-')
+
+
+def walk_lookup(model, lookup):
+    """
+    Follows ``lookup`` (like ``todo_list__owner__email``) through the fields of ``model`` and its related
+    models. Returns the model fields that were found, and whether the whole lookup could be resolved.
+    """
+    found = []
+    for part in lookup.split('__'):
+        if model is None:
+            return found, False
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return found, False
+        found.append(field)
+        model = field.related_model
+    return found, True
+
+
+def get_related_models(model, lookups):
+    """
+    Returns the models that are reached by following the relations of ``lookups``.
+    """
+    related = []
+    for lookup in lookups:
+        found, _ = walk_lookup(model, lookup)
+        for field in found:
+            if field.related_model is not None and field.related_model not in related:
+                related.append(field.related_model)
+    return related
+
+
+def _is_forward_relation(field):
+    return field.concrete and (field.many_to_one or field.one_to_one)
+
+
+def get_select_related(model, lookups):
+    """
+    Returns the chains of forward foreign keys (and one to one fields) that are followed by ``lookups``,
+    as arguments for ``QuerySet.select_related``. The chains of lookups that stop resolving, like
+    ``owner__get_full_name``, are included up to the last relation.
+    """
+    paths = set()
+    for lookup in lookups:
+        found, _ = walk_lookup(model, lookup)
+        depth = 0
+        while depth < len(found) and _is_forward_relation(found[depth]):
+            depth += 1
+        if depth:
+            paths.add('__'.join(lookup.split('__')[:depth]))
+    # ``a__b`` also selects ``a``.
+    return tuple(sorted(p for p in paths if not any(o.startswith(p + '__') for o in paths)))
+
+
+def get_only_fields(model, lookups):
+    """
+    Returns the arguments for ``QuerySet.only`` that load everything needed to look up the values of ``lookups``.
+    Lookups ending in a relation load all the fields of the related model, lookups that can not be resolved
+    are ignored.
+    """
+    only = set()
+    for lookup in lookups:
+        found, resolved = walk_lookup(model, lookup)
+        if not found or not all(_is_forward_relation(f) for f in found[:-1]):
+            continue
+        if not found[-1].concrete or found[-1].many_to_many:
+            continue
+        if not resolved:
+            lookup = '__'.join(lookup.split('__')[:len(found)])
+        last = found[-1]
+        if last.related_model is not None and (last.many_to_one or last.one_to_one):
+            only.update('%s__%s' % (lookup, f.name) for f in last.related_model._meta.concrete_fields)
+        elif last.related_model is None:
+            only.add(lookup)
+    return tuple(sorted(only))
+
+
+def get_value_lookups(model, lookups):
+    """
+    Returns the ``lookups`` that can be fetched with ``QuerySet.values_list``: those ending in a model field
+    following only forward relations. Lookups ending in a relation fetch its primary key.
+    """
+    value_lookups = []
+    for lookup in lookups:
+        found, resolved = walk_lookup(model, lookup)
+        if resolved and all(_is_forward_relation(f) for f in found[:-1]) \
+                and found[-1].concrete and not found[-1].many_to_many:
+            value_lookups.append(lookup)
+    return tuple(value_lookups)
+
+
+def make_value_getter(field_name):
+    """
+    Compiles a function that looks up the value of ``field_name`` on an item. The ``__`` lookup
+    syntax is followed attribute by attribute, and ``get_FOO_display`` is preferred for the last part.
+    """
+    path = field_name.split('__')
+    parents, last = tuple(path[:-1]), path[-1]
+    display = 'get_%s_display' % last
+
+    def get_value(item):
+        for attr in parents:
+            item = getattr(item, attr, None)
+        get_display = getattr(item, display, None)
+        if get_display is not None:
+            value = get_display()
+            if value is not None:
+                return value
+        return getattr(item, last, None)
+    return get_value
+
+
+_value_getters = {}
+
+
+def get_value_getter(field_name):
+    """
+    Returns a (cached) compiled value getter for ``field_name``. See ``make_value_getter``.
+    """
+    try:
+        return _value_getters[field_name]
+    except KeyError:
+        getter = _value_getters[field_name] = make_value_getter(field_name)
+        return getter
+
+
+class ColumnSpec(object):
+    """
+    The names of the hooks that render a column, and the compiled getter of its value.
+    """
+
+    def __init__(self, field_name):
+        self.field_name = field_name
+        self.html_hook = 'get_%s_html' % field_name
+        self.decorator_hook = 'get_%s_decorator' % field_name
+        self.class_hook = 'get_%s_class' % field_name
+        self.style_hook = 'get_%s_style' % field_name
+        self.value_getter = get_value_getter(field_name)
+
+    def __repr__(self):
+        return 'ColumnSpec(%r)' % self.field_name
+
+
+class ReportSpec(object):
+    """
+    Everything an ``AdvancedReport`` subclass infers from its class attributes, its models and its
+    model admin. A spec is built only once per report class (see ``AdvancedReport.get_spec``), so that
+    instantiating a report on every request stays cheap.
+
+    A spec must be treated as read only: it is shared between all the requests for a report.
+    """
+
+    def __init__(self, report_class):
+        self.report_class = report_class
+        self.model_admin = None
+
+        models = report_class.models
+        if not models and report_class.model:
+            models = (report_class.model,)
+        self.models = models
+
+        verbose_name = report_class.verbose_name
+        verbose_name_plural = report_class.verbose_name_plural
+        title = report_class.title
+        fields = report_class.fields
+        search_fields = report_class.search_fields
+        sortable_fields = report_class.sortable_fields
+
+        # Add defaults from the model meta
+        if models:
+            model = models[0]
+            if not verbose_name:
+                verbose_name = model._meta.verbose_name
+            if not verbose_name_plural:
+                verbose_name_plural = model._meta.verbose_name_plural
+            if not title:
+                title = capfirst(verbose_name_plural)
+
+            # Add defaults from the model admin
+            model_admin = admin.site._registry.get(model)
+
+            if model_admin:
+                self.model_admin = model_admin
+
+                if fields is None and model_admin.list_display:
+                    fields = model_admin.list_display
+
+                if search_fields is None and model_admin.search_fields:
+                    search_fields = model_admin.search_fields
+
+                if sortable_fields is None and model_admin.list_display:
+                    sortable_fields = model_admin.list_display
+
+        self.verbose_name = verbose_name
+        self.verbose_name_plural = verbose_name_plural
+        self.title = title
+
+        # Some sane defaults
+        self.fields = fields or ()
+        self.search_fields = search_fields or ()
+        self.sortable_fields = sortable_fields or ()
+
+        self.columns = tuple(ColumnSpec(field_name) for field_name in self.fields)
+
+        self.item_actions = self._collect_actions(report_class)
+        # The actions of every method, in order. A method can have an action in several groups.
+        self.action_table = {}
+        for a in self.item_actions:
+            self.action_table.setdefault(a.method, []).append(a)
+
+        self.model_field_names = frozenset(f.name for f in models[0]._meta.get_fields()) if models else frozenset()
+
+        # The relations followed by the report. Computed fields are annotations, not lookups.
+        computed_fields = report_class.computed_fields
+        model = models[0] if models else None
+        self.select_related = ()
+        self.only_fields = ()
+        self.row_fields = ()
+        self.dependent_models = tuple(models or ())
+        if model is not None:
+            self.select_related = get_select_related(model, [f for f in self.fields if f not in computed_fields])
+            self.only_fields = get_only_fields(model, [f for f in self.fields if f not in computed_fields])
+            self.row_fields = get_value_lookups(model, self.fields) + tuple(
+                f for f in self.fields if f in computed_fields)
+            related_models = get_related_models(model, [f for f in self.fields if f not in computed_fields])
+            related_models.extend(getattr(p, 'model', None) for p in report_class.prefetch)
+            for related_model in related_models:
+                if related_model is not None and related_model not in self.dependent_models:
+                    self.dependent_models += (related_model,)
+        self.model_fields = self._resolve_model_fields()
+        self.field_metadata = dict((field_name, self._static_field_metadata(field_name))
+                                   for field_name in self._known_field_names())
+
+    def _collect_actions(self, report_class):
+        """
+        Expands ``item_actions`` with the actions defined using the ``@action`` decorator.
+        """
+        from advanced_reports.defaults import AdvancedReport
+
+        item_actions = list(report_class.item_actions)
+        for method_name in dir(report_class):
+            if not hasattr(AdvancedReport, method_name):
+                method = getattr(report_class, method_name, None)
+
+                if callable(method) and hasattr(method, 'action'):
+                    item_actions.append(method.action)
+
+        item_actions.sort(key=lambda a: a.creation_counter)
+        return tuple(item_actions)
+
+    def _known_field_names(self):
+        names = set(self.fields)
+        names.update(self.report_class.filter_fields)
+        names.update(self.report_class.value_selection_filter_fields)
+        names.update(s.rsplit('__', 1)[-1] for s in self.search_fields)
+        for sf in self.sortable_fields:
+            names.update(part.strip('-') for part in sf.split(','))
+        if self.report_class.date_range:
+            names.add(self.report_class.date_range)
+        return names
+
+    def _resolve_model_fields(self):
+        resolved = {}
+        for field_name in self._known_field_names():
+            for lookup in (field_name, field_name.split('__')[0]):
+                if lookup not in resolved:
+                    resolved[lookup] = lookup_model_field(self.models, lookup)
+        for sf in self.sortable_fields:
+            lookup = get_order_field(sf)
+            if lookup not in resolved:
+                resolved[lookup] = lookup_model_field(self.models, lookup)
+        return resolved
+
+    def get_model_field(self, field_name):
+        try:
+            return self.model_fields[field_name]
+        except KeyError:
+            return lookup_model_field(self.models, field_name)
+
+    def _static_field_metadata(self, field_name):
+        """
+        The part of the field metadata that does not depend on ``get_FOO_verbose_name`` or ``get_FOO_style``.
+        """
+        model_field = self.get_model_field(field_name)
+        model_verbose_name = getattr(model_field, 'verbose_name', None)
+
+        sortable = False
+        order_by = ''
+        for sf in self.sortable_fields:
+            if get_order_field(sf) == field_name.split('__')[0]:
+                sortable = True
+                order_by = sf.strip('-')
+
+        return {'name': field_name.split('__')[0],
+                'full_name': field_name,
+                'model_verbose_name': model_verbose_name,
+                'sortable': sortable,
+                'order_by': order_by}
+
+    def get_static_field_metadata(self, field_name):
+        try:
+            return self.field_metadata[field_name]
+        except KeyError:
+            return self._static_field_metadata(field_name)
+
+    def __repr__(self):
+        return 'ReportSpec(%s)' % self.report_class.__name__
@@ -49,7 +49,7 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
         $scope.filters = {};
         for (var m in $scope.search){
             if ($scope.search.hasOwnProperty(m)){
-                if (['page', 'order'].indexOf(m) === -1)
+                if (['page', 'order', 'cursor'].indexOf(m) === -1)
                 {
                     $scope.filters[m] = $scope.search[m];
                 }
@@ -66,13 +66,14 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
 
         $scope.view.action('fetch', {}, false, qs).then(function(data){
             $scope.report = data;
+            angular.forEach($scope.report.items, $scope.resolve_actions);
             if (data.item_count == 1)
                 $scope.toggle_expand($scope.report.items[0]);
             $scope.page_count = Math.floor((data.item_count - 1) / data.items_per_page) + 1;
             $scope.selected = {};
             $scope.multiple_action_dict = {};
             angular.forEach($scope.report.multiple_action_list, function(value){
-                $scope.multiple_action_dict[value.method] = value;
+                $scope.multiple_action_dict[value.method] = $scope.resolve_action(value, 'actionform');
             });
             $scope.$broadcast('reportPageLoad', $scope.view.params.slug);
         }, function(error){
@@ -80,6 +81,24 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
         });
     };
 
+    // Forms shared by all items are rendered with this prefix, it is replaced by the id of the item.
+    $scope.shared_form_prefix = /__prefix__/g;
+
+    $scope.resolve_action = function(action, prefix, overrides){
+        var resolved = angular.extend({}, action, overrides || {});
+        if (typeof resolved.form === 'string'){
+            resolved.form = resolved.form.replace($scope.shared_form_prefix, prefix);
+        }
+        return resolved;
+    };
+
+    $scope.resolve_actions = function(item){
+        // The items reference the actions of the report by method.
+        item.actions = item.actions.map(function(method){
+            return $scope.resolve_action($scope.report.actions[method], item.item_id, item.action_overrides[method]);
+        });
+    };
+
     $scope.show_header = function(){
         return $scope.report
             && $scope.report.report_header_visible
@@ -101,6 +120,12 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
         $scope.search.page = page;
     };
 
+    $scope.change_cursor = function(cursor){
+        if (!cursor)
+            return;
+        $scope.search.cursor = cursor;
+    };
+
     $scope.has_expanded_content = function(item){
         return (item.extra_information.length > 0
             || item.actions.length > 0 && $scope.report.action_list_type != 'inline_buttons'
@@ -152,19 +177,21 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
 
     $scope.change_row_limit = function(){
         $scope.search.row_limit = $scope.row_limit;
+        delete $scope.search.cursor;
         $scope.search.page = 1;
     };
 
     $scope.change_order = function(order_by) {
         var ascending = $scope.report.extra.order_by != order_by || !$scope.report.extra.ascending;
         $scope.search.order = (ascending ? '' : '-') + order_by;
+        delete $scope.search.cursor;
         $scope.search.page = 1;
     };
 
     $scope.has_applied_filters = function() {
         var count = 0;
         for (var key in $scope.search)
-            if (key != 'order' && key != 'page')
+            if (key != 'order' && key != 'page' && key != 'cursor')
                 count += 1;
         return count > 0 && $scope.show_search();
     };
@@ -190,6 +217,8 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
         if (!!data.item){
             // We successfully got an item back
             var new_item = data.item;
+            angular.extend($scope.report.actions, data.actions);
+            $scope.resolve_actions(new_item);
             for (var key in new_item) {
                 if (new_item.hasOwnProperty(key))
                     item[key] = new_item[key];
@@ -365,6 +394,10 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
                 $('.select2').select2();
                 $('.select2tags').select2({tags: true});
             }, 200);
+        }else if (response.job){
+            $scope.multiple_action = '';
+            $scope.action_form_popup.modal('hide');
+            $scope.poll_job(response.job);
         }else if (response.succeeded || response.failed){
             $scope.multiple_action = '';
             $scope.action_form_popup.modal('hide');
@@ -388,6 +421,22 @@ angular.module('BackOfficeApp').controller('AdvancedReportCtrl', ['$scope', '$ht
         }
     };
 
+    $scope.poll_job = function(job){
+        $scope.job = job;
+        if (job.status == 'pending' || job.status == 'running'){
+            setTimeout(function(){
+                $scope.view.action('job_status', {job: job.id}, false).then(function(data){
+                    if (data.job){
+                        $scope.poll_job(data.job);
+                    }
+                });
+            }, 2000);
+        }else{
+            $scope.multiple_failed = job.failed_items;
+            $scope.fetch_report();
+        }
+    };
+
     $scope.handle_action_error = function(error){
         $scope.action_form_popup.modal('hide');
         $scope.show_error(error);
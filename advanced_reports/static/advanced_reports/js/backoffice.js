@@ -235,6 +235,7 @@ function($scope, $http, $location, boApi, $route, $parse, $q, boReverser){
                     $scope.model = data;
                     if (!params.tab)
                         $route.current.params.tab = $scope.model.meta.tabs[0].slug;
+                    $scope.$broadcast('boModelReloaded');
                 }, function(error){
                     alert(error);
                 });
@@ -348,9 +349,10 @@ app.factory('boReverser', ['$route', 'boUtils', function($route, boUtils){
 app.directive('compile', ['$compile', function ($compile){
     return {
         link: function(scope, element, attrs){
-            scope.$watch(function(scope){
-                return scope.$eval(attrs.compile);
-            }, function(value){
+            var rendered;
+
+            var render = function(value){
+                rendered = value;
                 element.html(value);
                 $compile(element.contents())(scope);
 
@@ -359,6 +361,19 @@ app.directive('compile', ['$compile', function ($compile){
                 if (modals.length == 0){
                     angular.element('.modal-backdrop').remove();
                 }
+            };
+
+            scope.$watch(function(scope){
+                return scope.$eval(attrs.compile);
+            }, render);
+
+            // A reloaded model can have the same HTML, which the watch doesn't see, so render it again here.
+            // Changed HTML is rendered by the watch.
+            scope.$on('boModelReloaded', function(){
+                var value = scope.$eval(attrs.compile);
+                if (value === rendered){
+                    render(value);
+                }
             });
         },
         scope: true
@@ -388,8 +403,15 @@ app.directive('view', ['$compile', '$q', 'boApi', 'boUtils', '$timeout', '$parse
             var internalScope = scope.$new();
             var viewToUpdateOnPost = attrs.viewToUpdateOnPost;
 
-            var compile = function(data){
+            var digest = null;
+
+            var compile = function(data, skipUnchanged){
                 attachView(data, params);
+                if (skipUnchanged && data.digest && data.digest === digest){
+                    // The content did not change, so keep the rendered view.
+                    return;
+                }
+                digest = data.digest;
                 element.html(data.content);
                 $compile(element.contents())(internalScope);
 
@@ -401,6 +423,7 @@ app.directive('view', ['$compile', '$q', 'boApi', 'boUtils', '$timeout', '$parse
             };
 
             var showError = function(error){
+                digest = null;
                 attachView({}, params);
                 element.html(error);
             };
@@ -468,7 +491,9 @@ app.directive('view', ['$compile', '$q', 'boApi', 'boUtils', '$timeout', '$parse
             };
 
             var loadView = function(params){
-                boApi.get('view', params).then(compile, showError);
+                boApi.get('view', params).then(function(data){
+                    compile(data, true);
+                }, showError);
             };
 
             element.html('<p>Loading...</p>');
@@ -0,0 +1,173 @@
+from __future__ import unicode_literals
+
+import inspect
+import re
+
+from django.template import Variable, VariableDoesNotExist
+
+import six
+
+
+_PATH_RE = re.compile(r'^[A-Za-z_]\w*(\.\w+)*$')
+
+
+def _call(value):
+    """
+    Calls ``value`` like the template engine does when it is a callable.
+    """
+    if not callable(value) or getattr(value, 'do_not_call_in_templates', False):
+        return value
+    if getattr(value, 'alters_data', False):
+        return ''
+    try:
+        return value()
+    except TypeError:
+        try:
+            inspect.signature(value).bind()
+        except (TypeError, ValueError):
+            # Arguments were required.
+            return ''
+        raise
+
+
+def _lookup(value, bit):
+    """
+    Looks up ``bit`` in ``value`` in the same order as ``django.template.Variable``: a dictionary lookup,
+    an attribute lookup and a list-index lookup. The dictionary lookup is skipped for objects that
+    don't support it, like model instances.
+    """
+    if hasattr(type(value), '__getitem__'):
+        try:
+            return value[bit]
+        except (TypeError, AttributeError, KeyError, ValueError, IndexError):
+            pass
+    try:
+        return getattr(value, bit)
+    except (TypeError, AttributeError):
+        pass
+    try:
+        return value[int(bit)]
+    except (IndexError, ValueError, KeyError, TypeError):
+        raise VariableDoesNotExist('Failed lookup for key [%s] in %r' % (bit, value))
+
+
+class _Accessor(object):
+    """
+    Resolves a key like ``item.owner.email`` against an item. The first bit is looked up in the attributes
+    of the item, ``item`` is the item itself.
+    """
+
+    def __init__(self, key):
+        self.first, _, rest = key.partition('.')
+        self.bits = tuple(rest.split('.')) if rest else ()
+
+    def __call__(self, item):
+        attributes = getattr(item, '__dict__', {})
+        if self.first in attributes:
+            value = attributes[self.first]
+        elif self.first == 'item':
+            value = item
+        else:
+            raise VariableDoesNotExist('Failed lookup for key [%s]' % self.first)
+        value = _call(value)
+        for bit in self.bits:
+            value = _call(_lookup(value, bit))
+        return value
+
+
+class _VariableAccessor(object):
+    """
+    Resolves keys that aren't attribute paths (like literals) with ``django.template.Variable``.
+    """
+
+    def __init__(self, key):
+        self.variable = Variable(key)
+
+    def __call__(self, item):
+        context = {'item': item}
+        context.update(getattr(item, '__dict__', {}))
+        return self.variable.resolve(context)
+
+
+class _Mapping(object):
+    def __init__(self, compiled, item):
+        self.compiled = compiled
+        self.item = item
+
+    def __getitem__(self, key):
+        return self.compiled.get_accessor(key)(self.item)
+
+
+class CompiledText(object):
+    """
+    A text of an action, like ``'Delete %(item.name)s?'``, formatted with the keys resolved against an item.
+    This gives the same result as ``text % Resolver(context)`` with ``item`` and the attributes of the item
+    in the context, but every key is parsed only once.
+
+    When a version of the item is given, the formatted text is cached per item and version.
+    """
+    #: The maximum number of formatted texts that are cached.
+    max_cache_size = 1000
+
+    def __init__(self, text):
+        self.text = text
+        self.accessors = {}
+        self.cache = {}
+
+    def get_accessor(self, key):
+        try:
+            return self.accessors[key]
+        except KeyError:
+            pass
+        accessor = _Accessor(key) if _PATH_RE.match(key) else _VariableAccessor(key)
+        self.accessors[key] = accessor
+        return accessor
+
+    def format(self, item, version=None):
+        if '%' not in self.text:
+            return self.text
+        pk = getattr(item, 'pk', None)
+        if version is None or pk is None:
+            return self.text % _Mapping(self, item)
+
+        key = (type(item), pk, version)
+        try:
+            return self.cache[key]
+        except KeyError:
+            pass
+        if len(self.cache) >= self.max_cache_size:
+            self.cache.clear()
+        text = self.cache[key] = self.text % _Mapping(self, item)
+        return text
+
+
+_compiled_texts = {}
+#: The maximum number of compiled texts that are cached.
+MAX_COMPILED_TEXTS = 1000
+
+
+def compile_text(text):
+    """
+    Returns the (cached) ``CompiledText`` of ``text``.
+    """
+    try:
+        return _compiled_texts[text]
+    except KeyError:
+        pass
+    if len(_compiled_texts) >= MAX_COMPILED_TEXTS:
+        _compiled_texts.clear()
+    compiled = _compiled_texts[text] = CompiledText(text)
+    return compiled
+
+
+def format_text(text, item, version=None):
+    """
+    Formats an action text like ``confirm`` with the given item. See ``CompiledText``.
+    """
+    if not text:
+        return text
+    # Lazy translations are compiled per language.
+    text = six.text_type(text)
+    if '%' not in text:
+        return text
+    return compile_text(text).format(item, version)
@@ -14,6 +14,7 @@ urlpatterns = patterns('',
     url(r'^(?P<slug>[^/]+)/ajax/(?P<method>[^/]+)/(?P<object_id>[^/]+)/(?P<param>[^/]+)/$', ajax, name='advanced_reports_ajax'),
     
     url(r'^(?P<slug>[^/]+)/count/$', count, name='advanced_reports_count'),
+    url(r'^(?P<slug>[^/]+)/export/(?P<format>[^/]+)/$', export, name='advanced_reports_export'),
 
     url(r'^api/(?P<slug>[^/]+)/$', api_list, name='advanced_reports_api_list'),
     url(r'^api/(?P<slug>[^/]+)/action/(?P<method>[^/]+)/(?P<object_id>[^/]+)/$', api_action, name='advanced_reports_api_action'),
@@ -1,8 +1,305 @@
 from __future__ import unicode_literals
 
-from django.core.paginator import Paginator
+import base64
+import datetime
+import itertools
+import json
+import uuid
+from decimal import Decimal, InvalidOperation
 
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Model, Q
+from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
 
-def paginate(request, object_list, per_page):
-    paginator = Paginator(object_list, per_page)
+import six
+
+
+def paginate(request, object_list, per_page, cursor=False):
+    """
+    Returns the requested page of ``object_list``. When ``cursor`` is True and ``object_list`` is backed
+    by a queryset, keyset pagination is used instead of offsets. See ``cursor_paginate``.
+    """
+    if cursor and isinstance(getattr(object_list, 'queryset', None), QuerySet):
+        return cursor_paginate(request, object_list, per_page)
+    paginator_class = Paginator
+    if hasattr(object_list, 'queryset') and getattr(object_list.count(), 'approximate', False):
+        paginator_class = ApproximatePaginator
+    paginator = paginator_class(object_list, per_page)
     return paginator.page(request.GET.get('page', 1))
+
+
+class ApproximatePaginator(Paginator):
+    """
+    Paginates an object list whose count is approximate (see ``ItemCount``), like a capped count. The count
+    is only shown, pages beyond it are served as long as they have items.
+    """
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = self.object_list[bottom:bottom + self.per_page]
+        if number > 1 and not len(object_list):
+            raise EmptyPage('That page contains no results')
+        return Page(object_list, number, self)
+
+
+#: The parsers of the values of a cursor that JSON has no type for, by the tag they are encoded with.
+_CURSOR_VALUE_TYPES = {
+    'datetime': parse_datetime,
+    'date': parse_date,
+    'time': parse_time,
+    'decimal': Decimal,
+    'uuid': uuid.UUID,
+}
+
+
+def _encode_cursor_value(value):
+    """
+    Tags the values JSON has no type for, so that they are decoded exactly: ``DjangoJSONEncoder`` would
+    round datetimes to milliseconds, and seeking on a rounded value repeats or skips rows.
+    """
+    if isinstance(value, datetime.datetime):
+        return {'datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'date': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'time': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'decimal': six.text_type(value)}
+    if isinstance(value, uuid.UUID):
+        return {'uuid': value.hex}
+    return value
+
+
+def _decode_cursor_value(value):
+    if not isinstance(value, dict):
+        return value
+    if len(value) != 1:
+        raise ValueError('Invalid cursor value')
+    (tag, text), = value.items()
+    if tag not in _CURSOR_VALUE_TYPES or not isinstance(text, six.string_types):
+        raise ValueError('Invalid cursor value')
+    decoded = _CURSOR_VALUE_TYPES[tag](text)
+    if decoded is None:
+        raise ValueError('Invalid cursor value')
+    return decoded
+
+
+def encode_cursor(ordering, values, backwards=False):
+    data = json.dumps({'o': ordering, 'v': [_encode_cursor_value(value) for value in values], 'b': backwards},
+                      cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Decodes a cursor created by ``encode_cursor``. Returns ``(values, backwards)``, or ``(None, False)``
+    when the cursor is invalid or was made for another ordering.
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if not isinstance(data, dict) or data.get('o') != ordering or len(data.get('v', ())) != len(ordering):
+            return None, False
+        values = [_decode_cursor_value(value) for value in data['v']]
+    except (TypeError, ValueError, UnicodeError, InvalidOperation):
+        return None, False
+    return values, bool(data.get('b'))
+
+
+def _get_ordering_value(item, key):
+    if key == 'pk':
+        return item.pk
+    value = item
+    attrs = key.split('__')
+    for attr in attrs[:-1]:
+        value = getattr(value, attr, None)
+    attr = attrs[-1]
+    if isinstance(value, Model):
+        # A foreign key is read from its column (e.g. ``owner_id``), without fetching the related object.
+        try:
+            attr = getattr(value._meta.get_field(attr), 'attname', attr)
+        except FieldDoesNotExist:
+            pass
+    value = getattr(value, attr, None)
+    if isinstance(value, Model):
+        return value.pk
+    return value
+
+
+def seek_query(ordering, values, backwards=False):
+    """
+    Builds a ``Q`` object selecting the rows coming after (or before, when ``backwards`` is True)
+    the row having the given ``values`` for the keys in ``ordering``.
+
+    For an ordering ``['a', '-b', 'pk']`` this is ``a > va OR (a = va AND b < vb) OR (a = va AND b = vb AND pk > vpk)``.
+    """
+    query = Q()
+    equal = {}
+    for key, value in zip(ordering, values):
+        descending = key.startswith('-')
+        name = key.lstrip('-')
+        lookup = 'lt' if descending != backwards else 'gt'
+        condition = dict(equal)
+        condition['%s__%s' % (name, lookup)] = value
+        query |= Q(**condition)
+        equal[name] = value
+    return query
+
+
+class CursorPage(object):
+    """
+    A page of a report paginated with keyset pagination. It supports the parts of the API of
+    ``django.core.paginator.Page`` that make sense without offsets.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __repr__(self):
+        return '<CursorPage of %d items>' % len(self.object_list)
+
+
+def cursor_paginate(request, object_list, per_page):
+    """
+    Keyset (seek) pagination of an ``EnrichedQueryset``. Instead of ``OFFSET``, the rows of the next page
+    are selected with a ``WHERE`` on the ordering of the queryset, which always ends with the primary key.
+    The position is passed around as an opaque ``cursor`` GET parameter, and the returned page has a
+    ``next_cursor`` and a ``previous_cursor`` pointing to the adjacent pages.
+
+    Seeking only works on orderings of non-nullable fields, see ``_is_seekable``. Other querysets, like
+    the ones ordered by expressions, are paginated with offsets instead.
+    """
+    queryset = object_list.queryset
+    ordering = list(queryset.query.order_by)
+    if not queryset.query.can_filter() or not _is_seekable(queryset.model, ordering):
+        return paginate(request, object_list, per_page)
+
+    values, backwards = None, False
+    if request.GET.get('cursor'):
+        values, backwards = decode_cursor(request.GET['cursor'], ordering)
+
+    if values is not None:
+        queryset = queryset.filter(seek_query(ordering, values, backwards))
+    if backwards:
+        queryset = queryset.reverse()
+
+    items = object_list._fetch(queryset[:per_page + 1])
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    next_cursor = previous_cursor = None
+    if items:
+        first = [_get_ordering_value(items[0], key.lstrip('-')) for key in ordering]
+        last = [_get_ordering_value(items[-1], key.lstrip('-')) for key in ordering]
+        if has_more or backwards:
+            next_cursor = encode_cursor(ordering, last)
+        if (has_more if backwards else values is not None):
+            previous_cursor = encode_cursor(ordering, first, backwards=True)
+
+    return CursorPage(object_list._enrich_list(items), next_cursor, previous_cursor)
+
+
+def iter_chunks(iterable, chunk_size):
+    """
+    Yields the items of ``iterable`` in lists of at most ``chunk_size`` items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_seekable(model, ordering):
+    """
+    True when ``ordering`` ends with the primary key and only contains non-nullable fields of ``model``,
+    so that ``seek_query`` never skips or repeats a row.
+
+    Ordering on a foreign key sorts on the ``Meta.ordering`` of the related model instead of on the key
+    itself, so such orderings are not seekable either.
+    """
+    if not ordering or ordering[-1].lstrip('-') not in ('pk', model._meta.pk.name):
+        return False
+    for key in ordering:
+        if not isinstance(key, six.string_types):
+            return False
+        name = key.lstrip('-')
+        if name == 'pk':
+            continue
+        current = model
+        for part in name.split('__'):
+            if current is None:
+                return False
+            try:
+                field = current._meta.get_field(part)
+            except FieldDoesNotExist:
+                return False
+            if not field.concrete or field.null:
+                return False
+            current = field.related_model
+        if current is not None and current._meta.ordering:
+            return False
+    return True
+
+
+def iter_queryset_chunks(queryset, chunk_size, fetch=list, iterate=None):
+    """
+    Yields the items of ``queryset`` in lists of at most ``chunk_size`` items, keeping only one chunk
+    in memory at a time.
+
+    When the queryset is ordered on non-nullable fields ending with the primary key (which is the case
+    for the querysets of an ``EnrichedQueryset``), every chunk is fetched with its own keyset query,
+    using ``fetch(queryset)``. Other querysets are streamed with ``iterate(queryset)``, which defaults
+    to ``QuerySet.iterator()``.
+    """
+    ordering = list(queryset.query.order_by)
+    if not queryset.query.can_filter() or not _is_seekable(queryset.model, ordering):
+        items = iterate(queryset) if iterate is not None else queryset.iterator()
+        for chunk in iter_chunks(items, chunk_size):
+            yield chunk
+        return
+
+    values = None
+    while True:
+        chunk_queryset = queryset if values is None else queryset.filter(seek_query(ordering, values))
+        chunk = fetch(chunk_queryset[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        values = [_get_ordering_value(chunk[-1], key.lstrip('-')) for key in ordering]
@@ -12,9 +12,10 @@ from django.utils.translation import ugettext as _
 
 import six
 
-from .backoffice.api_utils import JSONResponse
+from .backoffice.api_utils import JSONResponse, conditional_response, to_json
+from .caching import cached_response
 from .decorators import report_view
-from .defaults import ActionException, Resolver
+from .defaults import ActionException, BoundAction, EnrichedQueryset
 from .utils import paginate
 
 
@@ -36,6 +37,9 @@ def list(request, advreport, ids=None, internal_mode=False, report_header_visibl
 
     context = {}
 
+    if request.method == 'GET' and 'csv' in request.GET:
+        return advreport.export(request, 'csv')
+
     # Handle POST
     if request.method == 'POST':
         sorted_keys = [k for k in request.POST.keys()]
@@ -75,7 +79,7 @@ def list(request, advreport, ids=None, internal_mode=False, report_header_visibl
     context.update(extra_context)
 
     # Paginate
-    paginated = paginate(request, object_list, advreport.items_per_page)
+    paginated = paginate(request, object_list, advreport.items_per_page, cursor=advreport.cursor_pagination)
 
     # Extra context?
     context.update(advreport._extra_context(request))
@@ -174,9 +178,16 @@ def ajax(request, advreport, method, object_id, param=None):
     return HttpResponse(_('Unsupported request method.'), status=404)
 
 
+@report_view
+def export(request, advreport, format):
+    return advreport.export(request, format)
+
+
 @report_view
 def count(request, advreport):
-    return HttpResponse(six.text_type(advreport.get_item_count()))
+    return conditional_response(request, lambda: HttpResponse(six.text_type(advreport.get_item_count())),
+                                etag=advreport.get_response_etag(request, 'count'),
+                                last_modified=advreport.get_last_modified())
 
 
 @report_view
@@ -247,27 +258,63 @@ def api_form(request, advreport, method, object_id=None):
     return HttpResponse(a.render_form(request, instance, a.form))
 
 
-def _action_dict(request, o, action):
+def _action_dict(request, advreport, action):
+    """
+    The description of an action that is shared by all the items of a page. Forms that are the same for every
+    item are rendered once, forms that depend on the item are fetched with ``api_form`` when they are opened.
+    """
     d = dict(action.attrs_dict)
     if action.form:
-        if not action.prefetch_ajax_form and action.form_via_ajax:
+        if action.is_report_action or action.form_via_ajax and not action.prefetch_ajax_form or \
+                not action.has_shared_form(advreport):
             d['form'] = True
         else:
-            d['form'] = action.render_form(request, o, action.form)
-    if action.confirm and o:
-        context = {'item': o}
-        context.update(getattr(o, '__dict__', {}))
-        d['confirm'] = o and action.confirm % Resolver(context) or None
+            d['form'] = action.render_shared_form(advreport, request)
     d['is_regular_view'] = action.is_regular_view
     return d
 
 
-def _item_values(request, o, advreport):
+def _get_action_dict(request, advreport, action, action_dicts):
+    if action.method not in action_dicts:
+        action_dicts[action.method] = _action_dict(request, advreport, action)
+    return action_dicts[action.method]
+
+
+def _item_action_dict(request, advreport, o, action, action_dict):
+    """
+    The values of an action that differ from its shared description for the item ``o``.
+    """
+    d = {}
+    if action.confirm and action.confirm != action.action.confirm:
+        d['confirm'] = action.confirm
+    if action_dict.get('form') is True and (not action.form_via_ajax or action.prefetch_ajax_form):
+        # An inline or prefetched form that depends on the item.
+        d['form'] = action.render_form(request, o, action.form)
+    return d
+
+
+def _item_values(request, o, advreport, action_dicts):
+    """
+    The values of the item ``o``. Its actions are referenced by method, their descriptions are
+    added to ``action_dicts``.
+    """
+    actions = []
+    action_overrides = {}
+    for a in o.advreport_actions:
+        if not isinstance(a, BoundAction):
+            a = BoundAction(a, advreport, o)
+        action_dict = _get_action_dict(request, advreport, a.action, action_dicts)
+        actions.append(a.method)
+        d = _item_action_dict(request, advreport, o, a, action_dict)
+        if d:
+            action_overrides[a.method] = d
+
     return {
         'values': o.advreport_column_values,
         'extra_information': o.advreport_extra_information.replace('data-method="',
                                                                    'ng-bind-html-unsafe="lazydiv__%s__' % advreport.get_item_id(o)),
-        'actions': [_action_dict(request, o, a) for a in o.advreport_actions],
+        'actions': actions,
+        'action_overrides': action_overrides,
         'item_id': advreport.get_item_id(o)
     }
 
@@ -279,6 +326,43 @@ def _is_allowed_multiple_action(request, advreport, action):
 
 @report_view
 def api_list(request, advreport, ids=None):
+    snapshot = advreport.get_snapshot(request) if ids is None else None
+    if snapshot is not None:
+        return conditional_response(request, lambda: JSONResponse(_snapshot_list_data(request, snapshot)))
+
+    cache_key = advreport.get_response_cache_key(request, ids)
+    if cache_key is None:
+        return conditional_response(request, lambda: JSONResponse(_api_list_data(request, advreport, ids)))
+
+    def get_response():
+        # The serialized data is cached, so a cache hit costs no serialization either.
+        content = cached_response(cache_key, lambda: to_json(_api_list_data(request, advreport, ids)),
+                                  advreport.response_cache_timeout, advreport.response_cache_alias)
+        return HttpResponse(content, content_type='application/json;charset=UTF-8')
+
+    return conditional_response(request, get_response, etag=advreport.get_response_etag(request, ids),
+                                last_modified=advreport.get_last_modified())
+
+
+def _snapshot_list_data(request, snapshot):
+    report = dict(snapshot.meta['report'])
+    try:
+        per_page = int(request.GET.get('row_limit', report['items_per_page']))
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404
+    if per_page < 1:
+        raise Http404
+    start = max(page - 1, 0) * per_page
+    report.update({
+        'items': [row['item'] for row in snapshot.get_rows(start, start + per_page)],
+        'items_per_page': per_page,
+        'snapshot_created': snapshot.created,
+    })
+    return report
+
+
+def _api_list_data(request, advreport, ids=None):
     try:
         object_list, extra_context = advreport.get_object_list(request, ids=ids)
     except Http404 as e:
@@ -288,17 +372,30 @@ def api_list(request, advreport, ids=None):
     if 'row_limit' in request.GET:
         advreport.items_per_page = int(request.GET['row_limit'])
 
+    next_cursor = previous_cursor = None
     try:
-        paginated_object_list = paginate(request, object_list, advreport.items_per_page)[:]
+        page = paginate(request, object_list, advreport.items_per_page, cursor=advreport.cursor_pagination)
+        paginated_object_list = page[:]
+        next_cursor = getattr(page, 'next_cursor', None)
+        previous_cursor = getattr(page, 'previous_cursor', None)
     except EmptyPage:
         paginated_object_list = []
 
+    # Count only once, the paginator already did that for an EnrichedQueryset.
+    item_count = object_list.count() if isinstance(object_list, EnrichedQueryset) else len(object_list)
+
+    action_dicts = {}
     report = {
         'header': advreport.column_headers,
         'extra': extra_context,
-        'items': [_item_values(request, o, advreport) for o in paginated_object_list],
+        'items': [_item_values(request, o, advreport, action_dicts) for o in paginated_object_list],
+        'actions': action_dicts,
         'items_per_page': advreport.items_per_page,
-        'item_count': len(object_list),
+        'item_count': item_count,
+        'item_count_approximate': getattr(item_count, 'approximate', False),
+        'cursor_pagination': advreport.cursor_pagination,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
         'searchable_columns': advreport.searchable_columns,
         'show_action_bar': bool(advreport.search_fields or advreport.filter_fields),
         'search_fields': advreport.search_fields,
@@ -309,16 +406,18 @@ def api_list(request, advreport, ids=None):
         'report_header_visible': advreport.report_header_visible,
         'multiple_actions': advreport.multiple_actions,
         'multiple_action_list': [
-            _action_dict(request, None, a) \
+            _get_action_dict(request, advreport, a, action_dicts) \
             for a in advreport.item_actions \
             if _is_allowed_multiple_action(request, advreport, a)
         ],
-        'report_action_list': [_action_dict(request, None, a) \
+        'report_action_list': [_action_dict(request, advreport, a) \
                                for a in advreport.item_actions \
                                if a.is_report_action and advreport.report_action_allowed(a)],
         'compact': advreport.compact,
+        'facets': advreport.get_facets(object_list) if advreport.facets else {},
+        'tab_counts': advreport.get_tabbed_filter_counts(object_list) if advreport.facets else {},
     }
-    return JSONResponse(report)
+    return report
 
 
 def _prepare_string_response(response, a):
@@ -388,7 +487,8 @@ def api_action(request, advreport, method, object_id=None):
     # Attach the updated object (which could also be deleted, who knows) to the reply.
     if obj:
         advreport.enrich_object(obj, request=request)
-        reply.update({'item': _item_values(request, obj, advreport)})
+        action_dicts = {}
+        reply.update({'item': _item_values(request, obj, advreport, action_dicts), 'actions': action_dicts})
     elif object_id:
         reply.update({'item': None, 'removed_item_id': object_id})
 
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Compares formatting action texts with ``Resolver`` to the compiled texts of ``advanced_reports.texts``.
+
+Usage: python advreport_test_project/benchmark_texts.py
+"""
+import os
+import sys
+import timeit
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "advreport_test_project.settings")
+
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from advanced_reports.defaults import Resolver
+    from advanced_reports.texts import format_text
+
+    # One page of 100 rows with 5 actions.
+    users = [User(pk=i, username='user%d' % i, first_name='First', last_name='Last %d' % i) for i in range(100)]
+    texts = ['Delete %(username)s?', 'Deactivate %(item.get_full_name)s?', 'Edit %(item.username)s',
+             'Mail %(first_name)s %(last_name)s', 'Archive']
+    number = 20
+
+    def resolver():
+        for user in users:
+            for text in texts:
+                context = {'item': user}
+                context.update(user.__dict__)
+                text % Resolver(context)
+
+    def compiled():
+        for user in users:
+            for text in texts:
+                format_text(text, user)
+
+    def compiled_versioned():
+        for user in users:
+            for text in texts:
+                format_text(text, user, version=1)
+
+    for name, function in (('Resolver', resolver), ('compiled', compiled), ('compiled, cached', compiled_versioned)):
+        duration = timeit.timeit(function, number=number) / number
+        print('%-18s %8.2f ms per page' % (name, duration * 1000))
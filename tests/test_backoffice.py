@@ -1,12 +1,20 @@
+import sqlite3
+import unittest
+
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.http.response import Http404, HttpResponse
 from django.template.response import TemplateResponse
 from django.test import TestCase, Client
 from django.test.client import RequestFactory
+import mock
 import six
 from advanced_reports.backoffice.api_utils import ViewRequestParameters, to_json
 from advanced_reports.backoffice.base import BackOfficeBase, BackOfficeView
+from advanced_reports.backoffice.models import SearchIndex
+from advanced_reports.backoffice.search import ContainsSearchBackend, SQLiteFTS5SearchBackend, convert_to_raw_tsquery
+from advanced_reports.backoffice.contrib.views import AdvancedReportView
+from advanced_reports.defaults import AdvancedReport, action
 
 from advanced_reports.backoffice.examples.backoffice import test_backoffice
 from advanced_reports.backoffice.examples.views import SimpleView
@@ -204,3 +212,162 @@ class BackOfficeViewTestCase(TestCase):
         with self.assertRaises(NotImplementedError):
             test_backoffice.api_post_view_action(RequestWithViewParams(request_body, self.user, post=True))
 
+
+
+class DeactivateReport(AdvancedReport):
+    models = (User,)
+    item_actions = (action(method='deactivate', verbose_name='Deactivate', queryset=True),
+                    action(method='count', verbose_name='Count'))
+
+    def filter_action_queryset(self, queryset, action):
+        return queryset.exclude(is_superuser=True)
+
+    def deactivate(self, item):
+        item.is_active = False
+        item.save()
+
+    def deactivate_queryset(self, queryset):
+        return queryset.update(is_active=False)
+
+
+class QuerysetActionTestCase(TestCase):
+    def test_queryset_action(self):
+        User.objects.create_superuser('super', 'super@example.com', 'p')
+        users = [User.objects.create_user('user%d' % i, 'user%d@example.com' % i, 'p') for i in range(3)]
+        request = RequestFactory().post('/')
+        request._messages = mock.MagicMock()
+        report = DeactivateReport()
+        report.set_request(request)
+
+        queryset = User.objects.filter(username__in=['super'] + [u.username for u in users])
+        result = AdvancedReportView().queryset_action(request, report, 'deactivate', queryset)
+        self.assertEqual(result, {'succeeded': {}})
+        self.assertEqual(list(queryset.filter(is_active=True).values_list('username', flat=True)), ['super'])
+
+        # Only actions with queryset=True have a FOO_queryset, count_queryset is a method of the report.
+        self.assertIsNone(report.get_queryset_action_callable(report.find_action('count')))
+        self.assertIsNotNone(report.get_queryset_action_callable(report.find_action('deactivate')))
+
+    def test_grouped_queryset_action(self):
+        class GroupedReport(AdvancedReport):
+            models = (User,)
+            item_actions = (action(method='deactivate', verbose_name='Deactivate', queryset=True, group='active'),)
+
+            def verify_action_group(self, item, group):
+                return item.is_active
+
+            def deactivate_queryset(self, queryset):
+                return queryset.update(is_active=False)
+
+        # Without filter_action_queryset, the groups can only be verified item per item.
+        report = GroupedReport()
+        self.assertIsNone(report.get_queryset_action_callable(report.find_action('deactivate')))
+        GroupedReport.filter_action_queryset = lambda self, queryset, action: queryset.filter(is_active=True)
+        self.assertIsNotNone(report.get_queryset_action_callable(report.find_action('deactivate')))
+
+
+def has_fts5():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE fts USING fts5(text)')
+    except sqlite3.DatabaseError:
+        return False
+    return True
+
+
+class SearchBackendTestCase(TestCase):
+    def setUp(self):
+        # Other test cases leave users behind, the ones of these tests are on their own domain.
+        self.user = User.objects.create_superuser('admin', 'admin@search.example.com', 'p')
+        User.objects.create_user('jsmith', 'john@search.example.com', 'p', first_name='John', last_name='Smith')
+        User.objects.create_user('msmithers', 'mary@search.example.com', 'p', first_name='Mary', last_name='Smithers')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def search(self, backend, query, rank=False):
+        indices = SearchIndex.objects.filter(backoffice_instance=test_backoffice.name)
+        return sorted(backend.search(indices, query, rank=rank).values_list('to_index', flat=True))
+
+    def test_convert_to_raw_tsquery(self):
+        self.assertEqual(convert_to_raw_tsquery("o'brien & smi"), 'o:* & brien:* & smi:*')
+
+    def test_contains(self):
+        self.assertEqual(len(self.search(ContainsSearchBackend(), 'mith')), 2)
+        self.assertEqual(len(self.search(ContainsSearchBackend(), 'smith mary')), 0)
+
+    @unittest.skipUnless(has_fts5(), 'SQLite has no FTS5')
+    def test_sqlite_fts5(self):
+        backend = SQLiteFTS5SearchBackend()
+        self.assertEqual(len(self.search(backend, 'smi')), 2)
+        self.assertEqual(self.search(backend, 'smith mary'), ['msmithers Mary Smithers mary@search.example.com'])
+        self.assertEqual(len(self.search(backend, 'mith')), 0)
+        self.assertEqual(len(self.search(backend, 'smi', rank=True)), 2)
+
+        User.objects.filter(username='jsmith').delete()
+        self.assertEqual(len(self.search(backend, 'john')), 0)
+
+    @unittest.skipUnless(has_fts5(), 'SQLite has no FTS5')
+    def test_search_with_backend(self):
+        with mock.patch.object(test_backoffice, 'search_backend', SQLiteFTS5SearchBackend()):
+            results = test_backoffice.search(self.request, 'smith john')
+        self.assertEqual(len(results['results']), 1)
+
+    def test_serialize_search_results(self):
+        indices = list(SearchIndex.objects.filter(backoffice_instance=test_backoffice.name).order_by('-model_id'))
+        indices.insert(1, SearchIndex(backoffice_instance=test_backoffice.name, model_slug='user', model_id=999999))
+        with self.assertNumQueries(1):
+            results = test_backoffice.serialize_search_results(self.request, indices)
+        self.assertEqual([r['id'] for r in results], [i.model_id for i in indices if i.model_id != 999999])
+
+        # Every loaded instance goes through the serialize_search_result hook.
+        with mock.patch.object(test_backoffice, 'serialize_search_result', return_value={'id': 0}) as hook:
+            results = test_backoffice.serialize_search_results(self.request, indices)
+        self.assertEqual(results, [{'id': 0}] * (len(indices) - 1))
+        self.assertIsNotNone(hook.call_args[0][2])
+
+    def test_count_by_model(self):
+        indices = ContainsSearchBackend().search(SearchIndex.objects.filter(backoffice_instance=test_backoffice.name),
+                                                 'search.example.com')
+        with self.assertNumQueries(1):
+            counts = test_backoffice.count_by_model(self.request, indices)
+        self.assertEqual([(c['meta']['slug'], c['count'], c['approximate']) for c in counts], [('user', 3, False)])
+
+        with mock.patch.object(test_backoffice, 'search_count_limit', 2):
+            counts = test_backoffice.count_by_model(self.request, indices)
+        self.assertEqual([(c['count'], c['approximate']) for c in counts], [(2, True)])
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('nobody', 'nobody@example.com', 'p')
+        with mock.patch.object(test_backoffice.get_model(slug='user'), 'permission', 'auth.change_user'):
+            self.assertEqual(test_backoffice.count_by_model(request, indices), [])
+
+    def test_search_pagination(self):
+        # An index of a model the user has no permission for, before the last user.
+        SearchIndex.objects.create(backoffice_instance=test_backoffice.name, model_slug='secret', model_id=1,
+                                   to_index='search.example.com')
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user('staff', 'staff@search.example.com', 'p')
+        with mock.patch.dict(test_backoffice.slug_to_bo_model,
+                             {'secret': mock.Mock(permission='auth.change_user')}):
+            results = test_backoffice.search(request, 'search.example.com', page_size=4)
+        self.assertEqual(len(results['results']), 4)
+        self.assertEqual([(c['meta']['slug'], c['count']) for c in results['model_counts']], [('user', 4)])
+
+    def test_reindex_many(self):
+        bo_model = test_backoffice.get_model(slug='user')
+        own_users = User.objects.filter(email__endswith='@search.example.com').order_by('pk')
+        users = list(own_users)
+        # Other backoffices index the users too.
+        indices = SearchIndex.objects.filter(backoffice_instance=test_backoffice.name, model_slug='user',
+                                             model_id__in=[u.pk for u in users])
+        with self.assertNumQueries(1):
+            self.assertEqual(bo_model.reindex_many(users, test_backoffice.name), 0)
+
+        User.objects.filter(pk=users[0].pk).update(email='changed@search.example.com')
+        users = list(own_users)
+        self.assertEqual(bo_model.reindex_many(users, test_backoffice.name), 1)
+        self.assertEqual(indices.get(model_id=users[0].pk).to_index, bo_model.search_index(users[0]))
+
+        bo_model.delete_index_many(users[1:], test_backoffice.name)
+        self.assertEqual(indices.count(), 1)
+        test_backoffice.reindex_all_models()
+        self.assertEqual(indices.count(), len(users))
@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from advanced_reports.counts import ItemCount, capped_count, cached_count, get_count_cache_key
+from advanced_reports.defaults import AdvancedReport, EnrichedQueryset
+from advanced_reports.utils import paginate
+
+
+class CountedReport(AdvancedReport):
+    model = User
+    count_cache_timeout = 60
+
+
+class CountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            User.objects.create_user('count%d' % i, 'count%d@example.com' % i, 'foobar')
+
+    def test_item_count(self):
+        self.assertEqual(str(ItemCount(10)), '10')
+        self.assertEqual(str(ItemCount(10, approximate=True)), '10+')
+        self.assertEqual(ItemCount(10, approximate=True) + 1, 11)
+
+    def test_capped_count(self):
+        queryset = User.objects.filter(username__startswith='count')
+        self.assertEqual(capped_count(queryset, 10), 5)
+        self.assertFalse(capped_count(queryset, 10).approximate)
+        self.assertEqual(capped_count(queryset, 3), 3)
+        self.assertTrue(capped_count(queryset, 3).approximate)
+
+    def test_cached_count(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return 42
+
+        self.assertEqual(cached_count('test-count', compute, 60), 42)
+        self.assertEqual(cached_count('test-count', compute, 60), 42)
+        self.assertEqual(len(calls), 1)
+
+    def test_cache_key_ignores_pagination(self):
+        rf = RequestFactory()
+        self.assertEqual(get_count_cache_key('r', rf.get('/', {'q': 'a', 'page': 2})),
+                         get_count_cache_key('r', rf.get('/', {'q': 'a', 'cursor': 'x'})))
+        self.assertNotEqual(get_count_cache_key('r', rf.get('/', {'q': 'a'})),
+                            get_count_cache_key('r', rf.get('/', {'q': 'b'})))
+        self.assertNotEqual(get_count_cache_key('r', rf.get('/', {'q': 'a'}), fingerprint=[1]),
+                            get_count_cache_key('r', rf.get('/', {'q': 'a'}), fingerprint=[2]))
+
+    def test_enriched_queryset_counts_once(self):
+        request = RequestFactory().get('/', {'q': 'count'})
+        report = CountedReport()
+        object_list = EnrichedQueryset(User.objects.filter(username__startswith='count'), report, request=request)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(object_list), 5)
+            self.assertEqual(object_list.count(), 5)
+
+        object_list = EnrichedQueryset(User.objects.filter(username__startswith='count'), report, request=request)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(object_list), 5)
+
+    def test_counts_are_cached_per_user(self):
+        report = CountedReport()
+        users = User.objects.filter(username__startswith='count')
+        rf = RequestFactory()
+        request = rf.get('/')
+        request.user = users[0]
+        self.assertEqual(report.count_queryset(users.filter(pk=users[0].pk), request), 1)
+        request = rf.get('/')
+        request.user = users[1]
+        self.assertEqual(report.count_queryset(users, request), 5)
+
+    def test_pages_beyond_a_capped_count(self):
+        report = AdvancedReport()
+        report.models = (User,)
+        report.approximate_count = 'capped'
+        report.approximate_count_limit = 2
+        object_list = EnrichedQueryset(User.objects.filter(username__startswith='count'), report)
+        page = paginate(RequestFactory().get('/', {'page': 3}), object_list, 2)
+        self.assertTrue(object_list.count().approximate)
+        self.assertEqual([u.username for u in page], ['count4'])
+        with self.assertRaises(EmptyPage):
+            paginate(RequestFactory().get('/', {'page': 4}), object_list, 2)
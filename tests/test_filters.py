@@ -1,6 +1,7 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-from advanced_reports.defaults import AdvancedReport
+from advanced_reports.defaults import AdvancedReport, EnrichedQueryset
 
 
 class AdvancedReportTest(TestCase):
@@ -160,3 +161,49 @@ class AdvancedReportTest(TestCase):
                 ('female', 'img/female.png'),
                 ('male', 'img/male.png'),
             ], sorted([(k, v) for k, v in dict_iteritems[0]]))
+
+
+class FacetReport(AdvancedReport):
+    model = User
+    fields = ('username', 'is_staff')
+    filter_fields = ('is_staff',)
+    value_selection_filter_fields = ('first_name',)
+    tabbed_filter_fields = {'first_name': {'types': ['Alice', 'Bob', 'Nobody']}}
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        User.objects.create_user('facet1', 'facet1@example.com', 'foobar', first_name='Alice')
+        User.objects.create_user('facet2', 'facet2@example.com', 'foobar', first_name='Alice')
+        bob = User.objects.create_user('facet3', 'facet3@example.com', 'foobar', first_name='Bob')
+        bob.is_staff = True
+        bob.save()
+        self.report = FacetReport()
+        self.object_list = EnrichedQueryset(User.objects.filter(username__startswith='facet'), self.report)
+
+    def test_facet_values(self):
+        with self.assertNumQueries(1):
+            values = self.report.get_facet_values('first_name', self.object_list)
+        self.assertEqual(values, [('Alice', 'Alice', 2), ('Bob', 'Bob', 1)])
+
+    def test_facet_values_with_html_hook(self):
+        self.report.get_first_name_html = lambda item: '<b>%s</b>' % item.first_name.upper()
+        with self.assertNumQueries(2):
+            values = self.report.get_facet_values('first_name', self.object_list)
+        self.assertEqual(values, [('Alice', '<b>ALICE</b>', 2), ('Bob', '<b>BOB</b>', 1)])
+
+    def test_facet_values_without_queryset(self):
+        values = self.report.get_facet_values('first_name', list(self.object_list.queryset))
+        self.assertEqual(values, [('Alice', 'Alice', 2), ('Bob', 'Bob', 1)])
+
+    def test_facets(self):
+        with self.assertNumQueries(2):
+            facets = self.report.get_facets(self.object_list)
+        self.assertEqual(facets['is_staff'], [{'value': False, 'verbose_name': 'False', 'count': 2},
+                                              {'value': True, 'verbose_name': 'True', 'count': 1}])
+        self.assertEqual(len(facets['first_name']), 2)
+
+    def test_tabbed_filter_counts(self):
+        with self.assertNumQueries(1):
+            counts = self.report.get_tabbed_filter_counts(self.object_list)
+        self.assertEqual(counts, {'first_name': {'Alice': 2, 'Bob': 1, 'Nobody': 0}})
@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.client import RequestFactory
+import mock
+
+import advanced_reports
+from advanced_reports.backoffice.contrib.views import AdvancedReportView
+from advanced_reports.defaults import AdvancedReport, ActionException, action
+from advanced_reports.jobs import CRASHED_ERROR, JobRunner, claim_job, create_job
+from advanced_reports.models import ActionJob
+
+
+class JobReport(AdvancedReport):
+    models = (User,)
+    item_actions = (action(method='deactivate', verbose_name='Deactivate'),
+                    action(method='crash', verbose_name='Crash'),
+                    action(method='forbidden', verbose_name='Forbidden', permission='auth.delete_user'))
+
+    def deactivate(self, item):
+        if item.username == 'user1':
+            raise ActionException('Not this one')
+        item.is_active = False
+        item.save()
+
+    def crash(self, item):
+        raise ValueError('Secret details')
+
+
+advanced_reports.register(JobReport)
+
+
+class JobTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i, 'user%d@example.com' % i, 'p') for i in range(5)]
+        self.request = RequestFactory().post('/', {})
+        self.request.user = self.users[0]
+
+    def test_selected_items(self):
+        ids = [u.pk for u in self.users[:3]]
+        job = create_job(self.request, JobReport(), 'deactivate', item_ids=ids)
+        self.assertEqual(claim_job(), job)
+        self.assertIsNone(claim_job())
+
+        JobRunner(ActionJob.objects.get(pk=job.pk), chunk_size=2).run()
+        job = ActionJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.total, job.processed, job.succeeded, job.failed),
+                         (ActionJob.DONE, 3, 3, 2, 1))
+        self.assertEqual(job.chunks.count(), 2)
+        self.assertEqual(job.to_dict()['failed_items'], {'%d' % self.users[1].pk: 'Not this one'})
+        self.assertEqual(User.objects.filter(is_active=False).count(), 2)
+
+    def test_resume_after_last_chunk(self):
+        request = RequestFactory().get('/', {'username__in': 'user2,user3,user4'})
+        request.user = self.users[0]
+        job = create_job(request, JobReport(), 'deactivate')
+
+        # A worker that crashed after committing its first chunk.
+        runner = JobRunner(job, chunk_size=2)
+        runner.advreport.set_request(runner.request)
+        runner.extra_args = []
+        runner.process_chunk(0, [self.users[2], self.users[3]], self.users[3].pk)
+
+        JobRunner(ActionJob.objects.get(pk=job.pk), chunk_size=2).run()
+        job = ActionJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.processed, job.succeeded), (ActionJob.DONE, 3, 3))
+        self.assertEqual(list(job.chunks.values_list('number', flat=True)), [0, 1])
+        self.assertEqual(User.objects.filter(is_active=False).count(), 3)
+
+    def test_crashed_job(self):
+        job = create_job(self.request, JobReport(), 'crash', item_ids=[self.users[0].pk])
+        with self.assertRaises(ValueError):
+            JobRunner(ActionJob.objects.get(pk=job.pk)).run()
+        job = ActionJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.error), (ActionJob.FAILED, CRASHED_ERROR))
+        self.assertNotIn('Secret details', job.to_dict()['error'])
+
+    def test_actions_are_verified_before_queuing(self):
+        request = RequestFactory().post('/')
+        request.user = self.users[0]
+        request._messages = mock.MagicMock()
+        request.view_params = {'slug': 'job'}
+        view = AdvancedReportView()
+        with mock.patch.object(JobReport, 'background_actions', True):
+            for method in ('nonexisting', 'forbidden'):
+                request.action_params = {'report_method': method, 'items': '', 'global': 'true'}
+                self.assertEqual(view.multiple_action(request), {})
+                self.assertEqual(view.multiple_action_job(request), {})
+            request.action_params = {'report_method': 'deactivate', 'items': '', 'global': 'true'}
+            self.assertIn('job', view.multiple_action(request))
+        self.assertEqual(ActionJob.objects.count(), 1)
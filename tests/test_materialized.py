@@ -0,0 +1,139 @@
+import json
+
+import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+import advanced_reports
+from advanced_reports.backoffice.contrib.views import AdvancedReportView
+from advanced_reports.defaults import AdvancedReport, action
+from advanced_reports.materialized import encode_sort_key, rebuild_materialized_reports
+from advanced_reports.models import ReportRow
+from oemfoe_todos_app.models import TodoItem, TodoList
+
+
+class MaterializedReport(AdvancedReport):
+    models = (TodoList,)
+    fields = ('name', 'open_items')
+    search_fields = ('name', 'owner__username')
+    sortable_fields = ('name', 'open_items')
+    items_per_page = 2
+    materialized = True
+    materialized_dependencies = {TodoItem: lambda todo_item: todo_item.todo_list}
+    item_actions = (action(method='archive', verbose_name='Archive', queryset=True),)
+
+    def archive(self, item):
+        item.name = 'Archived'
+        item.save()
+
+    def archive_queryset(self, queryset):
+        return queryset.update(name='Archived')
+
+    def get_open_items_html(self, item):
+        return '%d open' % item.todoitem_set.filter(done=None).count()
+
+
+advanced_reports.register(MaterializedReport)
+
+
+class OwnListsReport(MaterializedReport):
+    def queryset(self):
+        return TodoList.objects.filter(owner=self.request.user)
+
+
+class MaterializedTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'p')
+        self.lists = dict((name, TodoList.objects.create(owner=self.owner, name=name))
+                          for name in ('Work', 'Groceries', 'Chores'))
+        TodoItem.objects.create(todo_list=self.lists['Work'], name='Report')
+        TodoItem.objects.create(todo_list=self.lists['Work'], name='Meeting')
+        TodoItem.objects.create(todo_list=self.lists['Groceries'], name='Milk')
+
+    def get_report(self, querystring=''):
+        response = self.client.get('/reports/api/materialized/' + querystring)
+        return json.loads(response.content)
+
+    def get_row_values(self, todo_list):
+        row = ReportRow.objects.get(report_slug='materialized', item_id=str(todo_list.pk))
+        return [value['html'] for value in row.get_values()]
+
+    def test_rows_follow_changes(self):
+        self.assertEqual(ReportRow.objects.filter(report_slug='materialized').count(), 3)
+        self.assertEqual(self.get_row_values(self.lists['Work']), ['Work', '2 open'])
+
+        item = TodoItem.objects.create(todo_list=self.lists['Chores'], name='Dishes')
+        self.assertEqual(self.get_row_values(self.lists['Chores']), ['Chores', '1 open'])
+        item.done = timezone.now()
+        item.save()
+        self.assertEqual(self.get_row_values(self.lists['Chores']), ['Chores', '0 open'])
+
+        self.lists['Work'].todoitem_set.all().delete()
+        self.assertEqual(self.get_row_values(self.lists['Work']), ['Work', '0 open'])
+
+        self.lists['Groceries'].delete()
+        self.assertEqual(ReportRow.objects.filter(report_slug='materialized').count(), 2)
+
+    def test_api(self):
+        data = self.get_report('?order=name')
+        self.assertEqual(data['item_count'], 3)
+        self.assertEqual([item['values'][0]['html'] for item in data['items']], ['Chores', 'Groceries'])
+
+        data = self.get_report('?order=-open_items&page=1')
+        self.assertEqual([item['values'][1]['html'] for item in data['items']], ['2 open', '1 open'])
+
+        data = self.get_report('?q=groc')
+        self.assertEqual([item['item_id'] for item in data['items']], [str(self.lists['Groceries'].pk)])
+        self.assertEqual(self.get_report('?q=owner&exact=1')['item_count'], 3)
+        self.assertEqual(self.get_report('?q=own&exact=1')['item_count'], 0)
+        self.assertEqual(self.get_report('?q=work,chores')['item_count'], 2)
+
+        # Filters are served by the live query.
+        self.assertEqual(self.get_report('?name=Work')['item_count'], 1)
+
+    def test_rebuild(self):
+        ReportRow.objects.filter(report_slug='materialized').delete()
+        self.assertEqual(self.get_report()['item_count'], 0)
+        lines = []
+        rebuild_materialized_reports(['materialized'], log=lines.append)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(self.get_report()['item_count'], 3)
+
+    def test_encode_sort_key(self):
+        values = [None, -10, -2.5, 0, 3, 12]
+        self.assertEqual(sorted(values[::-1], key=encode_sort_key), values)
+
+    def test_global_queryset_action(self):
+        request = RequestFactory().post('/?q=work')
+        request.user = self.owner
+        request._messages = mock.MagicMock()
+        request.view_params = {'slug': 'materialized'}
+        request.action_params = {'report_method': 'archive', 'items': '', 'global': 'true'}
+
+        # The action gets the filtered TodoLists, not their rows.
+        self.assertEqual(AdvancedReportView().multiple_action(request), {'succeeded': {}})
+        self.assertEqual(sorted(TodoList.objects.values_list('name', flat=True)), ['Archived', 'Chores', 'Groceries'])
+        self.assertEqual(ReportRow.objects.filter(report_slug='materialized').count(), 3)
+
+    def test_rows_with_equal_sort_keys(self):
+        for name in ('Work', 'Groceries'):
+            self.lists[name].name = 'Same'
+            self.lists[name].save()
+        item_ids = [item['item_id'] for page in (1, 2) for item in self.get_report('?order=name&page=%d' % page)['items']]
+        self.assertEqual(sorted(item_ids), sorted(str(todo_list.pk) for todo_list in self.lists.values()))
+
+    def test_queryset_depending_on_the_user(self):
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        report = MaterializedReport()
+        report.set_request(request)
+        self.assertTrue(report.uses_materialized_rows())
+
+        # The rows can't tell which lists belong to the user.
+        report = OwnListsReport()
+        report.set_request(request)
+        self.assertFalse(report.uses_materialized_rows())
+        self.assertIsNone(report.get_materialized_object_list(request))
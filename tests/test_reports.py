@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*
 from django import forms
 from django.contrib.auth.models import User
+from django.db.models import Count, Value
+from django.db.models.functions import Concat
 from django.test import TestCase
 from django.test.client import RequestFactory
 
-from advanced_reports.defaults import AdvancedReport, EnrichedQueryset, action
+from advanced_reports.defaults import ActionException, AdvancedReport, EnrichedQueryset, action
+from advanced_reports.prefetch import GenericReverseRelation, RelatedAggregate, ReverseRelation
+from advanced_reports.rows import Row, get_row_class
+from advanced_reports.spec import get_only_fields
+from oemfoe_todos_app.models import TodoItem, TodoList
 
 import mock
 
@@ -48,6 +54,41 @@ class TestReport1(AdvancedReport):
             item.a = form.cleaned_data['testfield']
 
 
+class ComputedReport(AdvancedReport):
+    model = User
+    fields = ('username', 'full_name')
+    search_fields = ('full_name',)
+    sortable_fields = ('full_name',)
+    computed_fields = {'full_name': Concat('first_name', Value(' '), 'last_name')}
+
+
+class RenameReport(AdvancedReport):
+    model = User
+
+    @action('Rename')
+    def rename(self, item):
+        item.first_name = 'Renamed'
+        item.save()
+        if item.username == 'rename1':
+            raise ActionException('Can not rename %s' % item.username)
+
+
+class TodoItemReport(AdvancedReport):
+    models = (TodoItem,)
+    fields = ('name', 'todo_list__name', 'todo_list__owner__email')
+    search_fields = ('name', 'todo_list__owner__get_full_name')
+    auto_select_related = True
+
+
+class TodoListReport(AdvancedReport):
+    models = (TodoList,)
+    fields = ('name',)
+    prefetch = (
+        ReverseRelation('items', TodoItem, 'todo_list'),
+        RelatedAggregate('item_count', TodoItem, 'todo_list', Count('pk')),
+    )
+
+
 class AdvancedReportTest(TestCase):
     def setUp(self):
         User.objects.create_user("test2", "test2@example.com", "foobar")
@@ -86,3 +127,214 @@ class AdvancedReportTest(TestCase):
         self.assertEqual(count, len(ids))
         for i in ids:
             self.assertEqual(report.get_item_for_id(i).a, '7')
+
+    def test_multiple_actions_savepoint_per_item(self):
+        users = [User.objects.create_user('rename%d' % i, 'rename%d@example.com' % i, 'foobar') for i in range(3)]
+        request = RequestFactory().post('/')
+        setattr(request, '_messages', mock.MagicMock())
+
+        _, count = RenameReport().handle_multiple_actions('rename', ['%d' % u.pk for u in users], request)
+        self.assertEqual(count, 2)
+        self.assertEqual(request._messages.add.call_count, 1)
+        renamed = User.objects.filter(first_name='Renamed').order_by('username').values_list('username', flat=True)
+        self.assertEqual(list(renamed), ['rename0', 'rename2'])
+
+        with self.assertRaises(ActionException):
+            RenameReport().handle_multiple_actions('rename', ['%d' % users[1].pk], request)
+
+    def test_multiple_actions_enrich_once(self):
+        report = TestReport1()
+        with mock.patch.object(report, 'enrich_list') as enrich_list:
+            report.handle_multiple_actions('multiple1', [1, 2, 3])
+        self.assertEqual(enrich_list.call_count, 1)
+
+    def test_generic_reverse_relation_model(self):
+        report = TodoItemReport()
+        prefetch = GenericReverseRelation('comment', User)
+        with mock.patch.object(report, 'enrich_generic_relation') as enrich_generic_relation:
+            # Items in lightweight row mode are not instances of the model.
+            prefetch.apply(report, [object()])
+        self.assertIs(enrich_generic_relation.call_args[0][1], TodoItem)
+
+    def test_spec_is_built_once_per_class(self):
+        spec = TestReport1.get_spec()
+        self.assertIs(spec, TestReport1().get_spec())
+        self.assertIsNot(spec, AdvancedReport.get_spec())
+        self.assertEqual([a.method for a in spec.item_actions], ['multiple1', 'multiple2'])
+        self.assertIs(TestReport1().find_action('multiple2'), spec.action_table['multiple2'][0])
+        self.assertIsNone(TestReport1().find_action('nonexisting'))
+
+    def test_find_object_action_in_group(self):
+        class GroupReport(AdvancedReport):
+            models = (User,)
+            item_actions = (action(method='close', verbose_name='Close', group='staff'),
+                            action(method='close', verbose_name='Close', group='active'))
+
+            def verify_action_group(self, item, group):
+                return group == ('staff' if item.is_staff else 'active')
+
+        report = GroupReport()
+        user = User(is_staff=False)
+        self.assertEqual(report.find_object_action(user, 'close').group, 'active')
+        self.assertEqual(report.find_action('close').group, 'staff')
+
+    def test_spec_field_metadata(self):
+        class UserSpecReport(AdvancedReport):
+            model = User
+            fields = ('username', 'email')
+            sortable_fields = ('-email',)
+
+        report = UserSpecReport()
+        self.assertIs(report.models, UserSpecReport.get_spec().models)
+        self.assertEqual(report.get_model_field('email'), User._meta.get_field('email'))
+        self.assertEqual(report.get_field_metadata('email'), {'name': 'email',
+                                                              'full_name': 'email',
+                                                              'verbose_name': 'Email address',
+                                                              'sortable': True,
+                                                              'order_by': 'email',
+                                                              'style': None})
+        self.assertFalse(report.get_field_metadata('username')['sortable'])
+
+    def test_row_renderer(self):
+        class RenderReport(AdvancedReport):
+            model = User
+            fields = ('username', 'email', 'first_name')
+
+            def get_username_html(self, item):
+                return '<b>%s</b>' % item.username
+
+            def get_email_decorator(self, item):
+                return lambda h: '<i>%s</i>' % h
+
+            def get_first_name_class(self, item):
+                return 'name'
+
+        report = RenderReport()
+        user = User.objects.get(username='test2')
+        user.first_name = '<Test>'
+
+        values = report.get_column_values(user)
+        self.assertEqual([v['html'] for v in values], ['<b>test2</b>', '<i>test2@example.com</i>', '&lt;Test&gt;'])
+        self.assertEqual([v['class'] for v in values], ['', '', 'name'])
+        self.assertIs(report.get_row_renderer(), report.get_row_renderer())
+        self.assertEqual(report.get_item_html('email', user), '<i>test2@example.com</i>')
+        self.assertEqual(report.lookup_item_value('username', user), 'test2')
+        self.assertIsNone(report.lookup_item_value('nonexisting__username', user))
+
+    def test_computed_fields(self):
+        User.objects.create_user('jdoe', 'jdoe@example.com', 'foobar', first_name='John', last_name='Doe')
+        User.objects.create_user('asmith', 'asmith@example.com', 'foobar', first_name='Alice', last_name='Smith')
+        report = ComputedReport()
+        self.assertTrue(report.is_query_field('full_name'))
+        self.assertFalse(report.is_query_field('nonexisting'))
+
+        request = RequestFactory().get('/', {'q': 'n do'})
+        report.set_request(request)
+        with mock.patch.object(report, 'enrich_list') as enrich_list:
+            items = report.get_filtered_items(report._queryset(request), request.GET, request=request)
+            self.assertEqual([u.username for u in items.queryset], ['jdoe'])
+            self.assertFalse(enrich_list.called)
+        self.assertEqual(items.queryset[0].full_name, 'John Doe')
+
+        ordered = report.get_sorted_queryset('-full_name', request=RequestFactory().get('/'))
+        self.assertEqual([u.username for u in ordered.exclude(first_name='')], ['jdoe', 'asmith'])
+
+    def test_enriched_queryset_iterator_chunks(self):
+        for i in range(4):
+            User.objects.create_user('chunk%d' % i, 'chunk%d@example.com' % i, 'foobar')
+        self.report.fields = ('username',)
+        # Other test cases leave users behind.
+        usernames = ['test2'] + ['chunk%d' % i for i in range(4)]
+        eqs = EnrichedQueryset(User.objects.filter(username__in=usernames), self.report)
+        with mock.patch.object(self.report, 'enrich_list') as enrich_list:
+            items = list(eqs.iterator(chunk_size=2))
+            self.assertEqual(enrich_list.call_count, 3)
+        self.assertEqual(len(items), 5)
+        self.assertEqual(items[0].advreport_column_values[0]['html'], 'test2')
+
+    def test_select_related(self):
+        spec = TodoItemReport.get_spec()
+        self.assertEqual(spec.select_related, ('todo_list__owner',))
+        self.assertEqual(get_only_fields(TodoItem, ['name', 'todo_list__owner__email']),
+                         ('name', 'todo_list__owner__email'))
+
+        owner = User.objects.get(username='test2')
+        todo_list = TodoList.objects.create(owner=owner, name='Groceries')
+        for name in ('Milk', 'Bread', 'Eggs'):
+            TodoItem.objects.create(todo_list=todo_list, name=name)
+
+        report = TodoItemReport()
+        with self.assertNumQueries(1):
+            rows = [report.get_column_values(item) for item in report._queryset(None)]
+        self.assertFalse(AdvancedReport.auto_select_related)
+        self.assertEqual([row[2]['html'] for row in rows], ['test2@example.com'] * 3)
+
+        report.only_fields = True
+        with self.assertNumQueries(1):
+            item = report._queryset(None).get(name='Milk')
+            self.assertEqual(item.todo_list.owner.email, 'test2@example.com')
+
+    def test_prefetch(self):
+        owner = User.objects.get(username='test2')
+        groceries = TodoList.objects.create(owner=owner, name='Groceries')
+        TodoList.objects.create(owner=owner, name='Chores')
+        for name in ('Milk', 'Bread'):
+            TodoItem.objects.create(todo_list=groceries, name=name)
+
+        report = TodoListReport()
+        with self.assertNumQueries(3):
+            items = list(EnrichedQueryset(report._queryset(None), report).iterator(chunk_size=10))
+        self.assertEqual([(l.name, l.item_count, len(l.items)) for l in items], [('Groceries', 2, 2), ('Chores', 0, 0)])
+
+    def test_lightweight_rows(self):
+        owner = User.objects.get(username='test2')
+        todo_list = TodoList.objects.create(owner=owner, name='Groceries')
+        for name in ('Milk', 'Bread', 'Eggs'):
+            TodoItem.objects.create(todo_list=todo_list, name=name)
+
+        report = TodoItemReport()
+        report.lightweight_rows = True
+        object_list = EnrichedQueryset(report._queryset(None).order_by('name'), report)
+        with self.assertNumQueries(1):
+            items = object_list[0:2]
+        self.assertTrue(all(isinstance(item, Row) for item in items))
+        self.assertEqual([item.name for item in items], ['Bread', 'Eggs'])
+        self.assertEqual(items[0].todo_list.owner.email, 'test2@example.com')
+        self.assertEqual(items[0].advreport_column_values[1]['html'], 'Groceries')
+        self.assertEqual(items[0].advreport_object_id, '%d' % items[0].pk)
+
+        report.assign_attr(items[0], 'extra', 42)
+        self.assertEqual(items[0].extra, 42)
+        self.assertRaises(AttributeError, getattr, items[0], 'done')
+
+        chunks = [[item.name for item in chunk] for chunk in object_list.chunks(2)]
+        self.assertEqual(chunks, [['Bread', 'Eggs'], ['Milk']])
+
+    def test_null_relation_row(self):
+        row_class = get_row_class(TodoItem, ('pk', 'name', 'todo_list__name', 'todo_list__owner__email'))
+        row = row_class((1, 'Milk', None, None))
+        self.assertIsNone(row.todo_list)
+        row = row_class((1, 'Milk', 'Groceries', None))
+        self.assertEqual(row.todo_list.name, 'Groceries')
+        self.assertIsNone(row.todo_list.owner)
+
+    def test_get_items_for_ids(self):
+        users = [User.objects.create_user('bulk%d' % i, 'bulk%d@example.com' % i, 'foobar') for i in range(3)]
+        ids = ['%d' % users[2].pk, '999999', '%d' % users[0].pk, '%d' % users[1].pk]
+        with self.assertNumQueries(1):
+            items = self.report.get_items_for_ids(ids)
+        self.assertEqual(items, [users[2], users[0], users[1]])
+
+        self.report.multiple_action_chunk_size = 2
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.report.get_items_for_ids(ids)), 3)
+
+        report = TestReport1()
+        self.assertEqual([item.a for item in report.get_items_for_ids([3, 1])], [3, 1])
+
+    def test_enrich_object(self):
+        self.report.fields = ('username', 'email')
+        user = User.objects.get(username='test2')
+        self.report.enrich_object(user)
+        self.assertEqual([v['html'] for v in user.advreport_column_values], ['test2', 'test2@example.com'])
+        self.assertEqual(user.advreport_object_id, '%d' % user.pk)
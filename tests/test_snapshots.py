@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+import mock
+
+import advanced_reports
+from advanced_reports.defaults import AdvancedReport, action
+from advanced_reports.snapshots import open_snapshot, snapshot_is_due, take_due_snapshots, take_snapshot
+
+
+class SnapshotReport(AdvancedReport):
+    models = (User,)
+    fields = ('username', 'email')
+    items_per_page = 2
+    snapshot_schedule = 3600
+    snapshot_rows_per_block = 2
+    item_actions = (action(method='deactivate', verbose_name='Deactivate', permission='auth.change_user'),)
+
+    def deactivate(self, item):
+        item.is_active = False
+        item.save()
+
+
+advanced_reports.register(SnapshotReport)
+
+
+class RemoteStorage(FileSystemStorage):
+    def path(self, name):
+        raise NotImplementedError
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        SnapshotReport.snapshot_storage = FileSystemStorage(location=self.location)
+        User.objects.all().delete()
+        for i in range(5):
+            User.objects.create_user('user%d' % i, 'user%d@example.com' % i, 'p')
+
+    def tearDown(self):
+        SnapshotReport.snapshot_storage = None
+        shutil.rmtree(self.location)
+
+    def get_report(self, querystring=''):
+        response = self.client.get('/reports/api/snapshot/' + querystring)
+        return json.loads(response.content)
+
+    def test_snapshot(self):
+        self.assertIsNone(open_snapshot(SnapshotReport()))
+        self.assertEqual(take_snapshot(SnapshotReport()), 5)
+        self.assertFalse(snapshot_is_due(SnapshotReport()))
+        User.objects.create_user('user5', 'user5@example.com', 'p')
+
+        data = self.get_report('?page=2')
+        self.assertIn('snapshot_created', data)
+        self.assertEqual(data['item_count'], 5)
+        self.assertEqual(len(data['items']), 2)
+        self.assertEqual(len(self.get_report('?page=3')['items']), 1)
+
+        data = self.get_report('?fresh=1')
+        self.assertNotIn('snapshot_created', data)
+        self.assertEqual(data['item_count'], 6)
+
+        response = self.client.get('/reports/snapshot/export/csv/')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], 'user0;user0@example.com')
+
+    def test_take_due_snapshots(self):
+        log = []
+        take_due_snapshots(['snapshot'], log=log.append)
+        take_due_snapshots(['snapshot'], log=log.append)
+        self.assertEqual(len(log), 1)
+        self.assertEqual(len(open_snapshot(SnapshotReport())), 5)
+
+    def test_snapshot_is_only_served_to_same_fingerprint(self):
+        take_snapshot(SnapshotReport())
+        path = SnapshotReport.snapshot_storage.path('advanced_reports/snapshots/snapshot.snapshot')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        self.assertIn('snapshot_created', self.get_report())
+
+        # A user allowed to deactivate users gets the action, so the anonymous snapshot isn't used.
+        User.objects.create_superuser('admin', 'admin@example.com', 'p')
+        self.client.login(username='admin', password='p')
+        data = self.get_report()
+        self.assertNotIn('snapshot_created', data)
+        self.assertEqual(data['items'][0]['actions'], ['deactivate'])
+
+    def test_remote_snapshot_is_downloaded_once(self):
+        SnapshotReport.snapshot_storage = RemoteStorage(location=self.location)
+        take_snapshot(SnapshotReport())
+        with mock.patch.object(SnapshotReport.snapshot_storage, 'open',
+                               wraps=SnapshotReport.snapshot_storage.open) as storage_open:
+            self.assertEqual(len(open_snapshot(SnapshotReport())), 5)
+            self.assertIs(open_snapshot(SnapshotReport()), open_snapshot(SnapshotReport()))
+        self.assertEqual(storage_open.call_count, 1)
+
+    def test_invalid_row_limit(self):
+        take_snapshot(SnapshotReport())
+        self.assertEqual(self.client.get('/reports/api/snapshot/?row_limit=0').status_code, 404)
+        self.assertEqual(self.client.get('/reports/api/snapshot/?row_limit=-2').status_code, 404)
@@ -0,0 +1,44 @@
+from django.contrib.auth.models import User
+from django.template import VariableDoesNotExist
+from django.test import TestCase
+
+from advanced_reports.defaults import Resolver
+from advanced_reports import texts
+from advanced_reports.texts import compile_text, format_text
+
+
+def resolve(text, item):
+    context = {'item': item}
+    context.update(item.__dict__)
+    return text % Resolver(context)
+
+
+class CompiledTextTest(TestCase):
+    def setUp(self):
+        self.user = User(pk=1, username='jef', first_name='Jef', last_name='Geskens', email='jef@example.com')
+
+    def test_same_as_resolver(self):
+        for text in ('Delete %(username)s?',
+                     'Mail %(item.email)s (%(item.get_full_name)s)',
+                     '%(item.username.0)s: 100%%',
+                     '%(item.pk)d',
+                     'No keys'):
+            self.assertEqual(format_text(text, self.user), resolve(text, self.user))
+
+    def test_missing_key(self):
+        with self.assertRaises(VariableDoesNotExist):
+            format_text('%(nonexisting)s', self.user)
+
+    def test_version_cache(self):
+        text = 'Delete %(first_name)s?'
+        self.assertEqual(format_text(text, self.user, version=1), 'Delete Jef?')
+        self.user.first_name = 'Jos'
+        self.assertEqual(format_text(text, self.user, version=1), 'Delete Jef?')
+        self.assertEqual(format_text(text, self.user, version=2), 'Delete Jos?')
+        self.assertEqual(format_text(text, self.user), 'Delete Jos?')
+        self.assertIs(compile_text(text), compile_text(text))
+
+    def test_compiled_texts_bounded(self):
+        for i in range(texts.MAX_COMPILED_TEXTS + 10):
+            compile_text('Delete %%(first_name)s %d?' % i)
+        self.assertLessEqual(len(texts._compiled_texts), texts.MAX_COMPILED_TEXTS)
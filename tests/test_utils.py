@@ -0,0 +1,108 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.utils import timezone
+
+from advanced_reports.defaults import AdvancedReport, EnrichedQueryset
+from advanced_reports.utils import (paginate, CursorPage, iter_queryset_chunks, encode_cursor, decode_cursor,
+                                    _get_ordering_value, _is_seekable)
+from oemfoe_todos_app.models import TodoList
+
+import mock
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        for username in ('e', 'b', 'd', 'a', 'c'):
+            User.objects.create_user(username, '%s@example.com' % username, 'foobar', first_name='X')
+        self.report = AdvancedReport()
+        self.report.models = (User,)
+
+    def _page(self, order_by, cursor=None):
+        object_list = EnrichedQueryset(User.objects.filter(first_name='X').order_by(order_by), self.report)
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        return paginate(request, object_list, 2, cursor=True)
+
+    def test_forward_and_backward(self):
+        page = self._page('username')
+        self.assertIsInstance(page, CursorPage)
+        self.assertEqual([u.username for u in page], ['a', 'b'])
+        self.assertFalse(page.has_previous())
+
+        page = self._page('username', page.next_cursor)
+        self.assertEqual([u.username for u in page], ['c', 'd'])
+        page = self._page('username', page.next_cursor)
+        self.assertEqual([u.username for u in page], ['e'])
+        self.assertFalse(page.has_next())
+
+        page = self._page('username', page.previous_cursor)
+        self.assertEqual([u.username for u in page], ['c', 'd'])
+        page = self._page('username', page.previous_cursor)
+        self.assertEqual([u.username for u in page], ['a', 'b'])
+        self.assertFalse(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_descending_order(self):
+        page = self._page('-username')
+        page = self._page('-username', page.next_cursor)
+        self.assertEqual([u.username for u in page], ['c', 'b'])
+
+    def test_cursor_of_other_ordering_is_ignored(self):
+        cursor = self._page('username').next_cursor
+        page = self._page('-username', cursor)
+        self.assertEqual([u.username for u in page], ['e', 'd'])
+
+    def test_cursor_values_are_exact(self):
+        values = [datetime.datetime(2020, 1, 1, 12, 0, 0, 123456, tzinfo=timezone.utc),
+                  datetime.date(2020, 1, 1), datetime.time(12, 0, 0, 654321), Decimal('1.10'), 'a', 3, None]
+        ordering = ['a', 'b', 'c', 'd', 'e', 'f', 'pk']
+        decoded, backwards = decode_cursor(encode_cursor(ordering, values, backwards=True), ordering)
+        self.assertEqual(decoded, values)
+        self.assertEqual([type(v) for v in decoded], [type(v) for v in values])
+        self.assertTrue(backwards)
+        self.assertEqual(decode_cursor(encode_cursor(['a', 'pk'], [{'datetime': 'x'}, 1]), ['a', 'pk']), (None, False))
+
+    def test_datetimes_within_a_millisecond(self):
+        joined = datetime.datetime(2020, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+        for i, user in enumerate(User.objects.order_by('username')):
+            user.date_joined = joined + datetime.timedelta(microseconds=i * 100)
+            user.save()
+        page = self._page('date_joined')
+        usernames = [u.username for u in page]
+        while page.has_next():
+            page = self._page('date_joined', page.next_cursor)
+            usernames += [u.username for u in page]
+        self.assertEqual(usernames, ['a', 'b', 'c', 'd', 'e'])
+
+    def test_foreign_key_ordering_value(self):
+        todo_list = TodoList.objects.create(owner=User.objects.get(username='a'), name='List')
+        todo_list = TodoList.objects.get(pk=todo_list.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_ordering_value(todo_list, 'owner'), todo_list.owner_id)
+
+    def test_foreign_key_ordering(self):
+        self.assertTrue(_is_seekable(TodoList, ['owner', 'pk']))
+        self.assertTrue(_is_seekable(TodoList, ['owner__username', 'pk']))
+        with mock.patch.object(User._meta, 'ordering', ['username']):
+            # The database sorts on the username of the owner, not on its key.
+            self.assertFalse(_is_seekable(TodoList, ['owner', 'pk']))
+            self.assertTrue(_is_seekable(TodoList, ['owner__username', 'pk']))
+
+
+class QuerysetChunksTest(TestCase):
+    def setUp(self):
+        for username in ('e', 'b', 'd', 'a', 'c'):
+            User.objects.create_user(username, '%s@example.com' % username, 'foobar', last_name='Y')
+
+    def test_keyset_chunks(self):
+        queryset = User.objects.filter(last_name='Y').order_by('-username', 'pk')
+        chunks = [[u.username for u in chunk] for chunk in iter_queryset_chunks(queryset, 2)]
+        self.assertEqual(chunks, [['e', 'd'], ['c', 'b'], ['a']])
+
+    def test_nullable_ordering_uses_iterator(self):
+        queryset = User.objects.filter(last_name='Y').order_by('last_login', 'username', 'pk')
+        chunks = [[u.username for u in chunk] for chunk in iter_queryset_chunks(queryset, 3)]
+        self.assertEqual(chunks, [['a', 'b', 'c'], ['d', 'e']])
@@ -1,18 +1,24 @@
 import json
 from django import forms
-from django.contrib.auth.models import User
+from django.apps import apps
+from django.contrib.auth.models import Group, User
 from django.http.response import HttpResponse
+from django.core.cache import cache
 from django.test import TestCase
 from django.test import client
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
+import mock
 import six
 import advanced_reports
+from advanced_reports import caching
+from advanced_reports.caching import get_generations
 from advanced_reports.backoffice.examples.reports import UserForm
 
 from advanced_reports.defaults import BootstrapReport, action, ActionException
 from advanced_reports.backoffice.shortcuts import action as bootstrap_action
 from advanced_reports.views import api_action
+from oemfoe_todos_app.models import TodoList
 
 
 class TestForm(forms.Form):
@@ -31,6 +37,7 @@ class SimpleReport(BootstrapReport):
         action(method='test2', verbose_name='Test2'),
         action(method='test3', verbose_name='Test3', group='test'),
         action(method='test4', verbose_name='Test4'),
+        action(method='comment', verbose_name='Comment', form=TestForm),
     )
 
     def get_decorator(self):
@@ -45,6 +52,9 @@ class SimpleReport(BootstrapReport):
     def test3(self, item):
         pass
 
+    def comment(self, item, form):
+        pass
+
     def test4_multiple(self, items):
         return HttpResponse('OK')
 
@@ -76,6 +86,15 @@ class SimpleReport(BootstrapReport):
 advanced_reports.register(SimpleReport)
 
 
+class CachedReport(BootstrapReport):
+    models = (User,)
+    fields = ('username',)
+    response_cache_timeout = 60
+
+
+advanced_reports.register(CachedReport)
+
+
 class ReportViewsTestCase(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -139,6 +158,19 @@ class ReportViewsTestCase(TestCase):
                          'Username;Email address;First name;Last name;Staff status\n' +
                          'test;test@example.com;Test;User;False\n')
 
+    def test_export_jsonl(self):
+        response = self.client.get('/reports/simple/export/jsonl/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('application/x-ndjson', response['Content-Type'])
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0]), {'username': 'test', 'email': 'test@example.com',
+                                                'first_name': 'Test', 'last_name': 'User', 'is_staff': False})
+
+    def test_export_unknown_format(self):
+        response = self.client.get('/reports/simple/export/pdf/')
+        self.assertEqual(response.status_code, 404)
+
     def test_api_action_simple(self):
         response = self.client.post('/reports/api/simple/action/test/%d/' % self.u.pk)
         self.assertIn('application/json', response['Content-Type'])
@@ -217,6 +249,22 @@ class ReportViewsTestCase(TestCase):
         response = api_action(request, 'simple', 'dialog', self.u.pk)
         self.assertEqual(response['dialog_content'], 'Hello I am a dialog for Test!')
 
+    def test_api_list_actions(self):
+        response = self.client.post('/reports/api/simple/')
+        data = json.loads(response.content)
+        item = [i for i in data['items'] if i['item_id'] == six.text_type(self.u.pk)][0]
+        self.assertEqual(item['actions'], ['test', 'test2', 'test4', 'comment', 'test5', 'details',
+                                           'edit', 'remove', 'dialog'])
+
+        # Shared by all items, rendered once.
+        self.assertIn('__prefix__-testfield', data['actions']['comment']['form'])
+        # Fetched with api_form when needed.
+        self.assertIs(data['actions']['details']['form'], True)
+        # Prefetched, but bound to the item.
+        self.assertIs(data['actions']['edit']['form'], True)
+        self.assertIn('%d-first_name' % self.u.pk, item['action_overrides']['edit']['form'])
+        self.assertNotIn('comment', item['action_overrides'])
+
     def test_api_list(self):
         response = self.client.post('/reports/api/simple/')
         self.assertIn('application/json', response['Content-Type'])
@@ -245,6 +293,8 @@ class ReportViewsTestCase(TestCase):
         self.assertIsInstance(data['item_count'], int)
         self.assertIsInstance(data['items_per_page'], int)
         self.assertIn('items', data)
+        item = [i for i in data['items'] if i['item_id'] == six.text_type(self.u.pk)][0]
+        self.assertEqual([v['html'] for v in item['values'][:2]], ['test', 'test@example.com'])
         self.assertEqual(data['multiple_action_list'], [{'is_regular_view': False,
                                                          'method': 'test',
                                                          'verbose_name': 'Test'},
@@ -282,4 +332,100 @@ class ReportViewsTestCase(TestCase):
         response = self.client.post('/reports/api/simple/?row_limit=' + str(row_limit))
         self.assertIn('application/json', response['Content-Type'])
         data = json.loads(response.content)
-        self.assertEqual(data['items_per_page'], row_limit)
\ No newline at end of file
+        self.assertEqual(data['items_per_page'], row_limit)
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.all().delete()
+        User.objects.create_user('cached1', 'cached1@example.com', 'p')
+
+    def get_item_ids(self, querystring=''):
+        response = self.client.post('/reports/api/cached/' + querystring)
+        return set(i['item_id'] for i in json.loads(response.content)['items'])
+
+    def ids(self, *users):
+        return set(six.text_type(u.pk) for u in users)
+
+    def test_cached_until_changed(self):
+        user1 = User.objects.get(username='cached1')
+        self.assertEqual(self.get_item_ids(), self.ids(user1))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_item_ids(), self.ids(user1))
+
+        user2 = User.objects.create_user('cached2', 'cached2@example.com', 'p')
+        self.assertEqual(self.get_item_ids(), self.ids(user1, user2))
+
+        user1.delete()
+        self.assertEqual(self.get_item_ids(), self.ids(user2))
+
+    def test_parameters(self):
+        user1 = User.objects.get(username='cached1')
+        other = User.objects.create_user('other', 'other@example.com', 'p')
+        self.assertEqual(self.get_item_ids(), self.ids(user1, other))
+        self.assertEqual(self.get_item_ids('?q=cached'), self.ids(user1))
+
+    def test_conditional_response(self):
+        response = self.client.get('/reports/api/cached/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/reports/api/cached/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        User.objects.create_user('cached2', 'cached2@example.com', 'p')
+        response = self.client.get('/reports/api/cached/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_per_user(self):
+        rf = RequestFactory()
+        request1, request2 = rf.get('/'), rf.get('/')
+        request1.user = User.objects.get(username='cached1')
+        request2.user = User.objects.create_user('cached2', 'cached2@example.com', 'p')
+        report = CachedReport()
+        self.assertNotEqual(report.get_response_cache_key(request1), report.get_response_cache_key(request2))
+        with mock.patch.object(CachedReport, 'response_cache_shared', True):
+            self.assertEqual(report.get_response_cache_key(request1), report.get_response_cache_key(request2))
+
+    def test_content_etag(self):
+        response = self.client.get('/reports/simple/count/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/reports/simple/count/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        # Only GET requests are conditional.
+        response = self.client.post('/reports/simple/count/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class CacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached1', 'cached1@example.com', 'p')
+
+    def generation(self):
+        return get_generations([User])[0]
+
+    def test_m2m_changed(self):
+        generation = self.generation()
+        self.user.groups.add(Group.objects.create(name='Cached'))
+        self.assertNotEqual(self.generation(), generation)
+
+    def test_invalidate_cache(self):
+        generation = self.generation()
+        User.objects.update(first_name='Updated')
+        self.assertEqual(self.generation(), generation)
+        CachedReport().invalidate_cache()
+        self.assertNotEqual(self.generation(), generation)
+
+    def test_reports_are_watched_when_ready(self):
+        class WatchedReport(BootstrapReport):
+            models = (TodoList,)
+            response_cache_timeout = 60
+
+        with mock.patch.dict(caching._watched_models, clear=True):
+            with mock.patch.dict(advanced_reports.REGISTRY, {'watched': WatchedReport}):
+                apps.get_app_config('advanced_reports').ready()
+            self.assertIn(TodoList, caching._watched_models)